@@ -69,10 +69,19 @@ setup(
     entry_points={
         'calmjs.registry': [
             'calmjs.scss = calmjs.sassy.registry:SCSSRegistry',
+            'calmjs.sassy.postprocessors = '
+            'calmjs.sassy.postprocess:PostProcessorRegistry',
+        ],
+        'calmjs.sassy.postprocessors': [
+            'prune = calmjs.sassy.prune:PrunePostProcessor',
         ],
         'calmjs.runtime': [
+            'sassy = calmjs.sassy:sassy_runtime',
             'scss = calmjs.sassy:libsass_runtime',
         ],
+        'calmjs.runtime.sassy': [
+            'fingerprint = calmjs.sassy:fingerprint_runtime',
+        ],
         'distutils.setup_keywords': [
             'calmjs_scss_module_registry = calmjs.dist:validate_line_list',
             'extras_calmjs_scss = calmjs.dist:validate_json_field',
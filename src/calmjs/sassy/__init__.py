@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 from calmjs.sassy.cli import libsass_toolchain
+from calmjs.sassy.runtime import FingerprintRuntime
 from calmjs.sassy.runtime import LibsassRuntime
+from calmjs.sassy.runtime import SassyRuntime
 
 libsass_runtime = LibsassRuntime(libsass_toolchain)
+sassy_runtime = SassyRuntime()
+fingerprint_runtime = FingerprintRuntime()
@@ -1,10 +1,389 @@
 # -*- coding: utf-8 -*-
 """
 CalmJS css artifact generation helpers
+
+The builders provided here share the resolved values and the build
+directory between them for the same set of packages, such that a
+package that declared multiple builders for the different output styles
+will only have its sources resolved and compiled into the build
+directory once, with all the declared output styles produced from that
+by the builder that got executed first, through the same compilation
+as the libsass toolchain (i.e. with the sandbox, the fragments and the
+recording of the imports for the depfile, if enabled).  The declared
+output styles with artifacts that are already up-to-date are skipped.
+
+The output styles are only compiled in parallel when the compilation
+is sandboxed, as libsass holds the GIL for the duration of a
+compilation within this process, while the spec (with its importers
+and the toolchain) cannot be sent to a process pool.
+
+A record with the digest of the inputs is kept for every artifact
+produced (within the cache directory, or the temporary directory if one
+is not specified), such that the compilation may be skipped if the
+existing artifact is still up-to-date.
 """
 
+import atexit
+import logging
+import os
+import shutil
+import threading
+from multiprocessing.pool import ThreadPool
+from os.path import exists
+from os.path import join
+from os.path import realpath
+from tempfile import mkdtemp
+from tempfile import mkstemp
+
+from calmjs.artifact import ARTIFACT_REGISTRY_NAME
+from calmjs.registry import get
+from calmjs.toolchain import BUILD_DIR
+from calmjs.toolchain import CLEANUP
+from calmjs.toolchain import EXPORT_MODULE_NAMES
+from calmjs.toolchain import EXPORT_TARGET
+
+from calmjs.sassy.assets import CALMJS_SASSY_ASSET_URLS
 from calmjs.sassy.cli import create_spec
 from calmjs.sassy.cli import libsass_toolchain
+from calmjs.sassy.cli import resolve_spec_values
+from calmjs.sassy.depfile import CALMJS_SASSY_DEPFILE
+from calmjs.sassy.depfile import CALMJS_SASSY_IMPORTED_PATHS
+from calmjs.sassy.depfile import write_depfile
+from calmjs.sassy.digest import is_artifact_fresh
+from calmjs.sassy.digest import spec_input_digest
+from calmjs.sassy.digest import write_artifact_record
+from calmjs.sassy.libsass import LIBSASS_OUTPUT_STYLE
+from calmjs.sassy.libsass import LIBSASS_OUTPUT_STYLE_DEFAULT
+from calmjs.sassy.libsass import LibsassToolchain
+from calmjs.sassy.output import iter_text_chunks
+from calmjs.sassy.sandbox import CALMJS_SASSY_SANDBOX
+from calmjs.sassy.toolchain import CALMJS_SASSY_CACHE_DIR
+from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINT_SOURCEFILE
+from calmjs.sassy.toolchain import CALMJS_SASSY_EXPORT_DIGEST
+
+logger = logging.getLogger(__name__)
+
+# spec key for the SharedArtifactBuild instance.
+CALMJS_SASSY_SHARED_BUILD = 'calmjs_sassy_shared_build'
+# spec key for the digest of the inputs for the artifact.
+CALMJS_SASSY_INPUT_DIGEST = 'calmjs_sassy_input_digest'
+# spec key for the location of the copy of an up-to-date artifact, as
+# the export target will be removed before the toolchain is executed.
+CALMJS_SASSY_FRESH_ARTIFACT = 'calmjs_sassy_fresh_artifact'
+
+# the output style produced by each of the builders provided here.
+ARTIFACT_BUILDER_STYLES = {
+    'complete_css': LIBSASS_OUTPUT_STYLE_DEFAULT,
+    'complete_compressed_css': 'compressed',
+}
+
+# the keys produced by the compile and assemble steps, to be applied
+# onto the specs that will make use of the materialised build directory.
+_MATERIALISED_KEYS = (
+    'transpiled_modpaths',
+    'transpiled_targetpaths',
+    'bundled_modpaths',
+    'bundled_targetpaths',
+    EXPORT_MODULE_NAMES,
+    CALMJS_SASSY_ASSET_URLS,
+    CALMJS_SASSY_ENTRY_POINT_SOURCEFILE,
+)
+
+# the shared builds that are currently active, keyed by the tuple of
+# package names.
+_shared_builds = {}
+# guards the active shared builds.
+_shared_builds_lock = threading.RLock()
+
+
+def _remove(path):
+    if exists(path):
+        os.unlink(path)
+
+
+def declared_artifact_targets(package_names):
+    """
+    Return the list of 2-tuples of the output style and the export
+    target for the builders provided by this module that have been
+    declared by the provided packages through the artifact registry.
+    """
+
+    registry = get(ARTIFACT_REGISTRY_NAME)
+    if registry is None:
+        return []
+    targets = []
+    for package_name in package_names:
+        for entry_point, export_target in registry.iter_export_targets_for(
+                package_name):
+            if entry_point.module_name != __name__:
+                continue
+            style = ARTIFACT_BUILDER_STYLES.get('.'.join(entry_point.attrs))
+            if style:
+                targets.append((style, export_target))
+    return targets
+
+
+def declared_artifact_styles(package_names):
+    """
+    Return the list of output styles produced by the builders provided
+    by this module that have been declared by the provided packages
+    through the artifact registry.
+    """
+
+    styles = []
+    for style, export_target in declared_artifact_targets(package_names):
+        if style not in styles:
+            styles.append(style)
+    return styles
+
+
+class SharedArtifactBuild(object):
+    """
+    The resolved values and the build directory shared by the specs
+    produced for a given set of packages, along with the compiled
+    results for each of the output styles that have yet to be written.
+    """
+
+    def __init__(
+            self, package_names, styles, toolchain=libsass_toolchain,
+            targets=()):
+        self.package_names = list(package_names)
+        self.styles = list(styles)
+        # the export targets for the styles, if known.
+        self.targets = {}
+        for style, export_target in targets:
+            self.targets.setdefault(style, []).append(export_target)
+        self.values = resolve_spec_values(
+            self.package_names,
+            working_dir=toolchain.join_cwd(),
+            filename_suffix=toolchain.filename_suffix,
+        )
+        self.tempdir = realpath(mkdtemp())
+        self.build_dir = join(self.tempdir, 'build')
+        os.mkdir(self.build_dir)
+        self.materialised = None
+        self.outputs = {}
+        # the paths imported by libsass while producing the outputs.
+        self.imported_paths = None
+        self.released = set()
+        # held for the duration of a toolchain run using this build.
+        self.lock = threading.RLock()
+
+    def request(self, style, export_target=None):
+        if style not in self.styles:
+            self.styles.append(style)
+        if export_target is not None and export_target not in (
+                self.targets.setdefault(style, [])):
+            self.targets[style].append(export_target)
+
+    def is_fresh(self, spec, style):
+        """
+        Return True if all the known export targets for the output
+        style are up-to-date with the inputs of the spec.
+        """
+
+        targets = self.targets.get(style)
+        if not targets:
+            return False
+        digest = spec_input_digest(spec, style)
+        return all(
+            is_artifact_fresh(
+                export_target, digest, spec.get(CALMJS_SASSY_CACHE_DIR))
+            for export_target in targets
+        )
+
+    def release(self, style):
+        """
+        Mark the output style as done; the build directory will be
+        removed once all the requested styles are released.
+        """
+
+        with _shared_builds_lock:
+            self.released.add(style)
+            self.outputs.pop(style, None)
+            if self.released.issuperset(self.styles):
+                self.cleanup()
+
+    def cleanup(self):
+        key = tuple(self.package_names)
+        with _shared_builds_lock:
+            if _shared_builds.get(key) is self:
+                _shared_builds.pop(key)
+            if exists(self.tempdir):
+                shutil.rmtree(self.tempdir)
+                logger.debug(
+                    "removed shared build directory '%s'", self.build_dir)
+
+
+def _cleanup_shared_builds():
+    for shared in list(_shared_builds.values()):
+        shared.cleanup()
+
+
+atexit.register(_cleanup_shared_builds)
+
+
+def get_shared_build(package_names, style, export_target=None):
+    """
+    Return the SharedArtifactBuild for the package names, creating a
+    new one if none is active, or if the active one have already
+    produced the requested style.
+    """
+
+    key = tuple(package_names)
+    with _shared_builds_lock:
+        shared = _shared_builds.get(key)
+        if shared is None or style in shared.released:
+            if shared is not None:
+                shared.cleanup()
+            targets = declared_artifact_targets(package_names)
+            shared = _shared_builds[key] = SharedArtifactBuild(
+                package_names, declared_artifact_styles(package_names),
+                targets=targets)
+        shared.request(style, export_target)
+    return shared
+
+
+class SharedLibsassToolchain(LibsassToolchain):
+    """
+    The libsass toolchain that will make use of the shared build
+    specified in the spec, if available.
+    """
+
+    def calf(self, spec):
+        shared = spec.get(CALMJS_SASSY_SHARED_BUILD)
+        if shared is None:
+            return super(SharedLibsassToolchain, self).calf(spec)
+        # the runs that share the build directory must be done one at a
+        # time, as the first one will materialise it for the others.
+        with shared.lock:
+            return super(SharedLibsassToolchain, self).calf(spec)
+
+    def compile(self, spec):
+        if spec.get(CALMJS_SASSY_FRESH_ARTIFACT):
+            return
+        shared = spec.get(CALMJS_SASSY_SHARED_BUILD)
+        if shared is None or shared.materialised is None:
+            return super(SharedLibsassToolchain, self).compile(spec)
+        logger.debug(
+            "reusing the shared build directory at '%s'", spec[BUILD_DIR])
+        spec.update(shared.materialised)
+
+    def assemble(self, spec):
+        if spec.get(CALMJS_SASSY_FRESH_ARTIFACT):
+            return
+        shared = spec.get(CALMJS_SASSY_SHARED_BUILD)
+        if shared is not None and shared.materialised is not None:
+            return
+        super(SharedLibsassToolchain, self).assemble(spec)
+        if shared is not None:
+            shared.materialised = {
+                key: spec[key] for key in _MATERIALISED_KEYS if key in spec}
+
+    def link(self, spec):
+        if spec.get(CALMJS_SASSY_FRESH_ARTIFACT):
+            shutil.copy(spec[CALMJS_SASSY_FRESH_ARTIFACT], spec[EXPORT_TARGET])
+            logger.info(
+                "artifact '%s' is up-to-date; skipped compilation",
+                spec[EXPORT_TARGET])
+            return
+
+        shared = spec.get(CALMJS_SASSY_SHARED_BUILD)
+        if shared is None:
+            super(SharedLibsassToolchain, self).link(spec)
+        else:
+            style = spec.get(
+                LIBSASS_OUTPUT_STYLE, LIBSASS_OUTPUT_STYLE_DEFAULT)
+            if style in shared.outputs:
+                # the imports are the same for every output style.
+                spec[CALMJS_SASSY_IMPORTED_PATHS] = shared.imported_paths
+            else:
+                shared.outputs.update(self.compile_styles(spec, [style] + [
+                    s for s in shared.styles
+                    if s != style and s not in shared.released and
+                    not shared.is_fresh(spec, s)
+                ]))
+                shared.imported_paths = spec.get(CALMJS_SASSY_IMPORTED_PATHS)
+
+            self.write_export(spec, iter_text_chunks(shared.outputs[style]))
+            if spec.get(CALMJS_SASSY_DEPFILE):
+                write_depfile(spec)
+
+        if spec.get(CALMJS_SASSY_INPUT_DIGEST):
+            write_artifact_record(
+                spec[EXPORT_TARGET], spec[CALMJS_SASSY_INPUT_DIGEST],
+                target_digest=spec.get(CALMJS_SASSY_EXPORT_DIGEST),
+                record_dir=spec.get(CALMJS_SASSY_CACHE_DIR))
+
+    def compile_styles(self, spec, styles):
+        """
+        Compile the css for the export target of the spec in each of
+        the provided output styles, in the same way as the libsass
+        toolchain would for the spec.  Return a mapping of the output
+        style to the compiled css.
+
+        The output styles are compiled in parallel if the spec specified
+        the sandbox, as the compilations are then done by the separate
+        worker processes; otherwise they are compiled one at a time, as
+        libsass holds the GIL.
+        """
+
+        def compile_export(style):
+            return self.compile_export(spec, style)
+
+        if len(styles) < 2 or not spec.get(CALMJS_SASSY_SANDBOX):
+            logger.info(
+                "compiling the shared build for the output styles %r",
+                styles)
+            results = [compile_export(style) for style in styles]
+        else:
+            logger.info(
+                "compiling the shared build for the output styles %r in "
+                "parallel", styles)
+            pool = ThreadPool(len(styles))
+            try:
+                results = pool.map(compile_export, styles)
+            finally:
+                pool.close()
+                pool.join()
+        return dict(zip(styles, results))
+
+
+shared_libsass_toolchain = SharedLibsassToolchain()
+
+
+def shared_css(package_names, export_target, style):
+    """
+    Return the shared libsass toolchain with the spec that will make
+    use of the shared build for the package names to produce the css
+    in the specified style.
+    """
+
+    shared = get_shared_build(package_names, style, export_target)
+    spec = create_spec(
+        package_names, export_target,
+        build_dir=shared.build_dir,
+        resolved_values=shared.values,
+        libsass_output_style=style,
+        toolchain=shared_libsass_toolchain,
+    )
+    spec[CALMJS_SASSY_SHARED_BUILD] = shared
+    spec.advise(CLEANUP, shared.release, style)
+
+    digest = spec[CALMJS_SASSY_INPUT_DIGEST] = spec_input_digest(spec, style)
+    if is_artifact_fresh(
+            export_target, digest, spec.get(CALMJS_SASSY_CACHE_DIR)):
+        # keep a copy, as the artifact registry will remove the export
+        # target before the toolchain is executed.
+        fd, stash = mkstemp(suffix='.css', prefix='calmjs_sassy')
+        os.close(fd)
+        shutil.copy(export_target, stash)
+        spec[CALMJS_SASSY_FRESH_ARTIFACT] = stash
+        spec.advise(CLEANUP, _remove, stash)
+        logger.debug(
+            "artifact '%s' is up-to-date with input digest '%s'",
+            export_target, digest)
+    return shared_libsass_toolchain, spec
 
 
 def complete_css(package_names, export_target):
@@ -14,7 +393,8 @@ def complete_css(package_names, export_target):
     the export_target.
     """
 
-    return libsass_toolchain, create_spec(package_names, export_target)
+    return shared_css(
+        package_names, export_target, ARTIFACT_BUILDER_STYLES['complete_css'])
 
 
 def complete_compressed_css(package_names, export_target):
@@ -23,8 +403,6 @@ def complete_compressed_css(package_names, export_target):
     output is compressed.
     """
 
-    return libsass_toolchain, create_spec(
+    return shared_css(
         package_names, export_target,
-        libsass_output_style='compressed',
-        toolchain=libsass_toolchain,
-    )
+        ARTIFACT_BUILDER_STYLES['complete_compressed_css'])
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Handling of the assets referenced through ``url()`` by the sources.
+
+As the sources are compiled from their copies within the build
+directory into a single output, the relative urls within them can no
+longer be resolved.  To address this, the relative urls are replaced
+by tokens during the transpile step, with the original location of the
+referenced file recorded in the spec.  Once compiled, the tokens in the
+output are replaced with the urls to the copies of the assets placed
+next to the export target, named after the digest of their contents.
+Optionally, the assets under a size threshold may be inlined as data
+uris instead.
+"""
+
+from __future__ import unicode_literals
+
+import base64
+import codecs
+import logging
+import mimetypes
+import re
+import shutil
+from multiprocessing.pool import ThreadPool
+from os.path import basename
+from os.path import dirname
+from os.path import exists
+from os.path import getsize
+from os.path import join
+from os.path import normpath
+from os.path import splitext
+
+from calmjs.toolchain import EXPORT_TARGET
+
+from calmjs.sassy.digest import file_digest
+from calmjs.sassy.digest import get_digest_store
+from calmjs.sassy.output import FileSink
+from calmjs.sassy.output import ensure_dir
+from calmjs.sassy.postprocess import TextPostProcessor
+from calmjs.sassy.toolchain import CALMJS_SASSY_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# spec key for enabling the rewriting of the asset urls, with the
+# assets copied next to the export target.
+CALMJS_SASSY_COPY_ASSETS = 'calmjs_sassy_copy_assets'
+# spec key for the size in bytes under which the assets will be inlined
+# as data uris.
+CALMJS_SASSY_INLINE_ASSETS_THRESHOLD = 'calmjs_sassy_inline_assets_threshold'
+# spec key for the mapping of the asset tokens to the path of the asset.
+CALMJS_SASSY_ASSET_URLS = 'calmjs_sassy_asset_urls'
+
+ASSET_TOKEN_PREFIX = 'calmjs-sassy-asset:'
+# the maximum number of threads used for copying the assets.
+ASSET_COPY_THREADS = 8
+# the subdirectory within the cache directory for the encoded assets.
+ASSET_CACHE_SUBDIR = 'assets'
+# the media types for the common assets that may not be known.
+ASSET_MEDIA_TYPES = {
+    '.eot': 'application/vnd.ms-fontobject',
+    '.otf': 'font/otf',
+    '.svg': 'image/svg+xml',
+    '.ttf': 'font/ttf',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+}
+
+# the encoded data uris, keyed by the digest of the file.
+_data_uris = {}
+
+_URL = re.compile(
+    r'''url\(\s*(?P<quote>["']?)(?P<url>[^"')\s]+)(?P=quote)\s*\)''')
+_ASSET_TOKEN = re.compile(
+    r'''url\(\s*(?P<quote>["']?)''' + re.escape(ASSET_TOKEN_PREFIX) +
+    r'''(?P<token>\d+):(?P<url>[^"')\s]*)(?P=quote)\s*\)''')
+_SCHEME = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+_SUFFIX = re.compile(r'[?#]')
+
+
+def is_relative_url(url):
+    """
+    Return True if the url is a relative url to a file, which excludes
+    the urls with a scheme (including data uris), absolute paths,
+    fragments and the urls that are generated through variables or
+    interpolation.
+    """
+
+    return not (
+        _SCHEME.match(url) or
+        url.startswith(('/', '#')) or
+        '$' in url or '#{' in url
+    )
+
+
+def split_url(url):
+    """
+    Split the url into the path and the suffix (the query string and
+    the fragment).
+    """
+
+    match = _SUFFIX.search(url)
+    if not match:
+        return url, ''
+    return url[:match.start()], url[match.start():]
+
+
+def mark_asset_urls(source, sourcepath, asset_urls):
+    """
+    Return the source with all the relative urls replaced with tokens,
+    with the location of the files resolved relative to the sourcepath
+    recorded into the asset_urls mapping.
+    """
+
+    tokens = {path: token for token, path in asset_urls.items()}
+
+    def replace(match):
+        url = match.group('url')
+        if not is_relative_url(url):
+            return match.group(0)
+        path = split_url(url)[0]
+        path = normpath(join(dirname(sourcepath), *path.split('/')))
+        token = tokens.get(path)
+        if token is None:
+            token = tokens[path] = '%d' % len(asset_urls)
+            asset_urls[token] = path
+        return 'url("%s%s:%s")' % (ASSET_TOKEN_PREFIX, token, url)
+
+    return _URL.sub(replace, source)
+
+
+def hashed_name(path, digest, length=12):
+    """
+    Return the basename of the path with the digest inserted before the
+    extension.
+    """
+
+    stem, ext = splitext(basename(path))
+    return '%s.%s%s' % (stem, digest[:length], ext)
+
+
+def media_type(path):
+    """
+    Return the media type for the asset at path.
+    """
+
+    ext = splitext(path)[1].lower()
+    return ASSET_MEDIA_TYPES.get(ext) or mimetypes.guess_type(path)[0] or (
+        'application/octet-stream')
+
+
+def data_uri(path, digest, cache_dir=None):
+    """
+    Return the data uri for the asset at path, which has the provided
+    digest.  The encoded results are cached by the digest, and also
+    within the cache_dir if provided.
+    """
+
+    key = '%s:%s' % (media_type(path), digest)
+    if key in _data_uris:
+        return _data_uris[key]
+
+    cache_path = join(
+        cache_dir, ASSET_CACHE_SUBDIR, digest + '.b64') if cache_dir else None
+    if cache_path and exists(cache_path):
+        with codecs.open(cache_path, encoding='ascii') as fd:
+            encoded = fd.read()
+    else:
+        with open(path, 'rb') as fd:
+            encoded = base64.b64encode(fd.read()).decode('ascii')
+        if cache_path:
+            ensure_dir(dirname(cache_path))
+            sink = FileSink(cache_path)
+            sink.write(encoded)
+            sink.close()
+
+    result = _data_uris[key] = 'data:%s;base64,%s' % (
+        media_type(path), encoded)
+    return result
+
+
+def _resolve_asset(args):
+    path, target_dir, inline_threshold, cache_dir, digest = args
+    try:
+        digest = digest or file_digest(path)
+    except (IOError, OSError) as e:
+        logger.warning("unable to read asset '%s': %s", path, e)
+        return path, None
+    if inline_threshold and getsize(path) <= inline_threshold:
+        logger.debug("inlining asset '%s' as data uri", path)
+        return path, data_uri(path, digest, cache_dir)
+
+    name = hashed_name(path, digest)
+    target = join(target_dir, name)
+    # the name embeds the digest, so an existing file with the same
+    # size is identical.
+    if exists(target) and getsize(target) == getsize(path):
+        logger.debug("asset '%s' already exists; skipping copy", target)
+    else:
+        shutil.copyfile(path, target)
+        logger.debug("copied asset '%s' to '%s'", path, target)
+    return path, name
+
+
+def copy_assets(
+        paths, target_dir, inline_threshold=None, cache_dir=None,
+        threads=ASSET_COPY_THREADS):
+    """
+    Copy the assets at the provided paths into target_dir in parallel,
+    with the names of the copies derived from the digest of their
+    contents.  Return a mapping of the path to the url for the asset,
+    or to None if the asset cannot be read.
+
+    Arguments:
+
+    paths
+        The paths to the assets.
+    target_dir
+        The directory to copy the assets to.
+    inline_threshold
+        The assets with size in bytes under this will be inlined as a
+        data uri rather than copied.  Defaults to None, which disables
+        the inlining.
+    cache_dir
+        The cache directory for the encoded data uris, and for the
+        digest store for the digests of the assets.
+    threads
+        The maximum number of threads to use.
+    """
+
+    paths = sorted(set(paths))
+    if not paths:
+        return {}
+    digests = get_digest_store(cache_dir).digests(paths) if cache_dir else {}
+    pool = ThreadPool(min(threads, len(paths)))
+    try:
+        return dict(pool.map(_resolve_asset, [
+            (path, target_dir, inline_threshold, cache_dir, digests.get(path))
+            for path in paths
+        ]))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def replace_asset_tokens(text, asset_urls, resolve):
+    """
+    Replace the asset tokens within the text with the url returned by
+    resolve for the path of each asset token, with the query string and
+    fragment of the original url retained (except for data uris); if
+    resolve returns None, the original url will be restored.
+    """
+
+    def replace(match):
+        original = match.group('url')
+        path = asset_urls.get(match.group('token'))
+        url = resolve(path) if path else None
+        if url is None:
+            logger.warning(
+                "unable to resolve the asset '%s'; the url '%s' will not be "
+                "rewritten", path, original)
+            return 'url("%s")' % original
+        if url.startswith('data:'):
+            # the suffix would corrupt the encoded data.
+            return 'url("%s")' % url
+        return 'url("%s%s")' % (url, split_url(original)[1])
+
+    return _ASSET_TOKEN.sub(replace, text)
+
+
+def iter_asset_tokens(text):
+    """
+    Yield the asset tokens within the text.
+    """
+
+    for match in _ASSET_TOKEN.finditer(text):
+        yield match.group('token')
+
+
+class AssetPostProcessor(TextPostProcessor):
+    """
+    Replace the asset tokens in the compiled output with the urls to the
+    copies of the assets placed next to the export target, or with the
+    data uris for the assets under the inline threshold.
+    """
+
+    # this has the side effect of copying the assets.
+    cacheable = False
+
+    def process_text(self, spec, text):
+        asset_urls = spec.get(CALMJS_SASSY_ASSET_URLS) or {}
+        paths = [
+            asset_urls[token] for token in set(iter_asset_tokens(text))
+            if token in asset_urls
+        ]
+        urls = copy_assets(
+            paths, dirname(spec[EXPORT_TARGET]),
+            inline_threshold=spec.get(CALMJS_SASSY_INLINE_ASSETS_THRESHOLD),
+            cache_dir=spec.get(CALMJS_SASSY_CACHE_DIR),
+        )
+        return replace_asset_tokens(text, asset_urls, urls.get)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Checking of the individual modules through libsass.
+
+Every module from the transpile sourcepath of a spec is compiled on its
+own, with the imports of the other modules resolved to their original
+files and the imports provided by the merged sourcepath stubbed out as
+per the toolchain, such that the syntax errors and the unresolvable
+imports for all the modules may be reported in a single run.  The
+compilations are distributed across a pool of processes and the
+results are discarded, as no CSS is written.
+
+Note that the partials (the modules with the name prefixed by an
+underscore) are not checked on their own, as they are only meant to be
+imported by other modules which will check them.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import logging
+import multiprocessing
+from os.path import isdir
+from os.path import isfile
+
+from calmjs.toolchain import EXPORT_MODULE_NAMES
+
+from calmjs.sassy.graph import resolve_import_path
+from calmjs.sassy.libsass import LIBSASS_OUTPUT_STYLE
+from calmjs.sassy.libsass import LIBSASS_OUTPUT_STYLE_DEFAULT
+from calmjs.sassy.libsass import libsass_import_stub_generator
+from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
+
+try:
+    import sass
+except ImportError:  # pragma: no cover
+    sass = None
+
+logger = logging.getLogger(__name__)
+
+# spec key for enabling the check mode.
+CALMJS_SASSY_CHECK = 'calmjs_sassy_check'
+# spec key for the number of processes for the checks.
+CALMJS_SASSY_CHECK_PROCESSES = 'calmjs_sassy_check_processes'
+
+# the importer for the modules checked within the current process.
+_importer = {}
+
+
+def is_partial(modname):
+    return modname.rsplit('/', 1)[-1].startswith('_')
+
+
+def check_import_generator(sourcepath, stub=None):
+    """
+    Return an importer for libsass that resolves the imports of the
+    modules in sourcepath to their original files, including the files
+    within the directories in sourcepath (i.e. the bundled ones, which
+    are imported through the module name as the prefix), with the
+    remaining imports handled by the stub importer generated from stub,
+    if provided.
+
+    Arguments:
+
+    sourcepath
+        The mapping of the module names to their sourcepaths.
+    stub
+        The spec values for the libsass_import_stub_generator.
+    """
+
+    stub_importer = libsass_import_stub_generator(stub) if stub else None
+    # longest prefix first.
+    dirs = sorted((
+        (modname + '/', path) for modname, path in sourcepath.items()
+        if isdir(path)
+    ), key=lambda item: -len(item[0]))
+
+    def read(path):
+        with codecs.open(path, encoding='utf8') as fd:
+            return ((path, fd.read()),)
+
+    def importer(target):
+        frags = target.split('/')
+        candidates = [target, '/'.join(frags[:-1] + ['_' + frags[-1]])]
+        for modname in candidates:
+            path = sourcepath.get(modname)
+            if path and isfile(path):
+                return read(path)
+        for prefix, root in dirs:
+            if target.startswith(prefix):
+                path = resolve_import_path(target[len(prefix):], None, [root])
+                if path is not None:
+                    return read(path)
+        if stub_importer is not None:
+            return stub_importer(target)
+        return None
+
+    return importer
+
+
+def check_module(importer, modname, sourcepath, output_style):
+    """
+    Compile the module, returning the error message produced, or None
+    if it compiled without errors.
+    """
+
+    try:
+        sass.compile(
+            filename=sourcepath, importers=[(0, importer)],
+            output_style=output_style,
+        )
+    except ValueError as e:
+        # sass.CompileError is a subclass of ValueError.
+        return str(e)
+    except (IOError, OSError) as e:
+        return 'unable to read the module: %s' % e
+    return None
+
+
+def _init_worker(sourcepath, stub, output_style):
+    _importer['importer'] = check_import_generator(sourcepath, stub)
+    _importer['output_style'] = output_style
+
+
+def _check_worker(item):
+    modname, sourcepath = item
+    return modname, sourcepath, check_module(
+        _importer['importer'], modname, sourcepath,
+        _importer['output_style'])
+
+
+def check_modules(
+        sourcepath, modnames=None, stub=None, processes=None,
+        output_style=LIBSASS_OUTPUT_STYLE_DEFAULT):
+    """
+    Check the modules from the sourcepath that are not partials, and
+    return the list of 3-tuples of the module name, the sourcepath and
+    the error message (or None if there were no errors), sorted by the
+    module name.
+
+    Arguments:
+
+    sourcepath
+        The mapping of the module names to their sourcepaths.
+    modnames
+        The names of the modules to check; defaults to all the modules
+        in sourcepath.
+    stub
+        The spec values for the libsass_import_stub_generator for the
+        imports that are not provided by sourcepath.
+    processes
+        The number of processes to check the modules with; defaults to
+        the number of CPUs.
+    output_style
+        The output style for libsass.
+    """
+
+    items = sorted(
+        (modname, sourcepath[modname])
+        for modname in (sourcepath if modnames is None else modnames)
+        if not is_partial(modname)
+    )
+    processes = min(processes or multiprocessing.cpu_count(), len(items))
+    logger.info(
+        'checking %d module(s) with %d process(es)', len(items),
+        max(processes, 1))
+    if processes < 2 or len(items) < 2:
+        importer = check_import_generator(sourcepath, stub)
+        return [
+            (modname, path, check_module(
+                importer, modname, path, output_style))
+            for modname, path in items
+        ]
+
+    pool = multiprocessing.Pool(
+        processes, _init_worker,
+        (dict(sourcepath), stub, output_style),
+    )
+    try:
+        return pool.map(_check_worker, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def check_spec(spec, processes=None):
+    """
+    Check the modules from the transpile_sourcepath of the spec, with
+    the modules from the bundle_sourcepath also available for import,
+    and return the results as per check_modules.
+    """
+
+    transpile_sourcepath = spec.get('transpile_sourcepath') or {}
+    sourcepath = dict(spec.get('bundle_sourcepath') or {})
+    sourcepath.update(transpile_sourcepath)
+
+    stub = None
+    if spec.get(CALMJS_SASSY_SOURCEPATH_MERGED):
+        stub = {
+            EXPORT_MODULE_NAMES: sorted(sourcepath),
+            CALMJS_SASSY_SOURCEPATH_MERGED: spec[
+                CALMJS_SASSY_SOURCEPATH_MERGED],
+        }
+
+    return check_modules(
+        sourcepath, modnames=transpile_sourcepath, stub=stub,
+        processes=processes or spec.get(CALMJS_SASSY_CHECK_PROCESSES),
+        output_style=spec.get(
+            LIBSASS_OUTPUT_STYLE, LIBSASS_OUTPUT_STYLE_DEFAULT),
+    )
+
+
+def write_check_results(results, stream):
+    """
+    Write the report for the results from check_modules to the stream,
+    and return the number of the modules that failed.
+    """
+
+    failed = 0
+    for modname, sourcepath, message in results:
+        if message is None:
+            continue
+        failed += 1
+        stream.write("module '%s' at '%s' failed:\n" % (modname, sourcepath))
+        for line in message.rstrip().splitlines():
+            stream.write('    %s\n' % line)
+    stream.write('checked %d module(s); %d failed\n' % (len(results), failed))
+    return failed
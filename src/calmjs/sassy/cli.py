@@ -3,6 +3,7 @@
 Lower level API for creating linkage with an scss implementation.
 """
 
+from functools import partial
 from os.path import basename
 from os.path import join
 from os.path import realpath
@@ -17,14 +18,37 @@ from calmjs.toolchain import CALMJS_MODULE_REGISTRY_NAMES
 from calmjs.toolchain import WORKING_DIR
 from calmjs.toolchain import spec_update_sourcepath_filter_loaderplugins
 
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHOD
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT
+from calmjs.sassy.toolchain import CALMJS_SASSY_CACHE_DIR
+from calmjs.sassy.toolchain import CALMJS_SASSY_CRITICAL_HTML_PATHS
+from calmjs.sassy.toolchain import CALMJS_SASSY_CRITICAL_SELECTORS
+from calmjs.sassy.toolchain import CALMJS_SASSY_CRITICAL_TARGET
+from calmjs.sassy.toolchain import CALMJS_SASSY_DIAGNOSTICS_DIR
+from calmjs.sassy.toolchain import CALMJS_SASSY_EXPORT_GZIP
+from calmjs.sassy.toolchain import CALMJS_SASSY_POSTPROCESSORS
+from calmjs.sassy.toolchain import CALMJS_SASSY_PRUNE_MODULES
+from calmjs.sassy.toolchain import CALMJS_SASSY_POSTPROCESSOR_CONFIGS
 from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINT_NAME
 from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINTS
 from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
 
+from calmjs.sassy.dist import LazyModuleRegistrySourcepaths
+from calmjs.sassy.dist import generate_dependencies_scss_sourcepaths
 from calmjs.sassy.dist import generate_scss_sourcepaths
 from calmjs.sassy.dist import generate_scss_bundle_sourcepaths
 from calmjs.sassy.dist import get_calmjs_scss_module_registry_for
 
+from calmjs.sassy.snapshot import SNAPSHOT_BUNDLE_SOURCEPATH
+from calmjs.sassy.snapshot import SNAPSHOT_TRANSPILE_SOURCEPATH
+from calmjs.sassy.snapshot import dump_spec_snapshot
+from calmjs.sassy.snapshot import load_spec_snapshot
+from calmjs.sassy.snapshot import spec_snapshot_key
+
+from calmjs.sassy.prune import CALMJS_SASSY_PRUNE_ALLOWLIST
+from calmjs.sassy.prune import CALMJS_SASSY_PRUNE_CORPUS
+from calmjs.sassy.prune import PRUNE_POSTPROCESSOR
+
 from calmjs.sassy.libsass import libsass_spec_extras
 from calmjs.sassy.libsass import LibsassToolchain
 
@@ -37,6 +61,118 @@ _implementation_extras = [
 ]
 
 
+def resolve_spec_values(
+        package_names, working_dir,
+        source_registry_method='all', source_registries=None,
+        sourcepath_method='all',
+        bundlepath_method='all',
+        calmjs_sassy_entry_point_name='index',
+        calmjs_sassy_entry_points=None,
+        filename_suffix='.scss',
+        sourcepath_merged_method='all'):
+    """
+    Resolve the values for the spec that require the traversal of the
+    dependency graph and the registries for the provided packages.
+
+    Returns a dict with the keys as defined by SNAPSHOT_KEYS.  Please
+    refer to create_spec for the details on the arguments.  Note that
+    for the 'lazy' sourcepath_merged_method, the merged sourcepaths will
+    only contain the bundle sourcepaths.
+    """
+
+    values = {}
+
+    if source_registries is None:
+        source_registries = get_calmjs_scss_module_registry_for(
+            package_names, method=source_registry_method)
+        if source_registries:
+            logger.info(
+                "automatically picked registries %r for sourcepaths",
+                source_registries,
+            )
+        elif package_names:
+            # TODO figure out if defaulting to calmjs.scss is better
+            logger.warning(
+                "no module registry declarations found using packages %r "
+                "with acquisition method '%s'",
+                package_names, source_registry_method,
+            )
+        else:
+            logger.warning(
+                'no packages and registries specified for spec construction')
+    else:
+        logger.info(
+            "using manually specified registries %r for sourcepaths",
+            source_registries,
+        )
+
+    values[CALMJS_MODULE_REGISTRY_NAMES] = source_registries
+
+    if sourcepath_method == 'explicit' and sourcepath_merged_method == 'lazy':
+        # avoid the creation of the registries for all the packages.
+        values[SNAPSHOT_TRANSPILE_SOURCEPATH] = (
+            generate_dependencies_scss_sourcepaths(
+                package_names=package_names,
+                registries=source_registries,
+            ))
+    else:
+        values[SNAPSHOT_TRANSPILE_SOURCEPATH] = generate_scss_sourcepaths(
+            package_names=package_names,
+            registries=source_registries,
+            method=sourcepath_method,
+        )
+
+    values[SNAPSHOT_BUNDLE_SOURCEPATH] = generate_scss_bundle_sourcepaths(
+        package_names=package_names,
+        working_dir=working_dir,
+        method=bundlepath_method,
+    )
+
+    # need one that merges all sources for sourcepaths to declare all
+    # the available paths to stub just the provided sources.
+    values[CALMJS_SASSY_SOURCEPATH_MERGED] = {}
+    if sourcepath_method != 'all' and sourcepath_merged_method != 'lazy':
+        values[CALMJS_SASSY_SOURCEPATH_MERGED].update(
+            generate_scss_sourcepaths(
+                package_names=package_names,
+                registries=source_registries,
+                method='all',
+            ))
+    if bundlepath_method != 'all':
+        values[CALMJS_SASSY_SOURCEPATH_MERGED].update(
+            generate_scss_bundle_sourcepaths(
+                package_names=package_names,
+                working_dir=working_dir,
+                method='all',
+            ))
+
+    if calmjs_sassy_entry_points:
+        values[CALMJS_SASSY_ENTRY_POINTS] = list(calmjs_sassy_entry_points)
+        logger.debug(
+            "using provided targets %r as entry points for css "
+            "generation", calmjs_sassy_entry_points,
+        )
+    else:
+        # There duplicates the above call, but this is done to avoid
+        # making any assumptions about what module name formats are
+        # being used.  The goal is to find the entry point from the
+        # provided packages.
+        entry_point_filename = calmjs_sassy_entry_point_name + filename_suffix
+        values[CALMJS_SASSY_ENTRY_POINTS] = [
+            modname for modname, sourcepath in generate_scss_sourcepaths(
+                package_names=package_names,
+                registries=source_registries,
+                method='explicit',
+            ).items() if basename(sourcepath) == entry_point_filename
+        ]
+        logger.debug(
+            "using derived '%s' targets %r as entry points for css generation",
+            filename_suffix, values[CALMJS_SASSY_ENTRY_POINTS],
+        )
+
+    return values
+
+
 def create_spec(
         package_names, export_target=None, working_dir=None, build_dir=None,
         source_registry_method='all', source_registries=None,
@@ -45,6 +181,21 @@ def create_spec(
         calmjs_sassy_entry_point_name='index',
         calmjs_sassy_entry_points=None,
         toolchain=libsass_toolchain,
+        snapshot_path=None,
+        calmjs_sassy_assemble_method=CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT,
+        sourcepath_merged_method='all',
+        calmjs_sassy_diagnostics_dir=None,
+        resolved_values=None,
+        calmjs_sassy_export_gzip=False,
+        calmjs_sassy_postprocessors=(),
+        calmjs_sassy_postprocessor_configs=None,
+        calmjs_sassy_cache_dir=None,
+        calmjs_sassy_critical_selectors=(),
+        calmjs_sassy_critical_html_paths=(),
+        calmjs_sassy_critical_target=None,
+        calmjs_sassy_prune_corpus=(),
+        calmjs_sassy_prune_allowlist=(),
+        calmjs_sassy_prune_modules=False,
         **kw):
     """
     Produce a spec for the compilation through any BaseScssToolchain
@@ -123,6 +274,22 @@ def create_spec(
 
         Defaults to 'all'.
 
+    sourcepath_merged_method
+        The acquisition method for the merged sourcepaths, which is used
+        to provide the stubs for the imports of modules that are not
+        provided by the sourcepath_method and bundlepath_method that is
+        not 'all'.  Choices are between 'all' or 'lazy'.
+
+        'all'
+            Traverse the dependency graph for the specified package to
+            acquire all the sources upfront.
+        'lazy'
+            Only resolve the modules against the source registries as
+            they are being imported.  Useful for skipping the full
+            traversal for partial (i.e. explicit) builds.
+
+        Defaults to 'all'.
+
     calmjs_sassy_entry_point_name
         The name for the main entry point.  This is the module name that
         will be searched for in each of the modules.
@@ -151,6 +318,93 @@ def create_spec(
             Function will be called to acquire the working directory,
             if working_dir is not provided.
 
+    snapshot_path
+        The path to a snapshot file for the values resolved from the
+        dependency graph and registries for the provided packages.  If
+        the snapshot holds an entry produced with the same arguments
+        within the same environment (as identified by its fingerprint),
+        the values will be loaded from there instead of being resolved
+        again, otherwise the resolved values will be written to it.
+        Defaults to None, which disables the usage of snapshots.
+
+    calmjs_sassy_assemble_method
+        The method used to assemble the entry point sourcefile from the
+        entry points.
+
+        'import'
+            Import each of the entry points in the order provided.
+        'dedupe'
+            Analyse the import closure of every entry point such that
+            each of the modules reachable through the top level imports
+            will only be imported once, in topological order.
+
+        Defaults to 'import'.
+
+    calmjs_sassy_diagnostics_dir
+        The directory to write the diagnostics bundle to, should the
+        compilation fail.  The bundle contains the copies of the entry
+        point sourcefile and the modules that lead to the failure, plus
+        a file with the locations mapped back to the original modules.
+        Defaults to None, which disables the writing of the bundle.
+
+    resolved_values
+        The values as returned by resolve_spec_values for the provided
+        arguments, for the reuse of the values resolved for another
+        spec.  If provided, the resolution and the snapshot will be
+        skipped.  Defaults to None.
+
+    calmjs_sassy_export_gzip
+        Write a gzip compressed copy of the export target, with the
+        '.gz' suffix appended to its filename.  Defaults to False.
+
+    calmjs_sassy_postprocessors
+        The ordered list of post-processors to apply onto the compiled
+        output, as the names registered to the
+        'calmjs.sassy.postprocessors' registry, or as PostProcessor
+        instances.  Defaults to no post-processing.
+
+    calmjs_sassy_postprocessor_configs
+        A mapping from the names of the post-processors to the mapping
+        of their configuration values.
+
+    calmjs_sassy_cache_dir
+        The directory for the caching of results that may be reused by
+        later builds, such as the output of every post-processor keyed
+        by their input and configuration.  Defaults to None, which
+        disables the caching.
+
+    calmjs_sassy_critical_selectors
+        The list of selectors for the elements critical to the initial
+        rendering.  If provided (or if calmjs_sassy_critical_html_paths
+        is provided), the rules from the export target that may match
+        these elements will be written to the critical target after the
+        link step.
+
+    calmjs_sassy_critical_html_paths
+        The list of paths to sample html documents, or directories of
+        them, for the elements critical to the initial rendering.
+
+    calmjs_sassy_critical_target
+        The path to write the critical rules to.  Defaults to the file
+        'critical.css' in the same directory as the export target.
+
+    calmjs_sassy_prune_corpus
+        The list of paths to the templates and scripts (or directories
+        of them) that make use of the compiled output.  If provided, the
+        'prune' post-processor will be applied first, such that the
+        rules that require any class names or ids that are not found
+        anywhere within the corpus will be dropped.
+
+    calmjs_sassy_prune_allowlist
+        The list of regular expressions for the class names and ids that
+        will never be pruned.
+
+    calmjs_sassy_prune_modules
+        Only compile the modules and bundled files that are reachable
+        through the import statements from the entry points into the
+        build directory; the names of the modules that were pruned will
+        be recorded into the spec.  Defaults to False.
+
     """
 
     working_dir = working_dir if working_dir else toolchain.join_cwd()
@@ -165,94 +419,80 @@ def create_spec(
                 join(working_dir, 'calmjs.sassy.export.css'))
 
     spec = Spec()
-
-    if source_registries is None:
-        source_registries = get_calmjs_scss_module_registry_for(
-            package_names, method=source_registry_method)
-        if source_registries:
-            logger.info(
-                "automatically picked registries %r for sourcepaths",
-                source_registries,
-            )
-        elif package_names:
-            # TODO figure out if defaulting to calmjs.scss is better
-            logger.warning(
-                "no module registry declarations found using packages %r "
-                "with acquisition method '%s'",
-                package_names, source_registry_method,
-            )
-        else:
-            logger.warning(
-                'no packages and registries specified for spec construction')
-    else:
-        logger.info(
-            "using manually specified registries %r for sourcepaths",
-            source_registries,
-        )
-
     spec[BUILD_DIR] = build_dir
-    spec[CALMJS_MODULE_REGISTRY_NAMES] = source_registries
+    spec[CALMJS_SASSY_ASSEMBLE_METHOD] = calmjs_sassy_assemble_method
+    if calmjs_sassy_diagnostics_dir:
+        spec[CALMJS_SASSY_DIAGNOSTICS_DIR] = calmjs_sassy_diagnostics_dir
     spec[CALMJS_SASSY_ENTRY_POINT_NAME] = calmjs_sassy_entry_point_name
+    spec[CALMJS_SASSY_EXPORT_GZIP] = calmjs_sassy_export_gzip
+    spec[CALMJS_SASSY_POSTPROCESSORS] = list(calmjs_sassy_postprocessors or ())
+    spec[CALMJS_SASSY_POSTPROCESSOR_CONFIGS] = dict(
+        calmjs_sassy_postprocessor_configs or {})
+    spec[CALMJS_SASSY_PRUNE_MODULES] = calmjs_sassy_prune_modules
+    if calmjs_sassy_prune_corpus:
+        spec[CALMJS_SASSY_PRUNE_CORPUS] = list(calmjs_sassy_prune_corpus)
+        spec[CALMJS_SASSY_PRUNE_ALLOWLIST] = list(
+            calmjs_sassy_prune_allowlist or ())
+        if PRUNE_POSTPROCESSOR not in spec[CALMJS_SASSY_POSTPROCESSORS]:
+            spec[CALMJS_SASSY_POSTPROCESSORS].insert(0, PRUNE_POSTPROCESSOR)
+        spec[CALMJS_SASSY_POSTPROCESSOR_CONFIGS][PRUNE_POSTPROCESSOR] = {
+            'corpus': spec[CALMJS_SASSY_PRUNE_CORPUS],
+            'allowlist': spec[CALMJS_SASSY_PRUNE_ALLOWLIST],
+        }
+    if calmjs_sassy_cache_dir:
+        spec[CALMJS_SASSY_CACHE_DIR] = calmjs_sassy_cache_dir
+    spec[CALMJS_SASSY_CRITICAL_SELECTORS] = list(
+        calmjs_sassy_critical_selectors or ())
+    spec[CALMJS_SASSY_CRITICAL_HTML_PATHS] = list(
+        calmjs_sassy_critical_html_paths or ())
+    if calmjs_sassy_critical_target:
+        spec[CALMJS_SASSY_CRITICAL_TARGET] = calmjs_sassy_critical_target
     spec[EXPORT_TARGET] = export_target
     spec[SOURCE_PACKAGE_NAMES] = package_names
     spec[WORKING_DIR] = working_dir
 
-    spec_update_sourcepath_filter_loaderplugins(
-        spec, generate_scss_sourcepaths(
-            package_names=package_names,
-            registries=source_registries,
-            method=sourcepath_method,
-        ), 'transpile_sourcepath')
-
-    spec_update_sourcepath_filter_loaderplugins(
-        spec, generate_scss_bundle_sourcepaths(
-            package_names=package_names,
-            working_dir=working_dir,
-            method=bundlepath_method,
-        ), 'bundle_sourcepath')
+    resolve = partial(
+        resolve_spec_values,
+        package_names=package_names,
+        working_dir=working_dir,
+        source_registry_method=source_registry_method,
+        source_registries=source_registries,
+        sourcepath_method=sourcepath_method,
+        bundlepath_method=bundlepath_method,
+        calmjs_sassy_entry_point_name=calmjs_sassy_entry_point_name,
+        calmjs_sassy_entry_points=calmjs_sassy_entry_points,
+        filename_suffix=toolchain.filename_suffix,
+        sourcepath_merged_method=sourcepath_merged_method,
+    )
 
-    # need one that merges all sources for sourcepaths to declare all
-    # the available paths to stub just the provided sources.
-    spec[CALMJS_SASSY_SOURCEPATH_MERGED] = {}
-    if sourcepath_method != 'all':
-        spec[CALMJS_SASSY_SOURCEPATH_MERGED].update(generate_scss_sourcepaths(
-            package_names=package_names,
-            registries=source_registries,
-            method='all',
-        ))
-    if bundlepath_method != 'all':
-        spec[
-            CALMJS_SASSY_SOURCEPATH_MERGED
-        ].update(generate_scss_bundle_sourcepaths(
-            package_names=package_names,
-            working_dir=working_dir,
-            method='all',
-        ))
+    if resolved_values is not None:
+        values = resolved_values
+    elif snapshot_path:
+        key = spec_snapshot_key(**resolve.keywords)
+        values = load_spec_snapshot(snapshot_path, key)
+        if values is None:
+            values = resolve()
+            dump_spec_snapshot(values, snapshot_path, key)
+        else:
+            logger.info(
+                "using resolved values from snapshot '%s'", snapshot_path)
+    else:
+        values = resolve()
 
-    if calmjs_sassy_entry_points:
-        spec[CALMJS_SASSY_ENTRY_POINTS] = calmjs_sassy_entry_points
-        logger.debug(
-            "using provided targets %r as entry points for css "
-            "generation", calmjs_sassy_entry_points,
+    spec[CALMJS_MODULE_REGISTRY_NAMES] = values[CALMJS_MODULE_REGISTRY_NAMES]
+    if sourcepath_method != 'all' and sourcepath_merged_method == 'lazy':
+        spec[CALMJS_SASSY_SOURCEPATH_MERGED] = LazyModuleRegistrySourcepaths(
+            values[CALMJS_MODULE_REGISTRY_NAMES], package_names,
+            extras=values[CALMJS_SASSY_SOURCEPATH_MERGED],
         )
     else:
-        # There duplicates the above call, but this is done to avoid
-        # making any assumptions about what module name formats are
-        # being used.  The goal is to find the entry point from the
-        # provided packages.
-        entry_point_filename = (
-            calmjs_sassy_entry_point_name + toolchain.filename_suffix)
-        spec[CALMJS_SASSY_ENTRY_POINTS] = [
-            modname for modname, sourcepath in generate_scss_sourcepaths(
-                package_names=package_names,
-                registries=source_registries,
-                method='explicit',
-            ).items() if basename(sourcepath) == entry_point_filename
-        ]
-        logger.debug(
-            "using derived '%s' targets %r as entry points for css generation",
-            toolchain.filename_suffix, spec[CALMJS_SASSY_ENTRY_POINTS],
-        )
+        spec[CALMJS_SASSY_SOURCEPATH_MERGED] = values[
+            CALMJS_SASSY_SOURCEPATH_MERGED]
+    spec[CALMJS_SASSY_ENTRY_POINTS] = values[CALMJS_SASSY_ENTRY_POINTS]
+    spec_update_sourcepath_filter_loaderplugins(
+        spec, values[SNAPSHOT_TRANSPILE_SOURCEPATH], 'transpile_sourcepath')
+    spec_update_sourcepath_filter_loaderplugins(
+        spec, values[SNAPSHOT_BUNDLE_SOURCEPATH], 'bundle_sourcepath')
 
     for cls, f in _implementation_extras:
         if isinstance(toolchain, cls):
@@ -268,6 +508,7 @@ def compile_all(
         calmjs_sassy_entry_point_name='index',
         calmjs_sassy_entry_points=None,
         toolchain=libsass_toolchain,
+        snapshot_path=None,
         **kw):
     """
     Invoke the scss compilation through the provided toolchain class to
@@ -299,6 +540,7 @@ def compile_all(
         calmjs_sassy_entry_point_name=calmjs_sassy_entry_point_name,
         calmjs_sassy_entry_points=calmjs_sassy_entry_points,
         toolchain=toolchain,
+        snapshot_path=snapshot_path,
         **kw
     )
     toolchain(spec)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of concurrent builds of the same export target.
+
+Multiple processes that build the same export target from the same
+inputs would each compile everything only to overwrite the result of
+the others.  When enabled, an advisory lock keyed on the export target
+and the digest of the inputs is acquired before anything is compiled,
+such that only the first process will build, while the others will
+wait for it to finish and then reuse the export target it produced, as
+verified through the record of the digest of its inputs kept within the
+same directory as the lock.  A build that did not have to wait for the
+lock will always build the export target.
+
+The lock files are left in place (within the cache directory, or the
+temporary directory if one is not specified), as removing them while
+another process is waiting on them would allow a third one to acquire
+a new lock for the same key.
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import time
+from os.path import join
+from os.path import normcase
+from tempfile import gettempdir
+
+from calmjs.toolchain import CLEANUP
+from calmjs.toolchain import EXPORT_TARGET
+
+from calmjs.sassy.digest import is_artifact_fresh
+from calmjs.sassy.digest import spec_input_digest
+from calmjs.sassy.output import ensure_dir
+from calmjs.sassy.toolchain import CALMJS_SASSY_CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # pragma: no cover
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# spec key for enabling the coalescing of the concurrent builds.
+CALMJS_SASSY_COALESCE = 'calmjs_sassy_coalesce'
+# spec key for the digest of the inputs, once the lock is acquired.
+CALMJS_SASSY_COALESCE_DIGEST = 'calmjs_sassy_coalesce_digest'
+# spec key for the flag that the existing export target is reused.
+CALMJS_SASSY_COALESCED = 'calmjs_sassy_coalesced'
+
+# the interval between the attempts to acquire the lock, for platforms
+# where a blocking acquisition is not available.
+LOCK_POLL_INTERVAL = 0.1
+
+HAS_FILE_LOCKING = fcntl is not None or msvcrt is not None
+
+
+def coalesce_lock_path(export_target, digest, lock_dir=None):
+    """
+    Return the path to the lock file for the export target and digest,
+    within the lock directory which defaults to the temporary directory.
+    """
+
+    key = hashlib.sha1(json.dumps(
+        [normcase(export_target), digest]).encode('utf8')).hexdigest()
+    return join(lock_dir or gettempdir(), 'calmjs_sassy-%s.lock' % key)
+
+
+class FileLock(object):
+    """
+    An exclusive advisory lock on a file, which is released by the
+    operating system should the process holding it be terminated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def _lock(self, blocking):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | (
+                0 if blocking else fcntl.LOCK_NB))
+            return
+        while True:  # pragma: no cover
+            try:
+                msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
+                return
+            except (IOError, OSError):
+                if not blocking:
+                    raise
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def acquire(self, blocking=True):
+        """
+        Acquire the lock, blocking until it is acquired unless specified
+        otherwise.  Return False if it cannot be acquired without
+        blocking.
+        """
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            self._lock(blocking)
+        except Exception as e:
+            os.close(self.fd)
+            self.fd = None
+            if blocking or getattr(e, 'errno', None) not in (
+                    errno.EACCES, errno.EAGAIN, errno.EDEADLK):
+                raise
+            return False
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def coalesce_spec(spec, output_style):
+    """
+    Acquire the lock for the export target and the digest of the inputs
+    of the spec, to be released when the spec is cleaned up.  Return
+    True if the lock was held by another build that produced the export
+    target from the same inputs while waiting for it, such that it may
+    be reused rather than built again.
+
+    Arguments:
+
+    spec
+        The spec, with the export target resolved.
+    output_style
+        The output style the export target is to be produced with.
+    """
+
+    export_target = spec[EXPORT_TARGET]
+    if not HAS_FILE_LOCKING:  # pragma: no cover
+        logger.warning(
+            "unable to coalesce the build of export target '%s': file "
+            "locking is not supported on this platform", export_target)
+        return False
+
+    digest = spec_input_digest(spec, output_style)
+    lock_dir = spec.get(CALMJS_SASSY_CACHE_DIR)
+    if lock_dir:
+        ensure_dir(lock_dir)
+    lock = FileLock(coalesce_lock_path(export_target, digest, lock_dir))
+    spec.advise(CLEANUP, lock.release)
+
+    waited = not lock.acquire(blocking=False)
+    if waited:
+        started = time.time()
+        logger.info(
+            "waiting for the concurrent build of export target '%s'",
+            export_target)
+        lock.acquire()
+        logger.debug(
+            "acquired lock '%s' after %.3f seconds",
+            lock.path, time.time() - started)
+
+    spec[CALMJS_SASSY_COALESCE_DIGEST] = digest
+    spec[CALMJS_SASSY_COALESCED] = waited and is_artifact_fresh(
+        export_target, digest, lock_dir)
+    return spec[CALMJS_SASSY_COALESCED]
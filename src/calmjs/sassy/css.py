@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+A minimal parser for the compiled CSS, along with the matching of the
+rules against the elements that may be present in a document.
+
+Only what is required to select the rules to be retained is parsed;
+the declarations are retained verbatim.  The matching is conservative,
+as in a selector is considered to match if all the classes, ids and tag
+names it requires are present, ignoring the structure (combinators) and
+the pseudo-classes and attribute selectors.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import logging
+import os
+import re
+from os.path import isdir
+from os.path import join
+from os.path import splitext
+
+try:
+    from html.parser import HTMLParser
+except ImportError:  # pragma: no cover
+    from HTMLParser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+# the at-rules with a block of rules, which will be parsed.
+CONDITIONAL_AT_RULES = ('media', 'supports', 'document', '-moz-document')
+# the file extensions for html documents.
+HTML_EXTENSIONS = ('.html', '.htm', '.xhtml')
+
+_IDENT = r'(?:\\.|[\w-])+'
+_FEATURE = re.compile(r'(?P<kind>[.#]?)(?P<name>' + _IDENT + ')')
+_ESCAPE = re.compile(r'\\(.)')
+_AT_NAME = re.compile(r'@(' + _IDENT + ')')
+_SELECTOR_REMOVE = re.compile(
+    r'''\[[^\]]*\]|"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*\'''')
+_COMBINATORS = re.compile(r'\s*[>+~]\s*|\s+')
+_IDENT_MATCH = re.compile(_IDENT).match
+
+
+class Node(object):
+    """
+    A node within the stylesheet, with the text from the source.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def serialize(self):
+        return self.text
+
+
+class Statement(Node):
+    """
+    A top level comment or statement (e.g. @charset or @import).
+    """
+
+
+class StyleRule(Node):
+    """
+    A style rule, with the list of selectors and the body.
+    """
+
+    def __init__(self, text, prelude, body):
+        super(StyleRule, self).__init__(text)
+        self.prelude = prelude
+        self.selectors = split_selectors(prelude)
+        self.body = body
+
+    def serialize_with(self, selectors):
+        """
+        Serialize the rule with only the provided selectors.
+        """
+
+        if selectors == self.selectors:
+            return self.text
+        sep = ', ' if ', ' in self.prelude else ','
+        space = ' ' if ' {' in self.text else ''
+        return '%s%s{%s}' % (sep.join(selectors), space, self.body)
+
+
+class AtRule(Node):
+    """
+    An at-rule with a block; for the conditional group rules, the block
+    is parsed into children.
+    """
+
+    def __init__(self, text, prelude, body, children=None):
+        super(AtRule, self).__init__(text)
+        self.prelude = prelude
+        self.name = _AT_NAME.match(prelude).group(1).lower() if (
+            _AT_NAME.match(prelude)) else ''
+        self.body = body
+        self.children = children
+
+    def serialize_with(self, body):
+        """
+        Serialize the at-rule with the provided body.
+        """
+
+        space = ' ' if ' {' in self.text else ''
+        return '%s%s{\n%s}' % (self.prelude, space, body)
+
+
+def _skip_string(text, idx, end):
+    quote = text[idx]
+    idx += 1
+    while idx < end:
+        if text[idx] == '\\':
+            idx += 2
+            continue
+        if text[idx] == quote:
+            return idx + 1
+        idx += 1
+    return end
+
+
+def _scan(text, idx, end, terminators):
+    """
+    Return the index of the first terminator character at the current
+    nesting level, skipping over strings, comments and nested blocks.
+    Return end if not found.
+    """
+
+    depth = 0
+    while idx < end:
+        c = text[idx]
+        if c in '"\'':
+            idx = _skip_string(text, idx, end)
+            continue
+        if text.startswith('/*', idx):
+            close = text.find('*/', idx + 2)
+            idx = end if close < 0 else close + 2
+            continue
+        if depth == 0 and c in terminators:
+            return idx
+        if c in '({[':
+            depth += 1
+        elif c in ')}]':
+            depth -= 1
+        idx += 1
+    return end
+
+
+def parse_stylesheet(text, start=0, end=None):
+    """
+    Parse the CSS text into a list of nodes.
+    """
+
+    end = len(text) if end is None else end
+    nodes = []
+    idx = start
+    while idx < end:
+        if text[idx].isspace():
+            idx += 1
+            continue
+        if text.startswith('/*', idx):
+            close = text.find('*/', idx + 2)
+            close = end if close < 0 else close + 2
+            nodes.append(Statement(text[idx:close]))
+            idx = close
+            continue
+        term = _scan(text, idx, end, '{;}')
+        if term >= end or text[term] != '{':
+            # a statement, or a stray closing brace.
+            stop = min(term + 1, end)
+            nodes.append(Statement(text[idx:stop].strip()))
+            idx = stop
+            continue
+        close = _scan(text, term + 1, end, '}')
+        prelude = text[idx:term].strip()
+        body = text[term + 1:close]
+        raw = text[idx:close + 1]
+        if prelude.startswith('@'):
+            node = AtRule(raw, prelude, body)
+            if node.name in CONDITIONAL_AT_RULES:
+                node.children = parse_stylesheet(text, term + 1, close)
+            nodes.append(node)
+        else:
+            nodes.append(StyleRule(raw, prelude, body))
+        idx = close + 1
+    return nodes
+
+
+def split_selectors(prelude):
+    """
+    Split the selector list into the individual selectors.
+    """
+
+    selectors = []
+    idx = 0
+    end = len(prelude)
+    while idx <= end:
+        comma = _scan(prelude, idx, end, ',')
+        selector = prelude[idx:comma].strip()
+        if selector:
+            selectors.append(selector)
+        idx = comma + 1
+    return selectors
+
+
+def _strip_pseudo(selector):
+    # remove the pseudo-classes and pseudo-elements, including their
+    # arguments, as they do not add requirements that can be checked.
+    result = []
+    idx = 0
+    end = len(selector)
+    while idx < end:
+        c = selector[idx]
+        if c == '\\':
+            result.append(selector[idx:idx + 2])
+            idx += 2
+            continue
+        if c != ':':
+            result.append(c)
+            idx += 1
+            continue
+        idx += 1
+        while idx < end and selector[idx] == ':':
+            idx += 1
+        match = _IDENT_MATCH(selector, idx)
+        idx = match.end() if match else idx
+        if idx < end and selector[idx] == '(':
+            idx = _scan(selector, idx + 1, end, ')') + 1
+    return ''.join(result)
+
+
+def selector_features(selector):
+    """
+    Return the frozenset of (kind, name) tuples required by the
+    selector, where kind is one of 'tag', 'class' or 'id'.
+    """
+
+    selector = _strip_pseudo(_SELECTOR_REMOVE.sub('', selector))
+    features = set()
+    for compound in _COMBINATORS.split(selector):
+        for match in _FEATURE.finditer(compound):
+            name = _ESCAPE.sub(r'\1', match.group('name'))
+            kind = match.group('kind')
+            if kind == '.':
+                features.add(('class', name))
+            elif kind == '#':
+                features.add(('id', name))
+            elif match.start() == 0:
+                features.add(('tag', name.lower()))
+    return frozenset(features)
+
+
+class SelectorMatcher(object):
+    """
+    Match the selectors against the set of features that are present,
+    with the features of every distinct selector computed once.
+    """
+
+    def __init__(self, present, match_tags=True):
+        """
+        Arguments:
+
+        present
+            The set of (kind, name) features that are present.
+        match_tags
+            If False, the tag names required by the selectors will be
+            assumed to be present.
+        """
+
+        self.present = present
+        self.match_tags = match_tags
+        self._results = {}
+
+    def has(self, kind, name):
+        if kind == 'tag' and not self.match_tags:
+            return True
+        return (kind, name) in self.present
+
+    def matches(self, selector):
+        result = self._results.get(selector)
+        if result is None:
+            result = self._results[selector] = all(
+                self.has(kind, name)
+                for kind, name in selector_features(selector)
+            )
+        return result
+
+
+class SelectorIndex(object):
+    """
+    An inverted index of the features required by the selectors of the
+    style rules within the nodes, such that the selectors that cannot
+    match may be found by the lookup of every distinct feature once,
+    rather than the matching of every selector.
+    """
+
+    def __init__(self, nodes):
+        self.selectors = set()
+        self.features = {}
+        self._index_nodes(nodes)
+
+    def _index_nodes(self, nodes):
+        for node in nodes:
+            if isinstance(node, StyleRule):
+                for selector in node.selectors:
+                    if selector in self.selectors:
+                        continue
+                    self.selectors.add(selector)
+                    for feature in selector_features(selector):
+                        self.features.setdefault(feature, set()).add(selector)
+            elif isinstance(node, AtRule) and node.children is not None:
+                self._index_nodes(node.children)
+
+    def unmatched(self, has):
+        """
+        Return the set of selectors that require any of the features
+        for which has(kind, name) returns False.
+        """
+
+        result = set()
+        for (kind, name), selectors in self.features.items():
+            if not has(kind, name):
+                result.update(selectors)
+        return result
+
+
+def filter_nodes(nodes, matches, keep_other=True):
+    """
+    Return the serialized text of the nodes, retaining only the style
+    rules with the selectors that matches, and the conditional at-rules
+    that still contain rules.  Other nodes (statements, comments and
+    other at-rules) are retained if keep_other is True.  Also return
+    the total and the retained number of style rules as a 2-tuple.
+    """
+
+    chunks = []
+    total = kept = 0
+    for node in nodes:
+        if isinstance(node, StyleRule):
+            total += 1
+            selectors = [s for s in node.selectors if matches(s)]
+            if selectors:
+                kept += 1
+                chunks.append(node.serialize_with(selectors) + '\n')
+        elif isinstance(node, AtRule) and node.children is not None:
+            text, counts = filter_nodes(node.children, matches, keep_other)
+            total += counts[0]
+            kept += counts[1]
+            if counts[1]:
+                chunks.append(node.serialize_with(text) + '\n')
+        elif keep_other:
+            chunks.append(node.serialize() + '\n')
+    return ''.join(chunks), (total, kept)
+
+
+class _FeatureCollector(HTMLParser):
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.features = set()
+
+    def handle_starttag(self, tag, attrs):
+        self.features.add(('tag', tag.lower()))
+        for key, value in attrs:
+            if not value:
+                continue
+            if key == 'id':
+                self.features.add(('id', value.strip()))
+            elif key == 'class':
+                self.features.update(('class', v) for v in value.split())
+
+
+def iter_files(paths, extensions):
+    """
+    Yield the files with the extensions from the provided paths, which
+    may be files or directories that will be walked.
+    """
+
+    for path in paths:
+        if not isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if splitext(name)[1].lower() in extensions:
+                    yield join(root, name)
+
+
+def read_text(path):
+    with codecs.open(path, encoding='utf8', errors='replace') as fd:
+        return fd.read()
+
+
+def html_features(paths):
+    """
+    Return the set of features present in the html documents at the
+    provided paths.
+    """
+
+    collector = _FeatureCollector()
+    for path in iter_files(paths, HTML_EXTENSIONS):
+        collector.feed(read_text(path))
+    collector.close()
+    return collector.features
+
+
+def critical_features(selectors=(), html_paths=()):
+    """
+    Return the set of features for the critical rules, from the list of
+    selectors and the html documents at the provided paths (which may
+    be directories containing them).
+    """
+
+    present = set()
+    for selector in selectors:
+        present.update(selector_features(selector))
+    if html_paths:
+        present.update(html_features(html_paths))
+    return present
+
+
+def extract_rules(text, present, match_tags=True):
+    """
+    Return the CSS text with only the rules that may match the present
+    features, along with the total and the retained number of rules.
+    """
+
+    matcher = SelectorMatcher(present, match_tags=match_tags)
+    result, (total, kept) = filter_nodes(
+        parse_stylesheet(text), matcher.matches)
+    return result, total, kept
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency files for external build systems.
+
+After a successful link, a depfile in the format understood by make and
+ninja may be written, listing the export target along with every source
+that contributed to it, such that the external build system may skip
+the invocation of the toolchain if none of them have changed.  These
+are the sources from the transpile and bundle sourcepaths of the spec,
+with the directories from the bundle sourcepath replaced by the files
+within them that libsass actually imported, as recorded by an importer
+that is active for every compilation.  Should the imports not be
+recorded for every compilation (e.g. when compiled within the sandbox,
+or when a cached fragment is used), the directories will be listed as
+they are instead.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+from os import sep
+from os.path import isdir
+from os.path import join
+from os.path import normpath
+
+from calmjs.toolchain import BUILD_DIR
+from calmjs.toolchain import EXPORT_TARGET
+
+from calmjs.sassy.diagnostics import LIBSASS_STDIN
+from calmjs.sassy.diagnostics import build_dir_sources
+from calmjs.sassy.graph import resolve_import_path
+from calmjs.sassy.output import FileSink
+from calmjs.sassy.output import stream_chunks
+
+logger = logging.getLogger(__name__)
+
+# spec key for the path to write the depfile to.
+CALMJS_SASSY_DEPFILE = 'calmjs_sassy_depfile'
+# spec key for the list of the paths within the build directory that
+# were imported by libsass; None if not recorded for all compilations.
+CALMJS_SASSY_IMPORTED_PATHS = 'calmjs_sassy_imported_paths'
+
+
+def import_recorder_generator(spec):
+    """
+    Return an importer for libsass that records the paths within the
+    build directory of the imports as resolved by libsass into the
+    CALMJS_SASSY_IMPORTED_PATHS of the spec, without providing them.
+    Returns None if the imports were not recorded for a compilation.
+    """
+
+    paths = spec.get(CALMJS_SASSY_IMPORTED_PATHS, [])
+    if paths is None:
+        return None
+    spec[CALMJS_SASSY_IMPORTED_PATHS] = paths
+    include_paths = [spec[BUILD_DIR]]
+
+    def importer(target, prev):
+        path = resolve_import_path(
+            target, None if prev == LIBSASS_STDIN else prev, include_paths)
+        if path is not None:
+            paths.append(path)
+        return None
+
+    return importer
+
+
+def unrecorded_imports(spec):
+    """
+    Mark the imports as not recorded for every compilation.
+    """
+
+    spec[CALMJS_SASSY_IMPORTED_PATHS] = None
+
+
+def depfile_sources(spec):
+    """
+    Return the sorted list of the paths to the sources that contributed
+    to the export target of the spec.
+    """
+
+    build_dir = spec[BUILD_DIR]
+    sources = set()
+    dirs = []
+    for key in ('transpile_sourcepath', 'bundle_sourcepath'):
+        for modname, path in (spec.get(key) or {}).items():
+            if isdir(path):
+                dirs.append((modname, path))
+            else:
+                sources.add(path)
+
+    imported = spec.get(CALMJS_SASSY_IMPORTED_PATHS)
+    if imported is None or not dirs:
+        sources.update(path for modname, path in dirs)
+        return sorted(sources)
+
+    compiled = build_dir_sources(spec)
+    targetpaths = spec.get('bundled_targetpaths') or {}
+    prefixes = [
+        (normpath(join(
+            build_dir, *targetpaths.get(modname, modname).split('/'))) + sep,
+         path)
+        for modname, path in dirs
+    ]
+    for path in imported:
+        if path in compiled:
+            continue
+        for prefix, source in prefixes:
+            if path.startswith(prefix):
+                sources.add(join(source, path[len(prefix):]))
+                break
+    return sorted(sources)
+
+
+def escape_path(path):
+    """
+    Escape the path for the depfile format used by make and ninja.
+    """
+
+    return path.replace(' ', '\\ ').replace('#', '\\#').replace('$', '$$')
+
+
+def format_depfile(target, sources):
+    return '%s:%s\n' % (escape_path(target), ''.join(
+        ' \\\n  %s' % escape_path(source) for source in sources))
+
+
+def write_depfile(spec):
+    """
+    Write the depfile for the export target of the spec to the path
+    specified by CALMJS_SASSY_DEPFILE.
+    """
+
+    sources = depfile_sources(spec)
+    stream_chunks([format_depfile(spec[EXPORT_TARGET], sources)], [
+        FileSink(spec[CALMJS_SASSY_DEPFILE])])
+    logger.info(
+        "wrote depfile at '%s' with %d sources",
+        spec[CALMJS_SASSY_DEPFILE], len(sources))
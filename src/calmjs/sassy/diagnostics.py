@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Diagnostics for the failures reported by the compiler.
+
+The locations reported by the compiler refer to the copies of the
+modules within the build directory, which is typically a temporary
+directory that will be removed once the toolchain finishes.  The
+helpers here map those locations back to the modules and sourcepaths
+declared within the spec, and produce a minimal bundle of the relevant
+files for further inspection.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import json
+import logging
+import os
+import re
+import shutil
+from os.path import abspath
+from os.path import dirname
+from os.path import exists
+from os.path import join
+from os.path import normpath
+from os.path import relpath
+
+from calmjs.toolchain import BUILD_DIR
+
+from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINT_SOURCEFILE
+
+logger = logging.getLogger(__name__)
+
+# the location lines within the error messages produced by libsass.
+_LIBSASS_LOCATION = re.compile(
+    r'^\s*(?:on|from) line (?P<line>\d+)(?::(?P<column>\d+))? '
+    r'of (?P<path>.+?)\s*$', re.M)
+# the pseudo path used by libsass for the string that was compiled.
+LIBSASS_STDIN = 'stdin'
+
+# the name of the file within the diagnostics directory that holds the
+# location information.
+DIAGNOSTICS_FILENAME = 'diagnostics.json'
+
+# the prefix of the keys for the sourcepaths and targetpaths in a spec
+# that have been compiled into the build directory.
+_COMPILED_PREFIXES = (
+    ('transpile', 'transpiled'),
+    ('bundle', 'bundled'),
+)
+
+
+def parse_libsass_locations(message):
+    """
+    Return a list of (path, line, column) tuples for every location
+    reported within the libsass error message, with the location of
+    the error itself being the first, followed by the locations of the
+    imports that led to it.  The column may be None.
+    """
+
+    return [
+        (
+            match.group('path'),
+            int(match.group('line')),
+            int(match.group('column')) if match.group('column') else None,
+        )
+        for match in _LIBSASS_LOCATION.finditer(message)
+    ]
+
+
+def build_dir_sources(spec):
+    """
+    Return a mapping of the normalized absolute paths of the files that
+    were compiled into the build directory to a 2-tuple of the module
+    name and the original sourcepath.
+    """
+
+    build_dir = spec[BUILD_DIR]
+    result = {}
+    for source_prefix, target_prefix in _COMPILED_PREFIXES:
+        sourcepaths = spec.get(source_prefix + '_sourcepath') or {}
+        targetpaths = spec.get(target_prefix + '_targetpaths') or {}
+        for modname, target in targetpaths.items():
+            path = normpath(join(build_dir, *target.split('/')))
+            result[path] = (modname, sourcepaths.get(modname))
+    return result
+
+
+def locate_compile_error(spec, message):
+    """
+    Map the locations reported within the error message back to the
+    modules within the spec.  Returns a list of dicts, one for each of
+    the location in the order reported, with the following keys:
+
+    path
+        The absolute path of the file within the build directory.
+    modname
+        The module name for the file; None if it is not a module that
+        was compiled into the build directory, which includes the
+        generated entry point sourcefile.
+    sourcepath
+        The original sourcepath of the module; None if not known.
+    line
+        The line number.
+    column
+        The column number; may be None.
+    """
+
+    sources = build_dir_sources(spec)
+    results = []
+    for path, line, column in parse_libsass_locations(message):
+        if path == LIBSASS_STDIN:
+            path = spec.get(CALMJS_SASSY_ENTRY_POINT_SOURCEFILE)
+        else:
+            # libsass reports the paths relative to the current working
+            # directory.
+            path = normpath(abspath(path))
+        modname, sourcepath = sources.get(path, (None, None))
+        results.append({
+            'path': path,
+            'modname': modname,
+            'sourcepath': sourcepath,
+            'line': line,
+            'column': column,
+        })
+    return results
+
+
+def write_diagnostics(spec, message, locations, diagnostics_dir):
+    """
+    Write a diagnostics bundle into diagnostics_dir, which consists of
+    the copies of the entry point sourcefile and the files referenced by
+    the locations, at their relative location within the build
+    directory, along with a DIAGNOSTICS_FILENAME that contains the error
+    message and the locations.  Returns the path to the file.
+
+    Arguments:
+
+    spec
+        The spec that failed to compile.
+    message
+        The error message.
+    locations
+        The locations, as produced by locate_compile_error.
+    diagnostics_dir
+        The target directory; will be created if it does not exist.
+    """
+
+    build_dir = spec[BUILD_DIR]
+    paths = [spec.get(CALMJS_SASSY_ENTRY_POINT_SOURCEFILE)]
+    paths.extend(location['path'] for location in locations)
+
+    records = []
+    for location in locations:
+        record = dict(location)
+        if location['path']:
+            record['path'] = relpath(
+                location['path'], build_dir).replace(os.sep, '/')
+        records.append(record)
+
+    if not exists(diagnostics_dir):
+        os.makedirs(diagnostics_dir)
+
+    for path in paths:
+        if not path or not exists(path):
+            continue
+        rel = relpath(path, build_dir)
+        if rel.startswith(os.pardir):
+            continue
+        target = join(diagnostics_dir, rel)
+        if not exists(dirname(target)):
+            os.makedirs(dirname(target))
+        shutil.copy(path, target)
+
+    diagnostics_file = join(diagnostics_dir, DIAGNOSTICS_FILENAME)
+    with codecs.open(diagnostics_file, 'w', encoding='utf8') as fd:
+        json.dump({
+            'message': message,
+            'locations': records,
+        }, fd, indent=4, sort_keys=True)
+    logger.info("wrote compile diagnostics to '%s'", diagnostics_file)
+    return diagnostics_file
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+"""
+Digests of the inputs for a build, for the detection of artifacts that
+are already up-to-date.
+
+The digests of the files may be persisted within a DigestStore inside
+the cache directory, keyed by the path to the file along with its inode
+number, size and modification time, such that the digests of the files
+that are unchanged since the previous build may be acquired without
+reading their contents.
+
+The record of the digest of the inputs an artifact was produced from is
+kept within the cache directory (or the temporary directory, if one is
+not specified), keyed by the path to the artifact, rather than next to
+it where it would be shipped along with the artifact.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import errno
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from os.path import abspath
+from os.path import dirname
+from os.path import isdir
+from os.path import join
+from os.path import normcase
+from os.path import realpath
+from tempfile import gettempdir
+
+from calmjs.sassy.output import ensure_dir
+from calmjs.sassy.toolchain import CALMJS_SASSY_CACHE_DIR
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHOD
+from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINTS
+from calmjs.sassy.toolchain import CALMJS_SASSY_EXPORT_GZIP
+from calmjs.sassy.toolchain import CALMJS_SASSY_POSTPROCESSORS
+from calmjs.sassy.toolchain import CALMJS_SASSY_POSTPROCESSOR_CONFIGS
+from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
+
+logger = logging.getLogger(__name__)
+
+# the spec keys for the sourcepaths that contribute to the digest.
+DIGEST_SOURCEPATH_KEYS = ('transpile_sourcepath', 'bundle_sourcepath')
+# the template for the filename of the record for an export target.
+ARTIFACT_RECORD_FILENAME = 'calmjs_sassy-%s.json'
+# the name of the digest store within the cache directory.
+DIGEST_STORE_FILENAME = 'digests.sqlite'
+# the files at least this size will be read through a memory map.
+MMAP_THRESHOLD = 1 << 20
+# the maximum number of paths looked up by a single query.
+DIGEST_STORE_BATCH = 500
+# the files modified within this many seconds before they were examined
+# may be modified again within the resolution of the modification time
+# without it changing, so their digests are not stored.
+DIGEST_STORE_RACY_SECONDS = 2
+
+
+def file_digest(path, blocksize=65536):
+    """
+    Return the sha1 hexdigest of the contents of the file at path.
+    """
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as fd:
+        if os.fstat(fd.fileno()).st_size >= MMAP_THRESHOLD:
+            try:
+                mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):
+                # fall back to the reads below.
+                pass
+            else:
+                try:
+                    h.update(mapped)
+                finally:
+                    mapped.close()
+                return h.hexdigest()
+        for block in iter(lambda: fd.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _stat_key(st):
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:  # pragma: no cover
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return (st.st_ino, st.st_size, mtime_ns)
+
+
+class DigestStore(object):
+    """
+    A persistent store of the digests of the files within a SQLite
+    database, keyed by the path to the file with its inode number, size
+    and modification time (in nanoseconds), such that the digests of the
+    unchanged files can be acquired without reading their contents.
+    Instances may be used from multiple threads, and the database may be
+    shared by multiple processes.
+
+    Arguments:
+
+    path
+        The path to the SQLite database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._conn = None
+        self._disabled = False
+
+    def _connect(self):
+        if self._conn is None:
+            ensure_dir(dirname(self.path))
+            conn = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS digests ('
+                'path TEXT PRIMARY KEY, inode INTEGER NOT NULL, '
+                'size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+                'digest TEXT NOT NULL)'
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, f):
+        # only the errors from the store are handled here, so that the
+        # digests can still be computed with the store unavailable.
+        with self.lock:
+            if self._disabled:
+                return None
+            try:
+                return f(self._connect())
+            except (sqlite3.Error, EnvironmentError) as e:
+                logger.warning(
+                    "digest store '%s' is unavailable: %s", self.path, e)
+                self._disabled = True
+                self.close()
+                return None
+
+    def _lookup(self, paths):
+        def lookup(conn):
+            results = {}
+            for idx in range(0, len(paths), DIGEST_STORE_BATCH):
+                batch = paths[idx:idx + DIGEST_STORE_BATCH]
+                results.update(
+                    (row[0], (tuple(row[1:4]), row[4]))
+                    for row in conn.execute(
+                        'SELECT path, inode, size, mtime_ns, digest FROM '
+                        'digests WHERE path IN (%s)' % ','.join(
+                            '?' * len(batch)), batch)
+                )
+            return results
+        return self._execute(lookup) or {}
+
+    def _update(self, rows):
+        def update(conn):
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO digests '
+                    '(path, inode, size, mtime_ns, digest) '
+                    'VALUES (?, ?, ?, ?, ?)', rows)
+        self._execute(update)
+
+    def digests(self, paths):
+        """
+        Return a mapping of the paths to the sha1 hexdigest of the files
+        at those paths, looked up in batches, with the digests computed
+        for the files that are not in the store or changed since.  The
+        paths to the files that cannot be read are omitted.
+        """
+
+        stats = {}
+        for path in paths:
+            try:
+                stats[path] = os.stat(path)
+            except (IOError, OSError):
+                continue
+
+        known = self._lookup(sorted(stats))
+        now = time.time()
+        results = {}
+        rows = []
+        for path, st in stats.items():
+            key = _stat_key(st)
+            record = known.get(path)
+            if record is not None and record[0] == key:
+                results[path] = record[1]
+                continue
+            try:
+                results[path] = file_digest(path)
+            except (IOError, OSError):
+                continue
+            if now - st.st_mtime >= DIGEST_STORE_RACY_SECONDS:
+                rows.append((path,) + key + (results[path],))
+
+        if rows:
+            self._update(rows)
+        logger.debug(
+            "digest store '%s' provided %d of %d digests", self.path,
+            len(results) - len(rows), len(results))
+        return results
+
+    def digest(self, path):
+        """
+        Return the sha1 hexdigest of the file at path, which will raise
+        IOError if the file cannot be read.
+        """
+
+        result = self.digests([path]).get(path)
+        if result is None:
+            return file_digest(path)
+        return result
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# the digest stores shared within the process, by their paths.
+_digest_stores = {}
+_digest_stores_lock = threading.Lock()
+
+
+def get_digest_store(cache_dir):
+    """
+    Return the DigestStore for the cache directory, which is shared by
+    all the users of the same cache directory within the process.
+    """
+
+    path = normcase(abspath(join(cache_dir, DIGEST_STORE_FILENAME)))
+    with _digest_stores_lock:
+        store = _digest_stores.get(path)
+        if store is None:
+            store = _digest_stores[path] = DigestStore(path)
+        return store
+
+
+def spec_digest_store(spec):
+    """
+    Return the DigestStore for the cache directory specified by the
+    spec, or None if it did not specify one.
+    """
+
+    cache_dir = spec.get(CALMJS_SASSY_CACHE_DIR)
+    return get_digest_store(cache_dir) if cache_dir else None
+
+
+def _iter_files(path):
+    if not isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            yield join(root, name)
+
+
+def _update_path(h, path, digests):
+    h.update(path.encode('utf8'))
+    try:
+        h.update((digests.get(path) or file_digest(path)).encode('utf8'))
+    except (IOError, OSError) as e:
+        # the missing file will be reported by the toolchain.
+        h.update(('error:%s' % e.errno).encode('utf8'))
+
+
+def libsass_versions():
+    """
+    Return the list of the versions of the libsass package and the
+    libsass library it was built with, or an empty list if it is not
+    installed.
+    """
+
+    try:
+        import sass
+    except ImportError:  # pragma: no cover
+        return []
+    return [sass.__version__, getattr(sass, 'libsass_version', '')]
+
+
+def spec_input_digest(spec, output_style, store=None):
+    """
+    Return the digest of the inputs that will affect the output produced
+    from the spec, which are the contents of the files referenced by the
+    sourcepaths, the entry points, the assemble method, the named
+    post-processors and their configuration, the handling of the assets,
+    the compilation as fragments, the compression of the export, the
+    import targets to be stubbed out, the provided output style and the
+    version of libsass.  The digests
+    of the files are acquired through the store, which defaults to the
+    one for the cache directory specified by the spec, if any.
+    """
+
+    # as the assets and fragments modules make use of the digests.
+    from calmjs.sassy.assets import CALMJS_SASSY_COPY_ASSETS
+    from calmjs.sassy.assets import CALMJS_SASSY_INLINE_ASSETS_THRESHOLD
+    from calmjs.sassy.fragments import CALMJS_SASSY_FRAGMENTS
+    from calmjs.sassy.fragments import CALMJS_SASSY_FRAGMENTS_EXCLUDE
+
+    merged = spec.get(CALMJS_SASSY_SOURCEPATH_MERGED)
+    if hasattr(merged, 'digest_key'):
+        # the lazily resolved mapping cannot be listed.
+        merged = merged.digest_key()
+    else:
+        merged = sorted(merged or ())
+
+    h = hashlib.sha1()
+    h.update(json.dumps([
+        spec.get(CALMJS_SASSY_ENTRY_POINTS),
+        spec.get(CALMJS_SASSY_ASSEMBLE_METHOD),
+        [
+            postprocessor.cache_token() if hasattr(
+                postprocessor, 'cache_token') else postprocessor
+            for postprocessor in spec.get(CALMJS_SASSY_POSTPROCESSORS) or ()
+        ],
+        spec.get(CALMJS_SASSY_POSTPROCESSOR_CONFIGS),
+        bool(spec.get(CALMJS_SASSY_COPY_ASSETS)),
+        spec.get(CALMJS_SASSY_INLINE_ASSETS_THRESHOLD),
+        bool(spec.get(CALMJS_SASSY_FRAGMENTS)),
+        sorted(spec.get(CALMJS_SASSY_FRAGMENTS_EXCLUDE) or ()),
+        bool(spec.get(CALMJS_SASSY_EXPORT_GZIP)),
+        merged,
+        output_style,
+        libsass_versions(),
+    ], sort_keys=True).encode('utf8'))
+    entries = []
+    for key in DIGEST_SOURCEPATH_KEYS:
+        sourcepaths = spec.get(key) or {}
+        entries.extend(
+            (modname, list(_iter_files(sourcepaths[modname])))
+            for modname in sorted(sourcepaths)
+        )
+
+    store = store or spec_digest_store(spec)
+    digests = store.digests(
+        [path for modname, paths in entries for path in paths]
+    ) if store else {}
+    for modname, paths in entries:
+        h.update(modname.encode('utf8'))
+        for path in paths:
+            _update_path(h, path, digests)
+    return h.hexdigest()
+
+
+def _export_target_key(export_target):
+    return normcase(realpath(export_target))
+
+
+def artifact_record_path(export_target, record_dir=None):
+    """
+    Return the path of the record for the export target within the
+    record directory, which defaults to the temporary directory.
+    """
+
+    return join(record_dir or gettempdir(), ARTIFACT_RECORD_FILENAME % (
+        hashlib.sha1(_export_target_key(export_target).encode(
+            'utf8')).hexdigest()))
+
+
+def read_artifact_record(export_target, record_dir=None):
+    """
+    Return the record for the export target from the record directory,
+    or None if not available.
+    """
+
+    path = artifact_record_path(export_target, record_dir)
+    try:
+        with codecs.open(path, encoding='utf8') as fd:
+            record = json.load(fd)
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            logger.warning("failed to read artifact record '%s': %s", path, e)
+    except ValueError as e:
+        logger.warning("artifact record '%s' is corrupted: %s", path, e)
+    else:
+        if isinstance(record, dict):
+            return record
+        logger.warning("artifact record '%s' is corrupted", path)
+    return None
+
+
+def write_artifact_record(
+        export_target, digest, target_digest=None, record_dir=None):
+    """
+    Write the input digest as the record for the export target into the
+    record directory.
+
+    Arguments:
+
+    export_target
+        The path to the artifact.
+    digest
+        The digest of the inputs the artifact was produced from.
+    target_digest
+        The digest of the artifact; computed if not provided.
+    record_dir
+        The directory for the record, typically the cache directory.
+        Defaults to the temporary directory.
+    """
+
+    path = artifact_record_path(export_target, record_dir)
+    if record_dir:
+        ensure_dir(record_dir)
+    with codecs.open(path, 'w', encoding='utf8') as fd:
+        json.dump({
+            'digest': digest,
+            'target': _export_target_key(export_target),
+            'target_digest': target_digest or file_digest(export_target),
+        }, fd, sort_keys=True)
+    logger.debug(
+        "wrote artifact record '%s' for '%s'", path, export_target)
+
+
+def is_artifact_fresh(export_target, digest, record_dir=None):
+    """
+    Return True if the export target exists and was produced from the
+    inputs with the provided digest, as recorded by its record within
+    the record directory.
+    """
+
+    record = read_artifact_record(export_target, record_dir)
+    if not record or record.get('digest') != digest or (
+            record.get('target') != _export_target_key(export_target)):
+        return False
+    try:
+        # ensure the artifact was not modified after it was written.
+        return file_digest(export_target) == record.get('target_digest')
+    except (IOError, OSError):
+        return False
@@ -14,11 +14,17 @@ integrated Node.js tooling should be able to pick those up.
 """
 
 import logging
+import threading
+from functools import wraps
 from os.path import join
 from os.path import isdir
+from calmjs.base import BaseModuleRegistry
 from calmjs.registry import get
 from calmjs import dist
 
+from calmjs.sassy import metadata
+from calmjs.sassy.registry import SCSSRegistry
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,6 +32,41 @@ def map_none(*a, **kw):
     return {}
 
 
+def use_metadata_working_set(f, pos=0, registry_name=None):
+    """
+    Wrap the helper function f from calmjs.dist such that the lookup of
+    the distributions will be done through importlib.metadata, where
+    the default working set would have been used.
+
+    Arguments:
+
+    f
+        The helper function, which accepts the working_set argument.
+    pos
+        The position of the working_set argument after the package
+        names, if it may be provided as a positional argument.
+    registry_name
+        The default registry name for the helper functions that look up
+        the records by the names of the distributions; the lookup will
+        only be done through importlib.metadata for the SCSSRegistry,
+        as the other registries have the records keyed by the names
+        provided by pkg_resources.
+    """
+
+    def uses_scss_registry(a, kw):
+        return registry_name is None or isinstance(get(
+            a[0] if a else kw.get('registry_name', registry_name)),
+            SCSSRegistry)
+
+    @wraps(f)
+    def wrapper(pkg_names, *a, **kw):
+        if len(a) <= pos and uses_scss_registry(a, kw):
+            kw['working_set'] = metadata.working_set_for(
+                kw.get('working_set') or dist.default_working_set)
+        return f(pkg_names, *a, **kw)
+    return wrapper
+
+
 CALMJS_SCSS_MODULE_REGISTRY_FIELD = 'calmjs_scss_module_registry'
 CALMJS_SCSS_REGISTRY = 'calmjs.scss'
 EXTRAS_CALMJS_SCSS_FIELD = 'extras_calmjs_scss'
@@ -34,15 +75,30 @@ EXTRAS_CALMJS_SCSS_FIELD = 'extras_calmjs_scss'
     flatten_parents_extras_calmjs_scss, write_extras_calmjs_scss) = (
         dist.build_helpers_egginfo_json(
             EXTRAS_CALMJS_SCSS_FIELD, dist.JSON_EXTRAS_REGISTRY_KEY))
+get_extras_calmjs_scss = use_metadata_working_set(get_extras_calmjs_scss)
+flatten_extras_calmjs_scss = use_metadata_working_set(
+    flatten_extras_calmjs_scss)
+flatten_parents_extras_calmjs_scss = use_metadata_working_set(
+    flatten_parents_extras_calmjs_scss)
 
 (get_module_registry_names, flatten_module_registry_names,
     write_module_registry_names) = dist.build_helpers_module_registry_name(
         CALMJS_SCSS_MODULE_REGISTRY_FIELD)
+get_module_registry_names = use_metadata_working_set(
+    get_module_registry_names)
+flatten_module_registry_names = use_metadata_working_set(
+    flatten_module_registry_names)
 
 (get_module_registry_dependencies, flatten_module_registry_dependencies,
     flatten_parents_module_registry_dependencies) = (
         dist.build_helpers_module_registry_dependencies(
             registry_name=CALMJS_SCSS_REGISTRY))
+flatten_module_registry_dependencies = use_metadata_working_set(
+    flatten_module_registry_dependencies, pos=1,
+    registry_name=CALMJS_SCSS_REGISTRY)
+flatten_parents_module_registry_dependencies = use_metadata_working_set(
+    flatten_parents_module_registry_dependencies, pos=1,
+    registry_name=CALMJS_SCSS_REGISTRY)
 
 module_registry_methods = {
     'all': flatten_module_registry_names,
@@ -55,6 +111,8 @@ sourcepath_methods_map = {
     'none': map_none,
 }
 
+sourcepath_merged_methods = ('all', 'lazy')
+
 bundle_sourcepath_methods_map = {
     'all': flatten_extras_calmjs_scss,
     'explicit': get_extras_calmjs_scss,
@@ -150,3 +208,268 @@ def generate_scss_bundle_sourcepaths(
             bundle_sourcepaths[k] = join(basedir, *(v.split('/')))
 
     return bundle_sourcepaths
+
+
+# the registries restricted to the packages of a dependency graph, keyed
+# by the registry name and the keys of the distributions.
+_dependencies_registries = {}
+# guards the restricted registries.
+_dependencies_registries_lock = threading.Lock()
+
+
+class _DistributionsWorkingSet(object):
+    """
+    A view of the working set that only provides the entry points from
+    the named distributions.
+    """
+
+    def __init__(self, working_set, keys):
+        self.working_set = working_set
+        self.keys = set(keys)
+
+    def iter_entry_points(self, group, name=None):
+        for entry_point in self.working_set.iter_entry_points(group, name):
+            if entry_point.dist is not None and (
+                    entry_point.dist.key in self.keys):
+                yield entry_point
+
+
+def get_dependencies_registry(registry_name, dists, working_set):
+    """
+    Return the module registry for registry_name with only the entry
+    points provided by the distributions registered, such that the
+    modules of the unrelated packages are never scanned.  The registry
+    from calmjs.registry is returned instead if it was already created,
+    or if the registry is not an SCSSRegistry.
+
+    Arguments:
+
+    registry_name
+        The name of the module registry.
+    dists
+        The distributions, as resolved for the dependency graph of some
+        packages.
+    working_set
+        The working set the distributions were resolved from.
+    """
+
+    root = get('calmjs.registry')
+    if registry_name in root.records:
+        return root.records[registry_name]
+
+    cls = None
+    for entry_point in working_set.iter_entry_points(
+            'calmjs.registry', registry_name):
+        try:
+            cls = entry_point.resolve()
+        except ImportError:
+            logger.debug("ImportError '%s'", entry_point)
+        break
+    if not (isinstance(cls, type) and issubclass(cls, SCSSRegistry)):
+        return get(registry_name)
+
+    keys = tuple(sorted(d.key for d in dists))
+    with _dependencies_registries_lock:
+        registry = _dependencies_registries.get((registry_name, keys))
+        if registry is None:
+            logger.debug(
+                "creating registry '%s' restricted to the packages %r",
+                registry_name, [d.project_name for d in dists])
+            registry = _dependencies_registries[(registry_name, keys)] = cls(
+                registry_name, _working_set=_DistributionsWorkingSet(
+                    working_set, keys))
+    return registry
+
+
+def find_dependencies_dists(package_names, working_set=None):
+    """
+    Return a 2-tuple of the working set used along with the list of the
+    distributions for the dependency graph of the packages, with the
+    packages themselves last.
+    """
+
+    working_set = metadata.working_set_for(
+        working_set or dist.default_working_set)
+    return working_set, dist.find_packages_requirements_dists(
+        package_names, working_set=working_set)
+
+
+def generate_dependencies_scss_sourcepaths(
+        package_names, registries=(CALMJS_SCSS_REGISTRY,), working_set=None):
+    """
+    Acquire the sourcepaths provided by the packages themselves, as per
+    the 'explicit' method of generate_scss_sourcepaths, but through the
+    registries restricted to the dependency graph of the packages.
+    """
+
+    working_set, dists = find_dependencies_dists(package_names, working_set)
+    sourcepaths = {}
+    for registry_name in registries:
+        registry = get_dependencies_registry(registry_name, dists, working_set)
+        if not isinstance(registry, BaseModuleRegistry):
+            continue
+        for package_name in package_names:
+            sourcepaths.update(registry.get_records_for_package(package_name))
+    return sourcepaths
+
+
+def registered_module_roots(registry_names):
+    """
+    Return the sorted list of the directories scanned for the modules
+    registered to the SCSS registries of the provided names, for the
+    registries that have been created so far (including the ones
+    restricted to the dependency graph of some packages).
+    """
+
+    registries = [
+        get('calmjs.registry').records.get(name) for name in registry_names]
+    with _dependencies_registries_lock:
+        registries.extend(
+            registry
+            for (name, keys), registry in _dependencies_registries.items()
+            if name in registry_names
+        )
+    roots = set()
+    for registry in registries:
+        for paths in getattr(registry, 'scanned', {}).values():
+            roots.update(root for root, listing in paths)
+    return sorted(roots)
+
+
+class LazyModuleRegistrySourcepaths(object):
+    """
+    A read-only mapping of module names to sourcepaths, where the values
+    are resolved on demand from the records of the provided module
+    registries and then cached, instead of being computed upfront by
+    traversing through the dependency graph of some packages.
+
+    Only the records for the packages within the dependency graph of
+    the provided packages will be resolved, with the same precedence as
+    the 'all' sourcepath method; the registries are restricted to those
+    packages (as per get_dependencies_registry) and only created once a
+    module name is looked up, such that the modules provided by the
+    unrelated packages will never be scanned.
+
+    As the module names are not known until they are looked up, this
+    cannot be iterated or sized; a TypeError is raised instead.
+    """
+
+    def __init__(
+            self, registry_names, package_names, extras=None,
+            working_set=None):
+        """
+        Arguments:
+
+        registry_names
+            The names of the module registries to resolve from.
+        package_names
+            The names of the packages for the dependency graph.
+        extras
+            An optional mapping of module names to sourcepaths that will
+            be checked first.
+        working_set
+            The working set to resolve the dependency graph from;
+            defaults to the one used by calmjs.dist.
+        """
+
+        self.registry_names = list(registry_names or ())
+        self.package_names = list(package_names or ())
+        self.extras = dict(extras or {})
+        self.working_set = working_set
+        self._cache = {}
+        # list of 2-tuples of the registry and the package names, with
+        # the highest precedence first.
+        self._sources = None
+        # the records of each package, keyed by the registry name and
+        # the package name.
+        self._records = {}
+
+    def _iter_sources(self):
+        if self._sources is None:
+            working_set, dists = find_dependencies_dists(
+                self.package_names, self.working_set)
+            self._sources = []
+            for registry_name in reversed(self.registry_names):
+                registry = get_dependencies_registry(
+                    registry_name, dists, working_set)
+                if isinstance(registry, BaseModuleRegistry):
+                    self._sources.append((registry, [
+                        d.project_name for d in reversed(dists)]))
+        return iter(self._sources)
+
+    def _resolve(self, modname):
+        if modname in self.extras:
+            return self.extras[modname]
+        try:
+            return self._cache[modname]
+        except KeyError:
+            pass
+
+        result = None
+        for registry, package_names in self._iter_sources():
+            for package_name in package_names:
+                key = (registry.registry_name, package_name)
+                if key not in self._records:
+                    self._records[key] = registry.get_records_for_package(
+                        package_name)
+                result = self._records[key].get(modname)
+                if result is not None:
+                    break
+            if result is not None:
+                break
+
+        logger.debug(
+            "lazily resolved '%s' from registries %r to %r",
+            modname, self.registry_names, result)
+        self._cache[modname] = result
+        return result
+
+    def __contains__(self, modname):
+        return self._resolve(modname) is not None
+
+    def __getitem__(self, modname):
+        result = self._resolve(modname)
+        if result is None:
+            raise KeyError(modname)
+        return result
+
+    def get(self, modname, default=None):
+        result = self._resolve(modname)
+        return default if result is None else result
+
+    def __bool__(self):
+        # always considered to have contents, as they are not known
+        # until they are looked up.
+        return True
+
+    __nonzero__ = __bool__
+
+    def digest_key(self):
+        """
+        Return a JSON serializable value for the digest of the inputs,
+        derived from the arguments that define this mapping.
+        """
+
+        return [
+            self.registry_names,
+            self.package_names,
+            sorted(self.extras.items()),
+        ]
+
+    def _unlisted(self):
+        return TypeError(
+            "'%s' only supports the lookup of module names, as they are "
+            "not known until they are looked up" % type(self).__name__)
+
+    def __iter__(self):
+        raise self._unlisted()
+
+    def __len__(self):
+        raise self._unlisted()
+
+    def keys(self):
+        raise self._unlisted()
+
+    def __repr__(self):
+        return '<%s.%s for registries %r>' % (
+            type(self).__module__, type(self).__name__, self.registry_names)
@@ -6,3 +6,21 @@ Exceptions specific for this module.
 
 class CalmjsSassyRuntimeError(RuntimeError):
     """calmjs.sassy runtime error"""
+
+
+class CalmjsSassyCompileError(CalmjsSassyRuntimeError):
+    """
+    calmjs.sassy compile error, with the location of the error mapped
+    back to the module that caused it.
+    """
+
+    def __init__(
+            self, message, modname=None, sourcepath=None, line=None,
+            column=None, locations=(), diagnostics=None):
+        super(CalmjsSassyCompileError, self).__init__(message)
+        self.modname = modname
+        self.sourcepath = sourcepath
+        self.line = line
+        self.column = column
+        self.locations = list(locations)
+        self.diagnostics = diagnostics
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Fingerprinting of the Python environment, for the invalidation of any
+data derived from it.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+from os import stat
+
+from calmjs import dist
+
+from calmjs.sassy.dist import CALMJS_SCSS_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+def _working_set():
+    # always look up the attribute so that a replaced working set (e.g.
+    # one constructed for testing) is respected.
+    return dist.default_working_set
+
+
+def _sorted_dists(working_set):
+    return sorted(working_set, key=lambda d: (
+        d.project_name, d.location or ''))
+
+
+def _egg_info_mtime(d):
+    egg_info = getattr(d, 'egg_info', None)
+    if not egg_info:
+        return None
+    try:
+        return stat(egg_info).st_mtime
+    except OSError:
+        return None
+
+
+def environment_fingerprint(
+        working_set=None, registry_names=(CALMJS_SCSS_REGISTRY,)):
+    """
+    Return a hex digest that will change whenever a package is
+    installed, upgraded or removed, or when any of the entry points for
+    the provided registries changed.  This is computed from the project
+    name, version, location and the modification time of the metadata
+    directory for every distribution within the working set, plus the
+    entry points declared for the registries.
+
+    Any data derived from the environment should be keyed on this
+    value such that it may be safely invalidated.
+
+    Arguments:
+
+    working_set
+        The working set to fingerprint.  Defaults to the working set
+        used by calmjs.dist.
+    registry_names
+        The names of the registries to include the entry points from.
+        Defaults to the calmjs.scss registry.
+    """
+
+    working_set = _working_set() if working_set is None else working_set
+    h = hashlib.sha1()
+    dists = _sorted_dists(working_set)
+    for d in dists:
+        h.update(('%s\0%s\0%s\0%r\n' % (
+            d.project_name, d.version, d.location, _egg_info_mtime(d),
+        )).encode('utf8'))
+    for registry_name in registry_names:
+        h.update(('[%s]\n' % registry_name).encode('utf8'))
+        for d in dists:
+            for name, ep in sorted(d.get_entry_map(registry_name).items()):
+                h.update(('%s\0%s\n' % (
+                    d.project_name, ep)).encode('utf8'))
+    result = h.hexdigest()
+    logger.debug(
+        "computed environment fingerprint '%s' from %d distributions",
+        result, len(dists))
+    return result
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Compilation of the entry points as separate fragments.
+
+Where the entry points do not depend on each other (e.g. through the
+variables or mixins defined by an earlier entry point), each of them
+may be compiled on its own, with the result cached under the digest of
+all the files it may import.  The export target is then produced by
+concatenating the fragments in the order of the entry points, such that
+only the entry points with changed inputs will need to be compiled.
+
+As an entry point that compiles on its own may still produce a different
+result when compiled along with the others (e.g. a variable declared
+with ``!default`` that an earlier entry point has set, or an ``@extend``
+of a selector from another entry point), the sources are analysed for
+such dependencies beforehand, with the entry points compiled together
+if any are found.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import hashlib
+import json
+import logging
+import os
+import re
+from os.path import exists
+from os.path import join
+from os.path import relpath
+
+from calmjs.sassy.digest import file_digest
+from calmjs.sassy.graph import parse_all_imports
+from calmjs.sassy.graph import read_source
+from calmjs.sassy.graph import resolve_import_path
+from calmjs.sassy.graph import strip_comments
+from calmjs.sassy.output import FileSink
+from calmjs.sassy.output import ensure_dir
+
+logger = logging.getLogger(__name__)
+
+# spec key for enabling the compilation of the entry points as separate
+# fragments; requires the cache directory to be specified.
+CALMJS_SASSY_FRAGMENTS = 'calmjs_sassy_fragments'
+# spec key for the list of the entry points that must not be compiled
+# separately (e.g. as they make use of the variables defined by other
+# entry points); if any of the entry points is listed, all of them will
+# be compiled together.
+CALMJS_SASSY_FRAGMENTS_EXCLUDE = 'calmjs_sassy_fragments_exclude'
+
+# the subdirectory within the cache directory for the fragments.
+FRAGMENT_CACHE_SUBDIR = 'fragments'
+
+_VARIABLE = re.compile(r'\$([\w-]+)')
+_VARIABLE_DECLARATION = re.compile(r'\$([\w-]+)\s*:([^;{}]*)')
+# the headers that declare the variables they contain.
+_DECLARING_HEADER = re.compile(r'@(?:mixin|function|each|for)\b[^{;]*')
+_MIXIN = re.compile(r'@mixin\s+([\w-]+)')
+_FUNCTION = re.compile(r'@function\s+([\w-]+)')
+_INCLUDE = re.compile(r'@include\s+([\w-]+)')
+_CALL = re.compile(r'(?<![\w$@%.#-])([\w-]+)\(')
+_EXTEND = re.compile(r'@extend\s+([^;{}]*)')
+_SELECTOR = re.compile(r'[%.#][\w-]+')
+
+
+def iter_fragment_imports(modname, build_dir):
+    """
+    Yield the 2-tuple of the import target and the file within the build
+    directory it resolves to (or None if it cannot be resolved) for all
+    the imports that may be done by the entry point modname, with every
+    file yielded once.  Raises ValueError if the imports cannot be
+    determined, such as when they involve interpolation.
+    """
+
+    visited = set()
+    pending = [(modname, None)]
+    while pending:
+        target, importer = pending.pop()
+        if '#{' in target:
+            raise ValueError(
+                "import target '%s' involves interpolation" % target)
+        path = resolve_import_path(target, importer, [build_dir])
+        if path is None:
+            yield target, None
+            continue
+        if path in visited:
+            continue
+        visited.add(path)
+        yield target, path
+        pending.extend(
+            (t, path) for t in reversed(parse_all_imports(read_source(path))))
+
+
+def scan_symbols(source):
+    """
+    Heuristically scan the source for the symbols it defines and uses,
+    and return a mapping with the sets of the symbols as the values for
+    the following keys:
+
+    defined
+        The symbols defined.
+    used
+        The symbols used.
+    defaults
+        The variables declared with ``!default``, i.e. may be defined
+        beforehand.
+    extended
+        The selectors extended.
+    selectors
+        The selectors present.
+
+    Variables are denoted by the leading '$', mixins and functions by
+    the leading '@mixin ' and '@function '.
+    """
+
+    source = strip_comments(source)
+    symbols = {
+        'defined': set(),
+        'used': set('$' + name for name in _VARIABLE.findall(source)),
+        'defaults': set(),
+        'extended': set(
+            selector for value in _EXTEND.findall(source)
+            for selector in _SELECTOR.findall(value)
+        ),
+        'selectors': set(_SELECTOR.findall(source)),
+    }
+    for name, value in _VARIABLE_DECLARATION.findall(source):
+        symbols['defined'].add('$' + name)
+        if '!default' in value:
+            symbols['defaults'].add('$' + name)
+    for header in _DECLARING_HEADER.findall(source):
+        symbols['defined'].update(
+            '$' + name for name in _VARIABLE.findall(header))
+    symbols['defined'].update(
+        '@mixin ' + name for name in _MIXIN.findall(source))
+    symbols['defined'].update(
+        '@function ' + name for name in _FUNCTION.findall(source))
+    symbols['used'].update(
+        '@mixin ' + name for name in _INCLUDE.findall(source))
+    symbols['used'].update(
+        '@function ' + name for name in _CALL.findall(source))
+    return symbols
+
+
+def _collect_symbols(scanned, paths, key):
+    return set().union(*(scanned[path][key] for path in paths))
+
+
+def find_fragment_dependencies(entry_points, build_dir):
+    """
+    Return a 2-tuple of the first entry point that may depend on the
+    other entry points, along with the sorted list of the symbols (or
+    the extended selectors, prefixed by '@extend ') it may depend on;
+    the list will be empty if its imports cannot be determined.  Return
+    None if every entry point may be compiled on its own.
+
+    An entry point is considered to depend on the others if it uses a
+    symbol (or declares a variable with ``!default``) not defined within
+    the files it imports, but which is defined within the files only
+    imported by the other entry points, or if it extends a selector
+    present within those files.
+    """
+
+    scanned = {}
+    closures = []
+    for modname in entry_points:
+        try:
+            paths = set(
+                path for target, path in iter_fragment_imports(
+                    modname, build_dir) if path)
+        except ValueError:
+            return modname, []
+        for path in paths:
+            if path not in scanned:
+                scanned[path] = scan_symbols(read_source(path))
+        closures.append((modname, paths))
+
+    for modname, paths in closures:
+        others = set().union(*(
+            other for name, other in closures if name != modname)) - paths
+        undefined = (
+            _collect_symbols(scanned, paths, 'used') -
+            _collect_symbols(scanned, paths, 'defined')
+        ) | _collect_symbols(scanned, paths, 'defaults')
+        extended = _collect_symbols(scanned, paths, 'extended')
+        dependencies = sorted(
+            (undefined & _collect_symbols(scanned, others, 'defined')) |
+            set('@extend ' + selector for selector in (
+                extended & _collect_symbols(scanned, others, 'selectors')))
+        )
+        if dependencies:
+            return modname, dependencies
+    return None
+
+
+def fragment_digest(modname, build_dir, extras=(), is_stubbed=None):
+    """
+    Return the digest of all the files within the build directory that
+    may be imported by the entry point modname, along with the extras.
+    Returns None if the files cannot be determined, such as when the
+    imports involve interpolation.
+
+    Arguments:
+
+    modname
+        The entry point.
+    build_dir
+        The build directory.
+    extras
+        A JSON serializable value for the other inputs that affect the
+        output, such as the output style.
+    is_stubbed
+        A function that returns whether the import target that cannot
+        be resolved will be stubbed out.
+    """
+
+    h = hashlib.sha1(json.dumps(
+        [modname, extras], sort_keys=True).encode('utf8'))
+    try:
+        for target, path in iter_fragment_imports(modname, build_dir):
+            if path is None:
+                h.update(('unresolved:%s:%s\n' % (target, bool(
+                    is_stubbed and is_stubbed(target)))).encode('utf8'))
+                continue
+            h.update(('%s:%s\n' % (
+                relpath(path, build_dir).replace(os.sep, '/'),
+                file_digest(path),
+            )).encode('utf8'))
+    except ValueError:
+        return None
+    return h.hexdigest()
+
+
+class FragmentCache(object):
+    """
+    The cache of the compiled fragments within the cache directory.
+    """
+
+    def __init__(self, cache_dir):
+        self.root = join(cache_dir, FRAGMENT_CACHE_SUBDIR)
+
+    def path(self, digest):
+        return join(self.root, digest + '.css')
+
+    def get(self, digest):
+        """
+        Return the cached fragment for the digest, or None.
+        """
+
+        if digest is None or not exists(self.path(digest)):
+            return None
+        with codecs.open(self.path(digest), encoding='utf8') as fd:
+            return fd.read()
+
+    def put(self, digest, css):
+        if digest is None:
+            return
+        ensure_dir(self.root)
+        sink = FileSink(self.path(digest))
+        sink.write(css)
+        sink.close()
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for the analysis of the import graph of SCSS modules.
+
+Only the top level (i.e. not nested within a block) ``@import``
+statements are considered for the import graph, as nested imports have
+their rules scoped within the block that imported them and thus cannot
+be shared.  The determination of the reachable modules considers all
+import statements.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import logging
+import posixpath
+import re
+from os.path import basename
+from os.path import dirname
+from os.path import isdir
+from os.path import isfile
+from os.path import join
+from os.path import normpath
+
+logger = logging.getLogger(__name__)
+
+# top level import statements must start at the first column.
+_IMPORT_LINE = re.compile(
+    r'^@import[ \t]+(?P<targets>[^;\n]*);[ \t]*$', re.M)
+# any import statements, including the nested ones.
+_ANY_IMPORT = re.compile(
+    r'@import[ \t\n]+(?P<targets>(?:[^;{}]|#\{[^}]*\})*);')
+_IMPORT_TARGET = re.compile(r'''\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)')\s*''')
+_BLOCK_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_LINE_COMMENT = re.compile(r'''^([^'"\n]*?)//[^\n]*$''', re.M)
+_RULE_DEFINITIONS = re.compile(r'@(?:mixin|function)\b[^{]*\{')
+
+# extensions for files that the import statement may resolve to.
+SCSS_IMPORT_EXTENSIONS = ('.scss',)
+
+
+def strip_comments(source):
+    """
+    Remove comments from the provided source, while retaining the line
+    numbers.
+    """
+
+    source = _BLOCK_COMMENT.sub(
+        lambda m: '\n' * m.group(0).count('\n'), source)
+    return _LINE_COMMENT.sub(r'\1', source)
+
+
+def is_css_import(target):
+    """
+    Return True if the import target will be treated as a plain CSS
+    import by the compiler, which will not be handled by the importer.
+    """
+
+    return (
+        target.endswith('.css') or
+        target.startswith(('http://', 'https://', '//')) or
+        target.startswith('url(')
+    )
+
+
+def parse_import_targets(statement):
+    """
+    Parse the targets within an import statement (without the leading
+    ``@import`` and the trailing ``;``).  Returns None if the statement
+    is not a simple list of quoted strings (e.g. with media queries or
+    with url() functions).
+    """
+
+    targets = []
+    for fragment in statement.split(','):
+        match = _IMPORT_TARGET.match(fragment)
+        if not match or match.end() != len(fragment):
+            return None
+        targets.append(match.group('dq') or match.group('sq') or '')
+    return targets
+
+
+def iter_import_statements(source):
+    """
+    Yield a 2-tuple of the regex match for every top level import
+    statement within the source along with the list of targets, for
+    the statements that may be fully understood.  The source provided
+    should have its comments already stripped.
+    """
+
+    for match in _IMPORT_LINE.finditer(source):
+        targets = parse_import_targets(match.group('targets'))
+        if targets is not None:
+            yield match, targets
+
+
+def parse_imports(source):
+    """
+    Return the list of import targets for the top level import
+    statements within the source, excluding plain CSS imports.
+    """
+
+    return [
+        target
+        for match, targets in iter_import_statements(strip_comments(source))
+        for target in targets if not is_css_import(target)
+    ]
+
+
+def read_source(path):
+    with codecs.open(path, encoding='utf8') as fd:
+        return fd.read()
+
+
+def resolve_import_path(target, importer_path, include_paths):
+    """
+    Resolve the import target into a file on the filesystem, following
+    the rules used by the compiler: first relative to the importing
+    file, then relative to each of the include paths; the target may
+    refer to the partial (prefixed with a '_') variant of the file.
+    Returns None if not found.
+    """
+
+    bases = [dirname(importer_path)] if importer_path else []
+    bases.extend(include_paths)
+    frags = target.split('/')
+    for base in bases:
+        stem = join(base, *frags)
+        if stem.endswith(SCSS_IMPORT_EXTENSIONS) and isfile(stem):
+            return normpath(stem)
+        for ext in SCSS_IMPORT_EXTENSIONS:
+            for candidate in (
+                    stem + ext,
+                    join(dirname(stem), '_' + basename(stem) + ext)):
+                if isfile(candidate):
+                    return normpath(candidate)
+    return None
+
+
+def scss_source_emits_output(source):
+    """
+    Heuristically determine whether the provided source will produce
+    any CSS output on its own, i.e. whether it contains any blocks
+    other than mixin or function definitions or placeholder selectors.
+    """
+
+    source = strip_comments(source)
+    # remove the definitions, with their bodies.
+    while True:
+        match = _RULE_DEFINITIONS.search(source)
+        if not match:
+            break
+        depth = 1
+        idx = match.end()
+        while depth and idx < len(source):
+            if source[idx] == '{':
+                depth += 1
+            elif source[idx] == '}':
+                depth -= 1
+            idx += 1
+        source = source[:match.start()] + source[idx:]
+
+    for prelude in re.findall(r'(?:^|[;{}])\s*([^;{}]*)\{', source):
+        if not prelude.strip().startswith('%'):
+            return True
+    return False
+
+
+class ImportGraph(object):
+    """
+    The import graph of the top level import statements, starting from
+    the provided list of files.
+
+    Attributes:
+
+    order
+        The list of all reachable files in topological order, such that
+        every file only appears after all the files it imports.
+    imports
+        Mapping of a file to the list of files it imports that can be
+        resolved.
+    unresolved
+        Mapping of a file to the list of import targets it contains
+        that cannot be resolved.
+    importers
+        Mapping of a file to the list of files that imported it; for
+        the files provided as the starting points the value None will
+        be included in this list.
+    """
+
+    def __init__(self, paths, include_paths):
+        self.include_paths = list(include_paths)
+        self.order = []
+        self.imports = {}
+        self.unresolved = {}
+        self.importers = {}
+        for path in paths:
+            path = normpath(path)
+            self.importers.setdefault(path, []).append(None)
+            self._visit(path, [])
+
+    def _visit(self, path, stack):
+        if path in self.imports:
+            return
+        if path in stack:
+            logger.warning(
+                "import cycle detected: %s", ' -> '.join(stack + [path]))
+            return
+        stack.append(path)
+        resolved = []
+        unresolved = []
+        for target in parse_imports(read_source(path)):
+            target_path = resolve_import_path(
+                target, path, self.include_paths)
+            if target_path is None:
+                unresolved.append(target)
+                continue
+            resolved.append(target_path)
+            self.importers.setdefault(target_path, []).append(path)
+            self._visit(target_path, stack)
+        stack.pop()
+        self.imports[path] = resolved
+        self.unresolved[path] = unresolved
+        self.order.append(path)
+
+    def iter_shared(self):
+        """
+        Yield the files that were imported more than once.
+        """
+
+        for path in self.order:
+            if len(self.importers[path]) > 1:
+                yield path
+
+
+def strip_resolved_imports(source, importer_path, include_paths):
+    """
+    Return the source with all the top level import targets that can be
+    resolved removed from their import statements, where the statement
+    itself is removed if all its targets were removed.  Plain CSS
+    imports and unresolved imports are retained.
+    """
+
+    stripped = strip_comments(source)
+    # as the line numbers are retained, work with lines directly.
+    lines = source.splitlines(True)
+    for match, targets in iter_import_statements(stripped):
+        remaining = [
+            target for target in targets if is_css_import(target) or
+            resolve_import_path(target, importer_path, include_paths) is None
+        ]
+        if remaining == targets:
+            continue
+        lineno = stripped.count('\n', 0, match.start())
+        ending = '\n' if lines[lineno].endswith('\n') else ''
+        lines[lineno] = '@import %s;%s' % (', '.join(
+            '"%s"' % target for target in remaining), ending) if (
+                remaining) else ending
+    return ''.join(lines)
+
+
+def find_late_import(source, importer_path, include_paths):
+    """
+    Return the line number (starting from 1) of the first top level
+    import target that can be resolved but follows any other statement
+    or retained import target within the source, or None if all of them
+    lead the source.  Removing such a target for it to be imported
+    beforehand may change the result, e.g. if the imported module makes
+    use of a variable defined by the importer before the import.
+    """
+
+    stripped = strip_comments(source)
+    leading = True
+    pos = 0
+    for match in _IMPORT_LINE.finditer(stripped):
+        if stripped[pos:match.start()].strip():
+            leading = False
+        pos = match.end()
+        targets = parse_import_targets(match.group('targets'))
+        if targets is None:
+            leading = False
+            continue
+        for target in targets:
+            if is_css_import(target) or resolve_import_path(
+                    target, importer_path, include_paths) is None:
+                leading = False
+            elif not leading:
+                return stripped.count('\n', 0, match.start()) + 1
+    return None
+
+
+def parse_all_imports(source):
+    """
+    Return the list of import targets for all the import statements
+    within the source, including the nested ones, excluding the plain
+    CSS imports.  The targets of the statements that cannot be fully
+    understood are returned as they are.
+    """
+
+    results = []
+    for match in _ANY_IMPORT.finditer(strip_comments(source)):
+        targets = parse_import_targets(match.group('targets'))
+        if targets is None:
+            targets = [match.group('targets').strip()]
+        results.extend(
+            target for target in targets if not is_css_import(target))
+    return results
+
+
+class SourcepathLayout(object):
+    """
+    The layout of the build directory that will be produced by copying
+    the sourcepaths, for the resolution of the import targets to the
+    modules providing them before the copies are made.
+
+    Arguments:
+
+    targets
+        Mapping of the key for the sourcepath entry (i.e. the module
+        name) to a 2-tuple of the target path relative to the build
+        directory, and the sourcepath for it, which may be a directory.
+    """
+
+    def __init__(self, targets):
+        self.files = {}
+        self.dirs = []
+        for key, (target, source) in targets.items():
+            if isdir(source):
+                self.dirs.append((target.rstrip('/') + '/', key, source))
+            else:
+                self.files[posixpath.normpath(target)] = (key, source)
+        # longest prefix first.
+        self.dirs.sort(key=lambda item: -len(item[0]))
+
+    def _lookup(self, target):
+        if target in self.files:
+            return (target,) + self.files[target]
+        for prefix, key, source in self.dirs:
+            if target.startswith(prefix):
+                path = join(source, *target[len(prefix):].split('/'))
+                if isfile(path):
+                    return target, key, path
+        return None
+
+    def resolve(self, target, importer=None):
+        """
+        Resolve the import target from the importer (the path relative
+        to the build directory of the importing file), into the 3-tuple
+        of the path relative to the build directory, the key for the
+        sourcepath entry providing it and the path to the file on the
+        filesystem.  Returns None if not found.
+        """
+
+        bases = [posixpath.dirname(importer)] if importer else []
+        bases.append('')
+        for base in bases:
+            stem = posixpath.normpath(posixpath.join(base, target))
+            if stem.endswith(SCSS_IMPORT_EXTENSIONS):
+                candidates = [stem]
+            else:
+                head, tail = posixpath.split(stem)
+                candidates = [
+                    candidate
+                    for ext in SCSS_IMPORT_EXTENSIONS
+                    for candidate in (
+                        stem + ext,
+                        posixpath.join(head, '_' + tail + ext),
+                        posixpath.join(stem, 'index' + ext),
+                        posixpath.join(stem, '_index' + ext),
+                    )
+                ]
+            for candidate in candidates:
+                result = self._lookup(candidate)
+                if result:
+                    return result
+        return None
+
+
+def reachable_sourcepaths(entry_points, layout):
+    """
+    Return the set of keys for the sourcepath entries within the layout
+    that are reachable through the import statements (including the
+    nested ones) from the entry points.  Returns None if any of the
+    import targets involves interpolation, as the modules it may
+    resolve to cannot be determined.
+    """
+
+    reachable = set()
+    visited = set()
+    pending = [(target, None) for target in entry_points]
+    while pending:
+        target, importer = pending.pop()
+        if '#{' in target:
+            logger.warning(
+                "unable to determine the modules reachable through the "
+                "interpolated import target '%s'", target)
+            return None
+        result = layout.resolve(target, importer)
+        if result is None:
+            continue
+        path, key, source = result
+        reachable.add(key)
+        if path in visited:
+            continue
+        visited.add(path)
+        try:
+            targets = parse_all_imports(read_source(source))
+        except (IOError, OSError, UnicodeDecodeError) as e:
+            logger.warning("unable to read '%s': %s", source, e)
+            continue
+        pending.extend((t, path) for t in targets)
+    return reachable
@@ -3,15 +3,51 @@
 Libsass integration module.
 """
 
+import codecs
 import logging
 from itertools import chain
+from os.path import join
 
 from calmjs.toolchain import BUILD_DIR
-from calmjs.toolchain import EXPORT_TARGET
 from calmjs.toolchain import EXPORT_MODULE_NAMES
+from calmjs.toolchain import EXPORT_TARGET
 
+from calmjs.sassy.assets import CALMJS_SASSY_ASSET_URLS
+from calmjs.sassy.assets import CALMJS_SASSY_COPY_ASSETS
+from calmjs.sassy.assets import CALMJS_SASSY_INLINE_ASSETS_THRESHOLD
+from calmjs.sassy.assets import AssetPostProcessor
+from calmjs.sassy.assets import mark_asset_urls
+from calmjs.sassy.coalesce import CALMJS_SASSY_COALESCE
+from calmjs.sassy.coalesce import CALMJS_SASSY_COALESCED
+from calmjs.sassy.coalesce import CALMJS_SASSY_COALESCE_DIGEST
+from calmjs.sassy.coalesce import coalesce_spec
+from calmjs.sassy.depfile import CALMJS_SASSY_DEPFILE
+from calmjs.sassy.depfile import import_recorder_generator
+from calmjs.sassy.depfile import unrecorded_imports
+from calmjs.sassy.depfile import write_depfile
+from calmjs.sassy.diagnostics import locate_compile_error
+from calmjs.sassy.diagnostics import write_diagnostics
+from calmjs.sassy.digest import libsass_versions
+from calmjs.sassy.digest import write_artifact_record
+from calmjs.sassy.exc import CalmjsSassyCompileError
 from calmjs.sassy.exc import CalmjsSassyRuntimeError
+from calmjs.sassy.fragments import CALMJS_SASSY_FRAGMENTS
+from calmjs.sassy.fragments import CALMJS_SASSY_FRAGMENTS_EXCLUDE
+from calmjs.sassy.fragments import FragmentCache
+from calmjs.sassy.fragments import find_fragment_dependencies
+from calmjs.sassy.fragments import fragment_digest
+from calmjs.sassy.output import iter_text_chunks
+from calmjs.sassy.sandbox import CALMJS_SASSY_SANDBOX
+from calmjs.sassy.sandbox import CALMJS_SASSY_SANDBOX_MEMORY
+from calmjs.sassy.sandbox import CALMJS_SASSY_SANDBOX_TIMEOUT
+from calmjs.sassy.sandbox import sandbox_compile
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHOD
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT
+from calmjs.sassy.toolchain import CALMJS_SASSY_CACHE_DIR
+from calmjs.sassy.toolchain import CALMJS_SASSY_DIAGNOSTICS_DIR
+from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINTS
 from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINT_SOURCEFILE
+from calmjs.sassy.toolchain import CALMJS_SASSY_EXPORT_DIGEST
 from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
 from calmjs.sassy.toolchain import BaseScssToolchain
 
@@ -70,18 +106,40 @@ def libsass_import_stub_generator(spec):
 
         return None
 
+    # marked for the regeneration within the sandboxed worker.
+    importer.calmjs_sassy_stub = True
     return importer
 
 
 def libsass_spec_extras(
         spec,
         libsass_output_style=LIBSASS_OUTPUT_STYLE_DEFAULT,
+        calmjs_sassy_copy_assets=False,
+        calmjs_sassy_inline_assets_threshold=None,
+        calmjs_sassy_fragments=False,
+        calmjs_sassy_fragments_exclude=(),
+        calmjs_sassy_sandbox=False,
+        calmjs_sassy_sandbox_timeout=None,
+        calmjs_sassy_sandbox_memory=None,
+        calmjs_sassy_depfile=None,
+        calmjs_sassy_coalesce=False,
         **kw):
     """
     Apply the libsass toolchain specific spec keys
     """
 
     spec[LIBSASS_OUTPUT_STYLE] = libsass_output_style
+    spec[CALMJS_SASSY_COPY_ASSETS] = calmjs_sassy_copy_assets
+    spec[CALMJS_SASSY_INLINE_ASSETS_THRESHOLD] = (
+        calmjs_sassy_inline_assets_threshold)
+    spec[CALMJS_SASSY_FRAGMENTS] = calmjs_sassy_fragments
+    spec[CALMJS_SASSY_FRAGMENTS_EXCLUDE] = list(
+        calmjs_sassy_fragments_exclude or ())
+    spec[CALMJS_SASSY_SANDBOX] = calmjs_sassy_sandbox
+    spec[CALMJS_SASSY_SANDBOX_TIMEOUT] = calmjs_sassy_sandbox_timeout
+    spec[CALMJS_SASSY_SANDBOX_MEMORY] = calmjs_sassy_sandbox_memory
+    spec[CALMJS_SASSY_DEPFILE] = calmjs_sassy_depfile
+    spec[CALMJS_SASSY_COALESCE] = calmjs_sassy_coalesce
     # build the stub importer, if applicable for stubbing out external
     # imports for non-all definitions using the merged mapping
     if spec[CALMJS_SASSY_SOURCEPATH_MERGED]:
@@ -105,10 +163,122 @@ class LibsassToolchain(BaseScssToolchain):
 
         if not HAS_LIBSASS:
             raise CalmjsSassyRuntimeError("missing required package 'libsass'")
+        if spec.get(CALMJS_SASSY_COALESCE):
+            coalesce_spec(spec, spec.get(
+                LIBSASS_OUTPUT_STYLE, LIBSASS_OUTPUT_STYLE_DEFAULT))
+
+    def compile(self, spec):
+        if spec.get(CALMJS_SASSY_COALESCED):
+            return
+        super(LibsassToolchain, self).compile(spec)
+
+    def assemble(self, spec):
+        if spec.get(CALMJS_SASSY_COALESCED):
+            return
+        super(LibsassToolchain, self).assemble(spec)
+
+    def transpile_modname_source_target(self, spec, modname, source, target):
+        """
+        Mark the relative urls within the copy in the build directory,
+        if the assets are to be copied or inlined.
+        """
+
+        super(LibsassToolchain, self).transpile_modname_source_target(
+            spec, modname, source, target)
+        if not (spec.get(CALMJS_SASSY_COPY_ASSETS) or
+                spec.get(CALMJS_SASSY_INLINE_ASSETS_THRESHOLD)):
+            return
+
+        bd_target = join(spec[BUILD_DIR], *target.split('/'))
+        with codecs.open(bd_target, encoding='utf8') as fd:
+            original = fd.read()
+        marked = mark_asset_urls(
+            original, source, spec.setdefault(CALMJS_SASSY_ASSET_URLS, {}))
+        if marked != original:
+            with codecs.open(bd_target, 'w', encoding='utf8') as fd:
+                fd.write(marked)
+
+    def postprocess(self, spec, chunks):
+        """
+        Rewrite the marked asset urls before the other post-processors.
+        """
+
+        if spec.get(CALMJS_SASSY_ASSET_URLS):
+            chunks = AssetPostProcessor().process(spec, chunks)
+        return super(LibsassToolchain, self).postprocess(spec, chunks)
 
     def link(self, spec):
         """
-        Use the builtin libsass bindings for the final linking.
+        Use the builtin libsass bindings for the final linking, unless
+        the export target produced by a coalesced build is reused.
+        """
+
+        if spec.get(CALMJS_SASSY_COALESCED):
+            logger.info(
+                "export target '%s' was produced from the same inputs; "
+                "skipped compilation", spec[EXPORT_TARGET])
+            # nothing was compiled, so no imports were recorded.
+            unrecorded_imports(spec)
+        else:
+            css_export = self.compile_export(spec)
+            self.write_export(spec, iter_text_chunks(css_export))
+            if spec.get(CALMJS_SASSY_COALESCE_DIGEST):
+                write_artifact_record(
+                    spec[EXPORT_TARGET], spec[CALMJS_SASSY_COALESCE_DIGEST],
+                    target_digest=spec.get(CALMJS_SASSY_EXPORT_DIGEST),
+                    record_dir=spec.get(CALMJS_SASSY_CACHE_DIR))
+        if spec.get(CALMJS_SASSY_DEPFILE):
+            write_depfile(spec)
+
+    def compile_export(self, spec, output_style=None):
+        """
+        Return the css for the export target, compiled as fragments if
+        specified and possible, otherwise from the entry point.
+
+        Arguments:
+
+        spec
+            The spec with the assembled build directory.
+        output_style
+            The output style to compile with, overriding the one in the
+            spec.
+        """
+
+        css_export = None
+        if spec.get(CALMJS_SASSY_FRAGMENTS):
+            css_export = self.link_fragments(spec, output_style)
+        if css_export is None:
+            css_export = self.link_entry_point(spec, output_style)
+        return css_export
+
+    def libsass_compile(self, spec, source, output_style=None):
+        """
+        Compile the source, within the sandboxed worker if specified,
+        with the output style of the spec unless one is provided.
+        """
+
+        kwargs = dict(
+            string=source,
+            include_paths=[spec[BUILD_DIR]],
+            output_style=output_style or spec.get(
+                LIBSASS_OUTPUT_STYLE, LIBSASS_OUTPUT_STYLE_DEFAULT),
+        )
+        importers = list(spec.get(LIBSASS_IMPORTERS, ()))
+        if spec.get(CALMJS_SASSY_SANDBOX):
+            if spec.get(CALMJS_SASSY_DEPFILE):
+                # the recorder cannot be sent to the sandboxed worker.
+                unrecorded_imports(spec)
+            return sandbox_compile(spec, kwargs, importers)
+        if spec.get(CALMJS_SASSY_DEPFILE):
+            recorder = import_recorder_generator(spec)
+            if recorder is not None:
+                # before the stub importer, to see every import.
+                importers.append((1, recorder))
+        return sass.compile(importers=importers, **kwargs)
+
+    def link_entry_point(self, spec, output_style=None):
+        """
+        Compile the entry point sourcefile.
         """
 
         # Loading the entry point from the filesystem rather than
@@ -123,19 +293,120 @@ class LibsassToolchain(BaseScssToolchain):
             "invoking 'sass.compile' on entry point module at %r",
             spec[CALMJS_SASSY_ENTRY_POINT_SOURCEFILE])
         try:
-            css_export = sass.compile(
-                string=source,
-                importers=spec.get(LIBSASS_IMPORTERS, ()),
-                include_paths=[spec[BUILD_DIR]],
-                output_style=spec.get(
-                    LIBSASS_OUTPUT_STYLE, LIBSASS_OUTPUT_STYLE_DEFAULT),
-            )
+            return self.libsass_compile(spec, source, output_style)
         except ValueError as e:
             # assume this is the case, could/should be sass.CompileError
-            # TODO figure out a better way to represent errors
-            raise CalmjsSassyRuntimeError(
-                'failed to compile with libsass: %s' % e)
+            self.raise_compile_error(spec, str(e))
+
+    def link_fragments(self, spec, output_style=None):
+        """
+        Compile every entry point separately, with the fragments cached
+        within the cache directory under the digest of their inputs, and
+        return the concatenation of the fragments.  Return None if the
+        entry points must be compiled together instead.
+        """
+
+        entry_points = spec.get(CALMJS_SASSY_ENTRY_POINTS) or []
+        excluded = set(spec.get(CALMJS_SASSY_FRAGMENTS_EXCLUDE) or ())
+        if not spec.get(CALMJS_SASSY_CACHE_DIR):
+            reason = 'no cache directory specified'
+        elif spec.get(
+                CALMJS_SASSY_ASSEMBLE_METHOD,
+                CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT) != 'import':
+            reason = 'entry points not assembled through import'
+        elif excluded.intersection(entry_points):
+            reason = 'entry points %r excluded' % sorted(
+                excluded.intersection(entry_points))
+        else:
+            reason = None
+            dependencies = find_fragment_dependencies(
+                entry_points, spec[BUILD_DIR])
+            if dependencies and dependencies[1]:
+                reason = "entry point '%s' may depend on %s from the other " \
+                    "entry points" % (
+                        dependencies[0], ', '.join(dependencies[1]))
+            elif dependencies:
+                reason = "imports of entry point '%s' cannot be " \
+                    "determined" % dependencies[0]
+        if reason:
+            logger.info('compiling entry points together: %s', reason)
+            return None
+
+        cache = FragmentCache(spec[CALMJS_SASSY_CACHE_DIR])
+        style = output_style or spec.get(
+            LIBSASS_OUTPUT_STYLE, LIBSASS_OUTPUT_STYLE_DEFAULT)
+        extras = [
+            style,
+            libsass_versions(),
+            sorted((spec.get(CALMJS_SASSY_ASSET_URLS) or {}).items()),
+        ]
+        merged = spec.get(CALMJS_SASSY_SOURCEPATH_MERGED) or {}
+        fragments = []
+        for modname in entry_points:
+            digest = fragment_digest(
+                modname, spec[BUILD_DIR], extras,
+                is_stubbed=lambda target: target in merged)
+            css = cache.get(digest)
+            if css is not None:
+                logger.debug(
+                    "using cached fragment for entry point '%s'", modname)
+                if spec.get(CALMJS_SASSY_DEPFILE):
+                    unrecorded_imports(spec)
+                fragments.append(css)
+                continue
+            logger.info(
+                "invoking 'sass.compile' on entry point '%s'", modname)
+            try:
+                css = self.libsass_compile(
+                    spec, '@import "%s";\n' % modname, style)
+            except ValueError as e:
+                logger.info(
+                    "entry point '%s' cannot be compiled on its own; "
+                    "compiling entry points together: %s", modname, e)
+                return None
+            cache.put(digest, css)
+            fragments.append(css)
+
+        sep = '' if style == 'compressed' else '\n'
+        return sep.join(fragment for fragment in fragments if fragment)
+
+    def raise_compile_error(self, spec, message):
+        """
+        Raise the compile error for the message produced by libsass,
+        with the location mapped back to the original module.  If the
+        spec specified a CALMJS_SASSY_DIAGNOSTICS_DIR, the diagnostics
+        bundle for the error will be written there, as the build
+        directory may be removed.
+        """
+
+        locations = locate_compile_error(spec, message)
+        # the first location that is a known module, as the error may
+        # be raised from the generated entry point.
+        location = next((
+            location for location in locations if location['modname']
+        ), locations[0] if locations else {})
+
+        diagnostics = None
+        if spec.get(CALMJS_SASSY_DIAGNOSTICS_DIR):
+            diagnostics = write_diagnostics(
+                spec, message, locations, spec[CALMJS_SASSY_DIAGNOSTICS_DIR])
+
+        summary = 'failed to compile with libsass: %s' % message
+        if location.get('modname'):
+            summary = "%s\nmodule '%s' at line %s of '%s'" % (
+                summary.rstrip(), location['modname'], location['line'],
+                location['sourcepath'],
+            )
+        if diagnostics:
+            summary = "%s\ndiagnostics written to '%s'" % (
+                summary.rstrip(), diagnostics)
 
-        with open(spec[EXPORT_TARGET], 'w') as fd:
-            fd.write(css_export)
-        logger.info("wrote export css file at '%s'", spec[EXPORT_TARGET])
+        raise CalmjsSassyCompileError(
+            summary,
+            modname=location.get('modname'),
+            sourcepath=location.get('sourcepath'),
+            line=location.get('line'),
+            column=location.get('column'),
+            locations=locations,
+            diagnostics=diagnostics,
+        )
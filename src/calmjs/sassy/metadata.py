@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup of the distribution metadata through ``importlib.metadata``.
+
+The helpers provided by ``calmjs.dist`` resolve the dependency graph
+through ``pkg_resources.WorkingSet.resolve``, which validates every
+requirement of every distribution that was reached.  As only the names
+and the order of the distributions are needed for the acquisition of
+the metadata, the distributions and their requirements are looked up
+here directly through ``importlib.metadata`` where available, with the
+index of the distributions and the requirements of each distribution
+only built as they are needed.
+
+The adapters provided here implement just enough of the interface of
+``pkg_resources.Distribution`` for the helpers in ``calmjs.dist`` that
+read the metadata to work with them.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import re
+import threading
+
+import pkg_resources
+from pkg_resources import EntryPoint
+from pkg_resources import Requirement
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:  # pragma: no cover
+    try:
+        import importlib_metadata
+    except ImportError:
+        importlib_metadata = None
+
+logger = logging.getLogger(__name__)
+
+HAS_IMPORTLIB_METADATA = importlib_metadata is not None
+# may be set to False to disable the usage of importlib.metadata.
+USE_IMPORTLIB_METADATA = HAS_IMPORTLIB_METADATA
+
+_SAFE_NAME = re.compile('[^A-Za-z0-9.]+')
+
+
+def is_enabled(working_set):
+    """
+    Return True if the lookup through importlib.metadata may be used in
+    place of the provided working set, which is only the case for the
+    default working set (i.e. not one that was constructed or stubbed
+    for a specific set of paths).
+    """
+
+    return USE_IMPORTLIB_METADATA and working_set is pkg_resources.working_set
+
+
+class MetadataDistribution(object):
+    """
+    Adapter for an importlib.metadata distribution.  The metadata files
+    are read from the first of the distributions installed under the
+    same name that provides them, as the metadata produced for editable
+    installations may not include the files written by the egg_info
+    writers that are only available from the egg-info directory.
+    """
+
+    def __init__(self, dist):
+        self._dist = dist
+        self._others = []
+        self.project_name = _SAFE_NAME.sub('-', dist.metadata['Name'])
+        self.key = self.project_name.lower()
+        self.version = dist.version
+        self._requires = None
+
+    def _read_text(self, name):
+        for dist in [self._dist] + self._others:
+            text = dist.read_text(name)
+            if text is not None:
+                return text
+        return None
+
+    def has_metadata(self, name):
+        return self._read_text(name) is not None
+
+    def get_metadata(self, name):
+        text = self._read_text(name)
+        if text is None:
+            raise IOError("no metadata '%s' for '%s'" % (name, self))
+        return text
+
+    def requires(self, extras=()):
+        """
+        Return the list of requirements, with the markers evaluated for
+        the provided extras.
+        """
+
+        if self._requires is None:
+            # assigned in one step, as this may be called concurrently.
+            self._requires = [
+                Requirement.parse(line) for line in self._dist.requires or ()]
+        results = []
+        for req in self._requires:
+            marker = getattr(req, 'marker', None)
+            if marker is None or any(
+                    marker.evaluate({'extra': extra})
+                    for extra in ('',) + tuple(extras)):
+                results.append(req)
+        return results
+
+    def as_requirement(self):
+        return Requirement.parse('%s==%s' % (self.project_name, self.version))
+
+    def iter_entry_points(self, group):
+        for ep in self._dist.entry_points:
+            if ep.group == group:
+                yield EntryPoint.parse(
+                    '%s = %s' % (ep.name, ep.value), dist=self)
+
+    def __str__(self):
+        return '%s %s' % (self.project_name, self.version)
+
+    def __repr__(self):
+        return '<%s.%s %s>' % (
+            type(self).__module__, type(self).__name__, self)
+
+
+class MetadataWorkingSet(object):
+    """
+    A lazily indexed set of the distributions available through
+    importlib.metadata, with the same precedence as the default working
+    set (i.e. the first distribution found on sys.path for a given
+    name).
+
+    Arguments:
+
+    paths
+        The list of paths to look for the distributions; defaults to
+        sys.path.
+    """
+
+    def __init__(self, paths=None):
+        self.paths = paths
+        self._dists = None
+        self._lock = threading.Lock()
+
+    @property
+    def dists(self):
+        with self._lock:
+            if self._dists is None:
+                self._dists = self._index()
+        return self._dists
+
+    def _index(self):
+        dists = {}
+        kw = {} if self.paths is None else {'path': list(self.paths)}
+        for dist in importlib_metadata.distributions(**kw):
+            if not dist.metadata['Name']:
+                continue
+            adapter = MetadataDistribution(dist)
+            if adapter.key in dists:
+                dists[adapter.key]._others.append(dist)
+            else:
+                dists[adapter.key] = adapter
+        return dists
+
+    def find(self, req):
+        return self.dists.get(req.key)
+
+    def __iter__(self):
+        return iter(self.dists.values())
+
+    def iter_entry_points(self, group, name=None):
+        for dist in self:
+            for entry_point in dist.iter_entry_points(group):
+                if name is None or entry_point.name == name:
+                    yield entry_point
+
+    def resolve(self, requirements):
+        """
+        Return the list of distributions required by the requirements,
+        in the same order as pkg_resources.WorkingSet.resolve, with the
+        missing distributions skipped.
+        """
+
+        pending = list(requirements)[::-1]
+        processed = set()
+        seen = set()
+        results = []
+        while pending:
+            # breadth-first, as done by pkg_resources.
+            req = pending.pop(0)
+            marker = (req.key, tuple(sorted(req.extras)))
+            if marker in processed:
+                continue
+            processed.add(marker)
+            dist = self.find(req)
+            if dist is None:
+                logger.debug("distribution for '%s' not found; skipped", req)
+                continue
+            if dist.key not in seen:
+                seen.add(dist.key)
+                results.append(dist)
+            pending.extend(dist.requires(req.extras)[::-1])
+        return results
+
+
+_working_set = None
+_working_set_lock = threading.Lock()
+
+
+def get_working_set():
+    """
+    Return the shared MetadataWorkingSet.
+    """
+
+    global _working_set
+    with _working_set_lock:
+        if _working_set is None:
+            _working_set = MetadataWorkingSet()
+    return _working_set
+
+
+def working_set_for(working_set):
+    """
+    Return the shared MetadataWorkingSet in place of the provided
+    working set where permitted, otherwise the provided working set.
+    """
+
+    return get_working_set() if is_enabled(working_set) else working_set
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming of the compiled output through a set of sinks.
+
+The compiled CSS is consumed as chunks, such that the file write, the
+hashing and the compression of the output (and any processing done
+before those) will not require additional copies of the complete
+output to be held in memory.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import errno
+import gzip
+import hashlib
+import logging
+import os
+import uuid
+from os.path import basename
+from os.path import dirname
+from os.path import exists
+from os.path import isdir
+from os.path import join
+
+logger = logging.getLogger(__name__)
+
+# the size of the chunks, in characters.
+CHUNK_SIZE = 65536
+
+_TEMP_FLAGS = (
+    os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+
+
+def ensure_dir(path):
+    """
+    Create the directory at path, along with its parents, if it does
+    not already exist; may be called concurrently for the same path.
+    """
+
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not isdir(path):
+            raise
+
+
+def iter_text_chunks(text, size=CHUNK_SIZE):
+    """
+    Yield the provided text in chunks of the given size.
+    """
+
+    for idx in range(0, len(text), size):
+        yield text[idx:idx + size]
+
+
+def iter_file_chunks(fd, size=CHUNK_SIZE):
+    """
+    Yield the contents of the file object in chunks of the given size.
+    """
+
+    for chunk in iter(lambda: fd.read(size), ''):
+        yield chunk
+
+
+def create_temp_file(path):
+    """
+    Create a uniquely named temporary file next to path, with the
+    permissions of a newly created file as per the umask (rather than
+    the restricted permissions used by the tempfile module).  Return a
+    2-tuple of the file descriptor and the path of the temporary file.
+    """
+
+    while True:
+        tmp = join(dirname(path), '.%s.%s.tmp' % (
+            basename(path), uuid.uuid4().hex))
+        try:
+            return os.open(tmp, _TEMP_FLAGS, 0o666), tmp
+        except OSError as e:
+            if e.errno != errno.EEXIST:  # pragma: no cover
+                raise
+
+
+class Sink(object):
+    """
+    The base sink, which consumes the chunks of text written to it.
+    """
+
+    def write(self, chunk):
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Called once all the chunks have been written.
+        """
+
+    def abort(self):
+        """
+        Called instead of close should the stream fail.
+        """
+
+
+class FileSink(Sink):
+    """
+    Write the chunks into the file at path as utf-8; the file will only
+    be replaced once all the chunks are written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd, self.tmp = create_temp_file(path)
+        self.raw = os.fdopen(fd, 'wb')
+        self.fd = codecs.getwriter('utf8')(self.wrap(self.raw))
+
+    def wrap(self, raw):
+        """
+        Wrap the raw binary stream for the temporary file.
+        """
+
+        return raw
+
+    def write(self, chunk):
+        self.fd.write(chunk)
+
+    def _close_streams(self):
+        self.fd.close()
+        self.raw.close()
+
+    def close(self):
+        self._close_streams()
+        if exists(self.path) and os.name == 'nt':  # pragma: no cover
+            os.unlink(self.path)
+        os.rename(self.tmp, self.path)
+
+    def abort(self):
+        self._close_streams()
+        if exists(self.tmp):
+            os.unlink(self.tmp)
+
+
+class DigestSink(Sink):
+    """
+    Produce the hexdigest of the utf-8 encoded chunks.
+    """
+
+    def __init__(self, name='sha1'):
+        self.hash = hashlib.new(name)
+        self.hexdigest = None
+
+    def write(self, chunk):
+        self.hash.update(chunk.encode('utf8'))
+
+    def close(self):
+        self.hexdigest = self.hash.hexdigest()
+
+
+class GzipSink(FileSink):
+    """
+    Write the utf-8 encoded chunks into a gzip file at path.
+    """
+
+    def __init__(self, path, compresslevel=9):
+        self.compresslevel = compresslevel
+        super(GzipSink, self).__init__(path)
+
+    def wrap(self, raw):
+        return gzip.GzipFile(
+            filename='', mode='wb', fileobj=raw,
+            compresslevel=self.compresslevel, mtime=0)
+
+
+def stream_chunks(chunks, sinks):
+    """
+    Write every chunk from the iterable of chunks into each of the
+    sinks, and then close all of them.  Should the iteration of the
+    chunks fail, the sinks will be aborted before the exception is
+    raised.
+    """
+
+    try:
+        for chunk in chunks:
+            for sink in sinks:
+                sink.write(chunk)
+    except Exception:
+        for sink in sinks:
+            sink.abort()
+        raise
+    for sink in sinks:
+        sink.close()
+    return sinks
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Planning of the builds without executing them.
+
+A spec produced by create_spec has all the values required to determine
+what a build would involve, i.e. the registries used, the modules and
+the bundled files that would be copied into the build directory (after
+the optional pruning of the modules that are not reachable from the
+entry points), the entry points and the export target.  These are
+gathered into a plan along with the sizes of the files, such that the
+reasons for a slow or large build may be determined without copying or
+compiling anything.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+from os.path import getsize
+from os.path import isdir
+from os.path import join
+
+from calmjs.toolchain import CALMJS_MODULE_REGISTRY_NAMES
+from calmjs.toolchain import EXPORT_TARGET
+from calmjs.toolchain import SOURCE_PACKAGE_NAMES
+
+from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINTS
+from calmjs.sassy.toolchain import CALMJS_SASSY_PRUNE_MODULES
+from calmjs.sassy.toolchain import CALMJS_SASSY_PRUNED_MODULES
+
+logger = logging.getLogger(__name__)
+
+# spec key for enabling the dry run.
+CALMJS_SASSY_DRY_RUN = 'calmjs_sassy_dry_run'
+# spec key for the format of the plan written for the dry run.
+CALMJS_SASSY_DRY_RUN_FORMAT = 'calmjs_sassy_dry_run_format'
+
+# definitions
+CALMJS_SASSY_DRY_RUN_FORMAT_DEFAULT = 'text'
+CALMJS_SASSY_DRY_RUN_FORMATS = ('text', 'json')
+
+
+def sourcepath_size(path):
+    """
+    Return the size of the file at path, or the total size of the files
+    within it if it is a directory.  Returns None if it cannot be read.
+    """
+
+    try:
+        if not isdir(path):
+            return getsize(path)
+        return sum(
+            getsize(join(root, name))
+            for root, dirs, files in os.walk(path) for name in files
+        )
+    except (IOError, OSError) as e:
+        logger.warning("unable to determine the size of '%s': %s", path, e)
+        return None
+
+
+def plan_sourcepaths(sourcepaths):
+    """
+    Return the list of the mappings of the modname, the sourcepath and
+    its size for the provided sourcepaths, sorted by the modname.
+    """
+
+    return [
+        {'modname': modname, 'sourcepath': path,
+         'size': sourcepath_size(path)}
+        for modname, path in sorted(sourcepaths.items())
+    ]
+
+
+def plan_spec(spec, toolchain):
+    """
+    Return the plan for the build of the spec through the toolchain, as
+    a mapping that may be serialized to JSON.  The modules not reachable
+    from the entry points are pruned from the spec if specified, as the
+    toolchain would have done, but nothing will be copied or compiled.
+
+    Arguments:
+
+    spec
+        The spec, as produced by create_spec.
+    toolchain
+        The BaseScssToolchain the spec is created for.
+    """
+
+    if spec.get(CALMJS_SASSY_PRUNE_MODULES):
+        toolchain.prune_sourcepaths(spec)
+
+    modules = plan_sourcepaths(spec.get('transpile_sourcepath') or {})
+    bundles = plan_sourcepaths(spec.get('bundle_sourcepath') or {})
+    total_size = sum(
+        item['size'] for item in modules + bundles if item['size'])
+    return {
+        'package_names': list(spec.get(SOURCE_PACKAGE_NAMES) or ()),
+        'registries': list(spec.get(CALMJS_MODULE_REGISTRY_NAMES) or ()),
+        'modules': modules,
+        'bundles': bundles,
+        'pruned_modules': list(spec.get(CALMJS_SASSY_PRUNED_MODULES) or ()),
+        'total_size': total_size,
+        'entry_points': list(spec.get(CALMJS_SASSY_ENTRY_POINTS) or ()),
+        'export_target': spec.get(EXPORT_TARGET),
+    }
+
+
+def _write_sourcepaths(stream, title, items):
+    stream.write('%s (%d, %d bytes):\n' % (
+        title, len(items), sum(item['size'] or 0 for item in items)))
+    for item in items:
+        stream.write('    %s: %s (%s)\n' % (
+            item['modname'], item['sourcepath'],
+            'unreadable' if item['size'] is None else (
+                '%d bytes' % item['size'])))
+
+
+def write_plan(plan, stream, fmt=CALMJS_SASSY_DRY_RUN_FORMAT_DEFAULT):
+    """
+    Write the plan produced by plan_spec to the stream in the format,
+    which is one of CALMJS_SASSY_DRY_RUN_FORMATS.
+    """
+
+    if fmt == 'json':
+        stream.write(json.dumps(plan, indent=4, sort_keys=True) + '\n')
+        return
+
+    stream.write('packages: %s\n' % ', '.join(plan['package_names']))
+    stream.write('registries: %s\n' % ', '.join(plan['registries']))
+    _write_sourcepaths(stream, 'modules', plan['modules'])
+    _write_sourcepaths(stream, 'bundles', plan['bundles'])
+    if plan['pruned_modules']:
+        stream.write('pruned modules (%d):\n' % len(plan['pruned_modules']))
+        for modname in plan['pruned_modules']:
+            stream.write('    %s\n' % modname)
+    stream.write('total size: %d bytes\n' % plan['total_size'])
+    stream.write('entry points:\n')
+    for modname in plan['entry_points']:
+        stream.write('    %s\n' % modname)
+    stream.write('export target: %s\n' % plan['export_target'])
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Post-processing of the compiled CSS.
+
+Post-processors are registered through the ``calmjs.sassy.postprocessors``
+entry point group, and are applied in the order specified as a chain
+of stages on the chunks of the compiled output, before the chunks are
+written out.  If a cache directory is provided, the output of every
+stage will be cached under the digest of its input and configuration,
+such that the stages with unchanged inputs will not be executed again.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import hashlib
+import json
+import logging
+from os.path import exists
+from os.path import join
+from tempfile import TemporaryFile
+
+from calmjs.base import BaseRegistry
+from calmjs.registry import get
+
+from calmjs.sassy.exc import CalmjsSassyRuntimeError
+from calmjs.sassy.output import FileSink
+from calmjs.sassy.output import ensure_dir
+from calmjs.sassy.output import iter_file_chunks
+
+logger = logging.getLogger(__name__)
+
+CALMJS_SASSY_POSTPROCESSOR_REGISTRY = 'calmjs.sassy.postprocessors'
+# the subdirectory within the cache directory for the cached outputs.
+POSTPROCESS_CACHE_SUBDIR = 'postprocess'
+
+
+class PostProcessor(object):
+    """
+    The base post-processor.  Subclasses should implement process, and
+    increment the version whenever the output would change for the same
+    input and configuration.
+    """
+
+    version = 1
+    # whether the output may be cached; should be False for the post-
+    # processors with side effects.
+    cacheable = True
+
+    def __init__(self, **config):
+        self.config = config
+
+    @property
+    def name(self):
+        return '%s:%s' % (type(self).__module__, type(self).__name__)
+
+    def cache_token(self):
+        """
+        Return the token identifying this post-processor along with its
+        configuration, for use as part of the key for the cache.
+        """
+
+        return json.dumps(
+            [self.name, self.version, self.config], sort_keys=True)
+
+    def process(self, spec, chunks):
+        """
+        Return an iterable of the processed chunks from the iterable of
+        chunks provided.
+        """
+
+        raise NotImplementedError
+
+
+class TextPostProcessor(PostProcessor):
+    """
+    A post-processor that requires the complete text.
+    """
+
+    def process(self, spec, chunks):
+        yield self.process_text(spec, ''.join(chunks))
+
+    def process_text(self, spec, text):
+        raise NotImplementedError
+
+
+class PostProcessorRegistry(BaseRegistry):
+    """
+    Registry for the post-processor classes, with the entry point name
+    being the name of the post-processor.
+    """
+
+    def _init(self):
+        self._init_entry_points(self.raw_entry_points)
+
+    def _init_entry_point(self, entry_point):
+        if entry_point.name in self.records:
+            logger.warning(
+                "post-processor '%s' from '%s' already registered; "
+                "ignoring", entry_point.name, entry_point.dist)
+            return
+        self.records[entry_point.name] = entry_point.resolve()
+
+    def get_record(self, name):
+        return self.records.get(name)
+
+    def iter_records(self):
+        return iter(self.records.items())
+
+
+def resolve_postprocessors(
+        postprocessors, configs=None,
+        registry_name=CALMJS_SASSY_POSTPROCESSOR_REGISTRY):
+    """
+    Return the list of PostProcessor instances for the provided list of
+    post-processors, which may be the name of a registered post-
+    processor or an instance.  The named ones will be instantiated with
+    the configuration under their name in configs.
+    """
+
+    configs = configs or {}
+    registry = get(registry_name)
+    results = []
+    for postprocessor in postprocessors:
+        if isinstance(postprocessor, PostProcessor):
+            results.append(postprocessor)
+            continue
+        cls = registry.get_record(postprocessor) if registry else None
+        if cls is None:
+            raise CalmjsSassyRuntimeError(
+                "unknown post-processor '%s'" % postprocessor)
+        results.append(cls(**configs.get(postprocessor, {})))
+    return results
+
+
+def _spool(chunks):
+    # spool the chunks into a temporary file while digesting them, to
+    # avoid holding the complete input in memory.
+    h = hashlib.sha1()
+    spool = TemporaryFile()
+    for chunk in chunks:
+        data = chunk.encode('utf8')
+        h.update(data)
+        spool.write(data)
+    spool.seek(0)
+    return h.hexdigest(), spool
+
+
+def _iter_spool(spool):
+    try:
+        for chunk in iter_file_chunks(codecs.getreader('utf8')(spool)):
+            yield chunk
+    finally:
+        spool.close()
+
+
+def _iter_cached(path):
+    with codecs.open(path, encoding='utf8') as fd:
+        for chunk in iter_file_chunks(fd):
+            yield chunk
+
+
+def _iter_caching(chunks, path):
+    sink = FileSink(path)
+    try:
+        for chunk in chunks:
+            sink.write(chunk)
+            yield chunk
+    except BaseException:
+        sink.abort()
+        raise
+    sink.close()
+
+
+def cached_stage(spec, postprocessor, chunks, cache_dir):
+    """
+    Apply the post-processor onto the chunks, with the output cached
+    within the cache_dir.
+    """
+
+    digest, spool = _spool(chunks)
+    key = hashlib.sha1(
+        (digest + postprocessor.cache_token()).encode('utf8')).hexdigest()
+    target_dir = join(cache_dir, POSTPROCESS_CACHE_SUBDIR)
+    path = join(target_dir, key + '.css')
+    if exists(path):
+        spool.close()
+        logger.debug(
+            "using cached output for post-processor '%s'", postprocessor.name)
+        return _iter_cached(path)
+
+    ensure_dir(target_dir)
+    return _iter_caching(
+        postprocessor.process(spec, _iter_spool(spool)), path)
+
+
+def apply_postprocessors(spec, chunks, postprocessors, cache_dir=None):
+    """
+    Return the iterable of chunks produced by applying the provided
+    list of post-processors in order.
+
+    Arguments:
+
+    spec
+        The spec for the current build.
+    chunks
+        The iterable of chunks of the compiled css.
+    postprocessors
+        The list of PostProcessor instances.
+    cache_dir
+        The cache directory; if not provided, no caching will be done.
+    """
+
+    for postprocessor in postprocessors:
+        logger.debug("applying post-processor '%s'", postprocessor.name)
+        if cache_dir and postprocessor.cacheable:
+            chunks = cached_stage(spec, postprocessor, chunks, cache_dir)
+        else:
+            chunks = postprocessor.process(spec, chunks)
+    return chunks
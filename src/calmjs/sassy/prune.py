@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Pruning of the rules with selectors that can never match against a
+corpus of templates and scripts.
+
+The corpus is scanned for every word that may be a class name or id,
+as the names may be referenced in any form (e.g. built up through the
+scripts); a rule is only dropped if any of the class names or ids that
+its selectors require do not appear anywhere in the corpus.  The tag
+names are not checked.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import re
+
+from calmjs.sassy.css import SelectorIndex
+from calmjs.sassy.css import filter_nodes
+from calmjs.sassy.css import iter_files
+from calmjs.sassy.css import parse_stylesheet
+from calmjs.sassy.css import read_text
+from calmjs.sassy.postprocess import TextPostProcessor
+
+logger = logging.getLogger(__name__)
+
+# spec key for the list of paths to the corpus of templates and scripts.
+CALMJS_SASSY_PRUNE_CORPUS = 'calmjs_sassy_prune_corpus'
+# spec key for the list of patterns for the class names and ids that
+# must be retained.
+CALMJS_SASSY_PRUNE_ALLOWLIST = 'calmjs_sassy_prune_allowlist'
+
+# the registered name of the pruning post-processor.
+PRUNE_POSTPROCESSOR = 'prune'
+# the file extensions for the corpus.
+CORPUS_EXTENSIONS = (
+    '.html', '.htm', '.xhtml', '.xml', '.jinja', '.jinja2', '.j2', '.pt',
+    '.mako', '.mak', '.tmpl', '.tpl', '.hbs', '.mustache', '.txt',
+    '.js', '.jsx', '.mjs', '.ts', '.tsx', '.vue', '.py',
+)
+
+# the words, plus the runs of characters between the delimiters of the
+# attribute values and strings, to allow class names such as 'md:flex'.
+_CORPUS_WORD = re.compile(r'[\w-]+')
+_CORPUS_RUN = re.compile(r'[^\s"\'`<>=,;(){}\[\]]+')
+
+
+def corpus_words(paths, extensions=CORPUS_EXTENSIONS):
+    """
+    Return the set of words found within the files of the corpus at the
+    provided paths, which may be files or directories.
+    """
+
+    words = set()
+    for path in iter_files(paths, extensions):
+        try:
+            text = read_text(path)
+        except (IOError, OSError) as e:
+            logger.warning("unable to read corpus file '%s': %s", path, e)
+            continue
+        words.update(_CORPUS_WORD.findall(text))
+        words.update(_CORPUS_RUN.findall(text))
+    return words
+
+
+def prune_stylesheet(text, words, allowlist=()):
+    """
+    Return the CSS text without the rules that require any class names
+    or ids not within words, along with the total and the retained
+    number of rules.
+
+    Arguments:
+
+    text
+        The CSS text.
+    words
+        The set of words found in the corpus.
+    allowlist
+        The list of regular expressions for the class names and ids
+        that will always be treated as present.
+    """
+
+    allowed = re.compile('|'.join(
+        '(?:%s)$' % pattern for pattern in allowlist)) if allowlist else None
+
+    def has(kind, name):
+        return kind == 'tag' or name in words or bool(
+            allowed and allowed.match(name))
+
+    nodes = parse_stylesheet(text)
+    unmatched = SelectorIndex(nodes).unmatched(has)
+    result, (total, kept) = filter_nodes(
+        nodes, lambda selector: selector not in unmatched)
+    return result if kept < total else text, total, kept
+
+
+class PrunePostProcessor(TextPostProcessor):
+    """
+    Drop the rules with selectors that can never match the corpus.
+
+    Configuration:
+
+    corpus
+        The list of paths to the templates and scripts (or directories
+        of them).
+    allowlist
+        The list of regular expressions for the class names and ids
+        that must be retained.
+    """
+
+    def __init__(self, **config):
+        super(PrunePostProcessor, self).__init__(**config)
+        self._words = None
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = corpus_words(self.config.get('corpus') or ())
+        return self._words
+
+    def cache_token(self):
+        # the output also depends on the contents of the corpus.
+        h = hashlib.sha1()
+        for word in sorted(self.words):
+            h.update(word.encode('utf8') + b'\n')
+        return '%s:%s' % (
+            super(PrunePostProcessor, self).cache_token(), h.hexdigest())
+
+    def process_text(self, spec, text):
+        if not self.config.get('corpus'):
+            logger.warning('no corpus specified for pruning; skipping')
+            return text
+        result, total, kept = prune_stylesheet(
+            text, self.words, self.config.get('allowlist') or ())
+        logger.info(
+            'pruned %d of %d rules; saved %d bytes', total - kept, total,
+            len(text.encode('utf8')) - len(result.encode('utf8')))
+        return result
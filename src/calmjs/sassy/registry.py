@@ -4,11 +4,102 @@ Registry for SCSS files.
 """
 
 from functools import partial
-from calmjs.indexer import mapper
+from os.path import abspath
+from os.path import normcase
+from calmjs import base
+from calmjs.base import _import_module
+from calmjs.indexer import modpath_pkg_resources
 from calmjs.module import ModuleRegistry
 
+from calmjs.sassy import metadata
+from calmjs.sassy.scanner import scan_mapper
+from calmjs.sassy.scanner import scan_roots
+
 
 class SCSSRegistry(ModuleRegistry):
 
+    def __init__(self, registry_name, *a, **kw):
+        # look up the entry points through importlib.metadata, unless
+        # a specific working set is to be used.
+        if '_working_set' not in kw:
+            kw['_working_set'] = metadata.working_set_for(base.working_set)
+        super(SCSSRegistry, self).__init__(registry_name, *a, **kw)
+
     def _init(self):
-        self.mapper = partial(mapper, fext='.scss')
+        # mapping of module name to the list of 2-tuples of the root and
+        # the files found for all the stylesheet extensions.
+        self.scanned = {}
+        self.mapper = partial(scan_mapper, fext='.scss', scanned=self.scanned)
+        # mapping of the normalized path to the list of 3-tuples of the
+        # package name, the module name and the Python module name that
+        # provided it, for the lookup of the modules from the paths.
+        self.path_index = {}
+        # mapping of the Python module name to the normalized paths of
+        # its records within path_index.
+        self._indexed_paths = {}
+
+    def scan_entry_points(self, entry_points):
+        """
+        Scan the directories of the modules for the entry points in a
+        single concurrent pass, with the results stored in scanned.
+        """
+
+        modules = []
+        for entry_point in entry_points:
+            try:
+                module = _import_module(entry_point.module_name)
+            except Exception:
+                # will be reported by the registration.
+                continue
+            modules.append((module.__name__, modpath_pkg_resources(
+                module, entry_point)))
+
+        roots = [root for name, paths in modules for root in paths]
+        listings = dict(zip(roots, scan_roots(roots)))
+        for name, paths in modules:
+            self.scanned[name] = [(root, listings[root]) for root in paths]
+
+    def register_entry_points(self, entry_points):
+        self.scan_entry_points(entry_points)
+        return super(SCSSRegistry, self).register_entry_points(entry_points)
+
+    def _register_entry_point_module(self, entry_point, module):
+        super(SCSSRegistry, self)._register_entry_point_module(
+            entry_point, module)
+        self.index_records(module.__name__, (
+            entry_point.dist.project_name if entry_point.dist else None))
+
+    def index_records(self, module_name, package_name=None):
+        """
+        Update the path_index for the records of the Python module
+        name, replacing the entries produced for it earlier.
+        """
+
+        for key in self._indexed_paths.pop(module_name, ()):
+            entries = [
+                entry for entry in self.path_index.get(key, ())
+                if entry[2] != module_name
+            ]
+            if entries:
+                self.path_index[key] = entries
+            else:
+                self.path_index.pop(key, None)
+
+        keys = []
+        for modname, path in self.records.get(module_name, {}).items():
+            key = normcase(abspath(path))
+            self.path_index.setdefault(key, []).append(
+                (package_name, modname, module_name))
+            keys.append(key)
+        self._indexed_paths[module_name] = keys
+
+    def get_modnames_for_path(self, path):
+        """
+        Return the list of 2-tuples of the package name and the module
+        name for the records that point to the provided path.
+        """
+
+        return [
+            (package_name, modname) for package_name, modname, _ in
+            self.path_index.get(normcase(abspath(path)), ())
+        ]
@@ -3,11 +3,38 @@
 Runtime for toolchain
 """
 
+import sys
+
+from calmjs.runtime import BaseRuntime
+from calmjs.runtime import RequiredCommandRuntime
 from calmjs.runtime import SourcePackageToolchainRuntime
 from calmjs.sassy.dist import sourcepath_methods_map
 from calmjs.sassy.dist import module_registry_methods
+from calmjs.sassy.dist import sourcepath_merged_methods
 from calmjs.sassy.cli import create_spec
+from calmjs.sassy.fingerprint import environment_fingerprint
+from calmjs.sassy.plan import CALMJS_SASSY_DRY_RUN
+from calmjs.sassy.plan import CALMJS_SASSY_DRY_RUN_FORMAT
+from calmjs.sassy.plan import CALMJS_SASSY_DRY_RUN_FORMAT_DEFAULT
+from calmjs.sassy.plan import CALMJS_SASSY_DRY_RUN_FORMATS
+from calmjs.sassy.plan import plan_spec
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHOD
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHODS
+from calmjs.sassy.toolchain import CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT
+from calmjs.sassy.toolchain import CALMJS_SASSY_CACHE_DIR
+from calmjs.sassy.toolchain import CALMJS_SASSY_CRITICAL_HTML_PATHS
+from calmjs.sassy.toolchain import CALMJS_SASSY_CRITICAL_SELECTORS
+from calmjs.sassy.toolchain import CALMJS_SASSY_CRITICAL_TARGET
+from calmjs.sassy.toolchain import CALMJS_SASSY_DIAGNOSTICS_DIR
 from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINT_NAME
+from calmjs.sassy.toolchain import CALMJS_SASSY_EXPORT_GZIP
+from calmjs.sassy.toolchain import CALMJS_SASSY_POSTPROCESSORS
+from calmjs.sassy.toolchain import CALMJS_SASSY_PRUNE_MODULES
+from calmjs.sassy.plan import write_plan
+from calmjs.sassy.prune import CALMJS_SASSY_PRUNE_ALLOWLIST
+from calmjs.sassy.prune import CALMJS_SASSY_PRUNE_CORPUS
+
+CALMJS_RUNTIME_SASSY = 'calmjs.runtime.sassy'
 
 
 class ScssRuntime(SourcePackageToolchainRuntime):
@@ -61,6 +88,16 @@ class ScssRuntime(SourcePackageToolchainRuntime):
                  'given packages; default: all',
         )
 
+        argparser.add_argument(
+            '--sourcepath-merged-method', default='all',
+            dest='sourcepath_merged_method',
+            choices=sourcepath_merged_methods,
+            help='the acquisition method for the sourcepaths used for '
+                 'stubbing out the imports not provided by the selected '
+                 'sourcepath method; lazy will only resolve the imports as '
+                 'they are needed; default: all',
+        )
+
         argparser.add_argument(
             '--source-registry-method', default='all',
             dest='source_registry_method',
@@ -77,6 +114,126 @@ class ScssRuntime(SourcePackageToolchainRuntime):
                  'from for the input packages; default: index',
         )
 
+        argparser.add_argument(
+            '--assemble-method', default=CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT,
+            dest=CALMJS_SASSY_ASSEMBLE_METHOD,
+            choices=CALMJS_SASSY_ASSEMBLE_METHODS,
+            help='the method for assembling the entry points; dedupe will '
+                 'ensure modules shared between the entry points are only '
+                 'imported once; default: %s' % (
+                     CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT),
+        )
+
+        argparser.add_argument(
+            '--snapshot', default=None,
+            dest='snapshot_path',
+            metavar='<snapshot_path>',
+            help='path to a snapshot file for storing and reusing the '
+                 'resolved sourcepaths and entry points for the given '
+                 'packages across executions within the same environment',
+        )
+
+        argparser.add_argument(
+            '--prune-modules', default=False, action='store_true',
+            dest=CALMJS_SASSY_PRUNE_MODULES,
+            help='only compile the modules that are reachable through the '
+                 'imports from the entry points into the build directory',
+        )
+
+        argparser.add_argument(
+            '--gzip', default=False, action='store_true',
+            dest=CALMJS_SASSY_EXPORT_GZIP,
+            help='also write a gzip compressed copy of the export target '
+                 'with the .gz suffix',
+        )
+
+        argparser.add_argument(
+            '--postprocessor', default=[], action='append',
+            dest=CALMJS_SASSY_POSTPROCESSORS,
+            metavar='<name>',
+            help='name of a registered post-processor to apply onto the '
+                 'compiled output; may be specified multiple times, with '
+                 'the post-processors applied in the order specified',
+        )
+
+        argparser.add_argument(
+            '--prune-corpus', default=[], action='append',
+            dest=CALMJS_SASSY_PRUNE_CORPUS,
+            metavar='<path>',
+            help='path to the templates and scripts (or a directory of '
+                 'them) that make use of the compiled output, such that the '
+                 'rules with class names or ids not found within them are '
+                 'dropped; may be specified multiple times',
+        )
+
+        argparser.add_argument(
+            '--prune-allow', default=[], action='append',
+            dest=CALMJS_SASSY_PRUNE_ALLOWLIST,
+            metavar='<pattern>',
+            help='regular expression for the class names and ids that must '
+                 'not be pruned; may be specified multiple times',
+        )
+
+        argparser.add_argument(
+            '--cache-dir', default=None,
+            dest=CALMJS_SASSY_CACHE_DIR,
+            metavar='<cache_dir>',
+            help='directory for caching intermediate results for reuse '
+                 'across builds, such as the output of post-processors',
+        )
+
+        argparser.add_argument(
+            '--diagnostics-dir', default=None,
+            dest=CALMJS_SASSY_DIAGNOSTICS_DIR,
+            metavar='<diagnostics_dir>',
+            help='directory to write the files relevant to a failed '
+                 'compilation to, along with the locations of the error '
+                 'mapped back to the original modules',
+        )
+
+        argparser.add_argument(
+            '--critical-selector', default=[], action='append',
+            dest=CALMJS_SASSY_CRITICAL_SELECTORS,
+            metavar='<selector>',
+            help='selector for the elements critical to the initial '
+                 'rendering, such that the rules that may match them are '
+                 'also written to the critical target; may be specified '
+                 'multiple times',
+        )
+
+        argparser.add_argument(
+            '--critical-html', default=[], action='append',
+            dest=CALMJS_SASSY_CRITICAL_HTML_PATHS,
+            metavar='<path>',
+            help='path to a sample html document (or a directory of them) '
+                 'with the elements critical to the initial rendering; may '
+                 'be specified multiple times',
+        )
+
+        argparser.add_argument(
+            '--critical-target', default=None,
+            dest=CALMJS_SASSY_CRITICAL_TARGET,
+            metavar='<critical_target>',
+            help='the filename for the critical rules; defaults to '
+                 'critical.css next to the export target',
+        )
+
+        argparser.add_argument(
+            '--dry-run', default=False, action='store_true',
+            dest=CALMJS_SASSY_DRY_RUN,
+            help='report the registries, the modules and bundled files '
+                 'with their sizes, the entry points and the export target '
+                 'for the build without copying or compiling anything',
+        )
+
+        argparser.add_argument(
+            '--dry-run-format', default=CALMJS_SASSY_DRY_RUN_FORMAT_DEFAULT,
+            dest=CALMJS_SASSY_DRY_RUN_FORMAT,
+            choices=CALMJS_SASSY_DRY_RUN_FORMATS,
+            help='the format of the report for --dry-run; default: %s' % (
+                CALMJS_SASSY_DRY_RUN_FORMAT_DEFAULT),
+        )
+
     def create_spec(
             self, source_package_names=(), export_target=None,
             working_dir=None,
@@ -106,6 +263,17 @@ class ScssRuntime(SourcePackageToolchainRuntime):
             **kwargs
         )
 
+    def run(self, argparser=None, **kwargs):
+        if not kwargs.get(CALMJS_SASSY_DRY_RUN):
+            return super(ScssRuntime, self).run(argparser=argparser, **kwargs)
+
+        # the toolchain is not invoked, so nothing is copied or compiled.
+        spec = self.kwargs_to_spec(**kwargs)
+        write_plan(
+            plan_spec(spec, self.cli_driver), sys.stdout,
+            kwargs.get(CALMJS_SASSY_DRY_RUN_FORMAT))
+        return spec
+
 
 class LibsassRuntime(ScssRuntime):
     """
@@ -122,9 +290,21 @@ class LibsassRuntime(ScssRuntime):
     def init_argparser(self, argparser):
         super(LibsassRuntime, self).init_argparser(argparser)
 
+        from calmjs.sassy.assets import CALMJS_SASSY_COPY_ASSETS
+        from calmjs.sassy.assets import CALMJS_SASSY_INLINE_ASSETS_THRESHOLD
+        from calmjs.sassy.check import CALMJS_SASSY_CHECK
+        from calmjs.sassy.check import CALMJS_SASSY_CHECK_PROCESSES
+        from calmjs.sassy.coalesce import CALMJS_SASSY_COALESCE
+        from calmjs.sassy.depfile import CALMJS_SASSY_DEPFILE
+        from calmjs.sassy.fragments import CALMJS_SASSY_FRAGMENTS
+        from calmjs.sassy.fragments import CALMJS_SASSY_FRAGMENTS_EXCLUDE
         from calmjs.sassy.libsass import LIBSASS_OUTPUT_STYLE
         from calmjs.sassy.libsass import LIBSASS_OUTPUT_STYLE_DEFAULT
         from calmjs.sassy.libsass import LIBSASS_VALID_OUTPUT_STYLES
+        from calmjs.sassy.sandbox import CALMJS_SASSY_SANDBOX
+        from calmjs.sassy.sandbox import CALMJS_SASSY_SANDBOX_MEMORY
+        from calmjs.sassy.sandbox import CALMJS_SASSY_SANDBOX_TIMEOUT
+        from calmjs.sassy.sandbox import SANDBOX_TIMEOUT_DEFAULT
 
         argparser.add_argument(
             '-t', '--style', default=LIBSASS_OUTPUT_STYLE_DEFAULT,
@@ -133,3 +313,140 @@ class LibsassRuntime(ScssRuntime):
             help='coding style of the compiled result; default: %s' % (
                 LIBSASS_OUTPUT_STYLE_DEFAULT),
         )
+
+        argparser.add_argument(
+            '--copy-assets', default=False, action='store_true',
+            dest=CALMJS_SASSY_COPY_ASSETS,
+            help='copy the assets referenced through relative urls by the '
+                 'sources next to the export target, with the urls '
+                 'rewritten to the copies named by their digest',
+        )
+
+        argparser.add_argument(
+            '--inline-assets-threshold', default=None, type=int,
+            dest=CALMJS_SASSY_INLINE_ASSETS_THRESHOLD,
+            metavar='<bytes>',
+            help='inline the assets referenced through relative urls that '
+                 'are no larger than the specified size in bytes as data '
+                 'uris; larger assets will be copied as per --copy-assets',
+        )
+
+        argparser.add_argument(
+            '--fragments', default=False, action='store_true',
+            dest=CALMJS_SASSY_FRAGMENTS,
+            help='compile every entry point separately, with the results '
+                 'cached within the cache directory (--cache-dir) for '
+                 'reuse while their inputs are unchanged; entry points '
+                 'that cannot be compiled on their own will result in all '
+                 'of them being compiled together',
+        )
+
+        argparser.add_argument(
+            '--fragments-exclude', default=[], action='append',
+            dest=CALMJS_SASSY_FRAGMENTS_EXCLUDE,
+            metavar='<entry_point>',
+            help='entry point that depends on the other entry points (e.g. '
+                 'through shared variables), which requires all of them to '
+                 'be compiled together; may be specified multiple times',
+        )
+
+        argparser.add_argument(
+            '--sandbox', default=False, action='store_true',
+            dest=CALMJS_SASSY_SANDBOX,
+            help='invoke libsass within a separate worker process, such '
+                 'that the compilation may be stopped once it exceeds the '
+                 'limits specified by --sandbox-timeout and '
+                 '--sandbox-memory',
+        )
+
+        argparser.add_argument(
+            '--sandbox-timeout', default=None, type=float,
+            dest=CALMJS_SASSY_SANDBOX_TIMEOUT,
+            metavar='<seconds>',
+            help='the wall-clock time limit for every invocation of libsass '
+                 'within the sandbox; default: %d' % SANDBOX_TIMEOUT_DEFAULT,
+        )
+
+        argparser.add_argument(
+            '--sandbox-memory', default=None, type=int,
+            dest=CALMJS_SASSY_SANDBOX_MEMORY,
+            metavar='<megabytes>',
+            help='the address space limit for the sandboxed worker process, '
+                 'which includes the space used by the Python interpreter',
+        )
+
+        argparser.add_argument(
+            '--depfile', default=None,
+            dest=CALMJS_SASSY_DEPFILE,
+            metavar='<path>',
+            help='path to write a depfile (as understood by make and '
+                 'ninja) to after a successful build, listing the export '
+                 'target and every source that contributed to it',
+        )
+
+        argparser.add_argument(
+            '--coalesce', default=False, action='store_true',
+            dest=CALMJS_SASSY_COALESCE,
+            help='hold a lock on the export target for the digest of the '
+                 'inputs while building, such that concurrent builds of '
+                 'the same export target from the same inputs will wait '
+                 'for the first one and reuse its result',
+        )
+
+        argparser.add_argument(
+            '--check', default=False, action='store_true',
+            dest=CALMJS_SASSY_CHECK,
+            help='instead of producing the export target, compile every '
+                 'module (other than partials) from the given packages on '
+                 'its own and report all the modules that failed',
+        )
+
+        argparser.add_argument(
+            '--check-processes', default=None, type=int,
+            dest=CALMJS_SASSY_CHECK_PROCESSES,
+            metavar='<processes>',
+            help='the number of processes for compiling the modules for '
+                 '--check; defaults to the number of CPUs',
+        )
+
+    def run(self, argparser=None, **kwargs):
+        from calmjs.sassy.check import CALMJS_SASSY_CHECK
+        from calmjs.sassy.check import check_spec
+        from calmjs.sassy.check import write_check_results
+
+        if not kwargs.get(CALMJS_SASSY_CHECK):
+            return super(LibsassRuntime, self).run(
+                argparser=argparser, **kwargs)
+
+        # the spec is only created for the resolved sourcepaths, as the
+        # toolchain is not invoked.
+        spec = self.kwargs_to_spec(**kwargs)
+        if write_check_results(check_spec(spec), sys.stdout):
+            return False
+        return spec
+
+
+class SassyRuntime(RequiredCommandRuntime):
+    """
+    helpers for the calmjs.sassy package
+    """
+
+    def __init__(
+            self, entry_point_group=CALMJS_RUNTIME_SASSY,
+            action_key='sassy_runtime', *a, **kw):
+        super(SassyRuntime, self).__init__(
+            entry_point_group=entry_point_group,
+            action_key=action_key,
+            *a, **kw
+        )
+
+
+class FingerprintRuntime(BaseRuntime):
+    """
+    show the fingerprint of the current Python environment
+    """
+
+    def run(self, argparser=None, **kwargs):
+        result = environment_fingerprint()
+        sys.stdout.write(result + '\n')
+        return result
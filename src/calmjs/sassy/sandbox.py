@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Sandboxed compilation through libsass.
+
+The invocations of ``sass.compile`` may be done within a child process
+instead, such that a pathological source (e.g. a loop that never ends,
+or one that consumes all the available memory) can be stopped once it
+exceeds the specified wall-clock time or address space limit without
+affecting the process that is running the toolchain.  The worker
+processes are kept alive between the compilations and reused, so that
+the overhead of the isolation is limited to the transfer of the source
+and the result.
+"""
+
+from __future__ import unicode_literals
+
+import atexit
+import logging
+import multiprocessing
+import threading
+
+from calmjs.toolchain import EXPORT_MODULE_NAMES
+
+from calmjs.sassy.exc import CalmjsSassyRuntimeError
+from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# spec key for enabling the sandboxed compilation.
+CALMJS_SASSY_SANDBOX = 'calmjs_sassy_sandbox'
+# spec key for the wall-clock time limit for a compilation, in seconds.
+CALMJS_SASSY_SANDBOX_TIMEOUT = 'calmjs_sassy_sandbox_timeout'
+# spec key for the address space limit of the worker, in megabytes.
+CALMJS_SASSY_SANDBOX_MEMORY = 'calmjs_sassy_sandbox_memory'
+
+# the default wall-clock time limit, in seconds.
+SANDBOX_TIMEOUT_DEFAULT = 300
+
+# the status codes for the results sent back by the worker.
+_OK = 'ok'
+_ERROR = 'error'
+_MEMORY = 'memory'
+_EXCEPTION = 'exception'
+# the message for the failed allocations within libsass.
+_BAD_ALLOC = 'Unable to allocate memory'
+
+
+def _set_memory_limit(memory):
+    if memory and resource is not None:
+        limit = memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker_main(conn, memory):
+    """
+    The main loop of the worker process, which compiles the received
+    keyword arguments for sass.compile until the connection is closed.
+    """
+
+    _set_memory_limit(memory)
+    import sass
+    from calmjs.sassy.libsass import libsass_import_stub_generator
+
+    while True:
+        try:
+            kwargs, stub = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if stub is not None:
+            kwargs['importers'] = list(kwargs.get('importers') or ()) + [
+                (0, libsass_import_stub_generator(stub))]
+        try:
+            result = (_OK, sass.compile(**kwargs))
+        except MemoryError:
+            result = (_MEMORY, '')
+        except ValueError as e:
+            # sass.CompileError is a subclass of ValueError; the failed
+            # allocations within libsass are also reported through it.
+            result = (_MEMORY if memory and _BAD_ALLOC in str(e) else (
+                _ERROR), str(e))
+        except Exception as e:
+            result = (_EXCEPTION, '%s: %s' % (type(e).__name__, e))
+        conn.send(result)
+
+
+class CompileWorker(object):
+    """
+    A worker process for sass.compile.
+
+    Arguments:
+
+    memory
+        The address space limit for the worker, in megabytes.
+    """
+
+    def __init__(self, memory=None):
+        self.memory = memory
+        self.process = None
+        self.conn = None
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child_conn, self.memory))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        logger.debug("started compile worker pid %d", self.process.pid)
+
+    def stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def compile(self, kwargs, stub=None, timeout=SANDBOX_TIMEOUT_DEFAULT):
+        """
+        Compile with the keyword arguments for sass.compile within the
+        worker, with the values for the stub importer.  Raises ValueError
+        for compile errors, as sass.compile would, or the
+        CalmjsSassyRuntimeError if a limit was exceeded.
+        """
+
+        if not self.is_alive():
+            self.start()
+        try:
+            self.conn.send((kwargs, stub))
+        except Exception as e:
+            self.stop()
+            raise CalmjsSassyRuntimeError(
+                'unable to send the compilation to the sandboxed worker: '
+                '%s' % e)
+
+        if not self.conn.poll(timeout):
+            self.stop()
+            raise CalmjsSassyRuntimeError(
+                'sandboxed compilation exceeded the time limit of %s '
+                'seconds' % timeout)
+
+        try:
+            status, value = self.conn.recv()
+        except EOFError:
+            exitcode = self.process.exitcode if self.process else None
+            self.stop()
+            raise CalmjsSassyRuntimeError(
+                'sandboxed compile worker exited unexpectedly (exit code '
+                '%s)%s' % (exitcode, (
+                    '; the memory limit of %d MB may have been exceeded' %
+                    self.memory) if self.memory else ''))
+
+        if status == _OK:
+            return value
+        if status == _ERROR:
+            raise ValueError(value)
+        if status == _MEMORY:
+            self.stop()
+            raise CalmjsSassyRuntimeError(
+                'sandboxed compilation exceeded the memory limit of %d MB' %
+                self.memory)
+        raise CalmjsSassyRuntimeError(
+            'sandboxed compilation failed: %s' % value)
+
+
+class WorkerPool(object):
+    """
+    The idle workers that may be reused, for the different memory
+    limits; a worker is only used by a single compilation at a time.
+    """
+
+    def __init__(self):
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self, memory=None):
+        with self.lock:
+            for worker in self.idle:
+                if worker.memory == memory:
+                    self.idle.remove(worker)
+                    if worker.is_alive():
+                        return worker
+                    worker.stop()
+                    break
+        return CompileWorker(memory)
+
+    def release(self, worker):
+        if not worker.is_alive():
+            return
+        with self.lock:
+            self.idle.append(worker)
+
+    def stop(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.stop()
+
+
+workers = WorkerPool()
+atexit.register(workers.stop)
+
+
+def is_stub_importer(importer):
+    return getattr(importer, 'calmjs_sassy_stub', False)
+
+
+def sandbox_compile(spec, kwargs, importers=()):
+    """
+    Invoke sass.compile with the keyword arguments in a sandboxed
+    worker, using the limits specified in the spec.
+
+    Arguments:
+
+    spec
+        The spec.
+    kwargs
+        The keyword arguments for sass.compile, excluding importers.
+    importers
+        The importers; the stub importer generated for the spec will be
+        regenerated within the worker, while any other importers must
+        be able to be sent to the worker.
+    """
+
+    timeout = spec.get(CALMJS_SASSY_SANDBOX_TIMEOUT) or SANDBOX_TIMEOUT_DEFAULT
+    memory = spec.get(CALMJS_SASSY_SANDBOX_MEMORY) or None
+    if memory and resource is None:  # pragma: no cover
+        logger.warning(
+            'the address space limit for the sandboxed compilation is not '
+            'supported on this platform')
+
+    kwargs = dict(kwargs)
+    stub = None
+    others = []
+    for priority, importer in importers:
+        if is_stub_importer(importer):
+            stub = {
+                EXPORT_MODULE_NAMES: list(spec.get(EXPORT_MODULE_NAMES) or ()),
+                CALMJS_SASSY_SOURCEPATH_MERGED: spec.get(
+                    CALMJS_SASSY_SOURCEPATH_MERGED) or {},
+            }
+        else:
+            others.append((priority, importer))
+    if others:
+        kwargs['importers'] = others
+
+    worker = workers.acquire(memory)
+    try:
+        return worker.compile(kwargs, stub=stub, timeout=timeout)
+    finally:
+        workers.release(worker)
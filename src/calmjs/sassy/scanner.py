@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Scanning of the directories of Python modules for the stylesheets.
+
+The directories for all the entry points of a registry are scanned in a
+single pass using ``os.scandir`` (where available), concurrently on a
+pool of threads, with the files for all the stylesheet extensions being
+collected at the same time such that the results may be reused for the
+registries of the other extensions.  The results are merged in the
+order of the directories provided, with the files sorted, such that the
+resulting records are the same regardless of the order the scans were
+completed.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+from multiprocessing.pool import ThreadPool
+from os.path import isdir
+from os.path import isfile
+from os.path import join
+
+from calmjs.indexer import modpath_pkg_resources
+
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover
+    scandir = None
+
+logger = logging.getLogger(__name__)
+
+# the extensions of the files collected in a single pass.
+SCAN_EXTENSIONS = ('.scss', '.sass', '.css')
+# the names of the directories that will not be descended into.
+PRUNED_DIRNAMES = frozenset(['__pycache__', 'tests'])
+# the suffixes of the names of the directories that will not be
+# descended into.
+PRUNED_DIRSUFFIXES = ('.egg-info', '.dist-info')
+# the maximum number of threads for scanning.
+SCAN_THREADS = 8
+
+
+def is_pruned_dirname(name):
+    """
+    Return True if the directory with the name cannot contain any of
+    the stylesheets that should be registered.
+    """
+
+    return (
+        name in PRUNED_DIRNAMES or name.startswith('.') or
+        name.endswith(PRUNED_DIRSUFFIXES)
+    )
+
+
+def _iter_dir(path):
+    """
+    Yield 3-tuples of name, whether it is a directory (not following
+    symlinks) and whether it is a file, for the entries in path.
+    """
+
+    if scandir is not None:
+        for entry in scandir(path):
+            yield (
+                entry.name, entry.is_dir(follow_symlinks=False),
+                entry.is_file(),
+            )
+        return
+
+    for name in os.listdir(path):  # pragma: no cover
+        fullpath = join(path, name)
+        yield (
+            name, isdir(fullpath) and not os.path.islink(fullpath),
+            isfile(fullpath),
+        )
+
+
+def scan_root(root, extensions=SCAN_EXTENSIONS, recursive=False):
+    """
+    Return a dict of the extensions to the sorted list of paths, with
+    '/' as the separator, to the files with that extension relative to
+    the root directory.
+
+    Arguments:
+
+    root
+        The directory to scan.
+    extensions
+        The file extensions to collect.
+    recursive
+        Whether to descend into the subdirectories, other than the ones
+        that are pruned.
+    """
+
+    results = {ext: [] for ext in extensions}
+    pending = ['']
+    while pending:
+        prefix = pending.pop()
+        try:
+            entries = list(_iter_dir(join(root, *prefix.split('/'))))
+        except (IOError, OSError) as e:
+            logger.warning("unable to scan '%s': %s", root, e)
+            continue
+        for name, is_dir, is_file in entries:
+            relpath = prefix + name
+            if is_dir:
+                if recursive and not is_pruned_dirname(name):
+                    pending.append(relpath + '/')
+            elif is_file and not name.startswith('.'):
+                for ext in extensions:
+                    if name.endswith(ext):
+                        results[ext].append(relpath)
+    for paths in results.values():
+        paths.sort()
+    return results
+
+
+def scan_roots(
+        roots, extensions=SCAN_EXTENSIONS, recursive=False,
+        threads=SCAN_THREADS):
+    """
+    Return the list of the results from scan_root for each of the
+    roots, in the same order, with the roots scanned concurrently.
+    """
+
+    roots = list(roots)
+
+    def scan(root):
+        return scan_root(root, extensions=extensions, recursive=recursive)
+
+    if len(roots) < 2 or threads < 2:
+        return [scan(root) for root in roots]
+    pool = ThreadPool(min(threads, len(roots)))
+    try:
+        return pool.map(scan, roots)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def scan_mapper(
+        module, entry_point, fext='.scss', scanned=None, recursive=False):
+    """
+    A mapper that is compatible with calmjs.indexer.mapper, producing
+    the same records, while reusing the results already acquired for
+    the module from scanned, which is a mapping of the module name to
+    the list of 2-tuples of root and the results from scan_root.
+    """
+
+    listings = (scanned or {}).get(module.__name__)
+    if listings is None:
+        roots = modpath_pkg_resources(module, entry_point)
+        listings = list(zip(roots, scan_roots(
+            roots, extensions=(fext,), recursive=recursive)))
+
+    frags = module.__name__.split('.')
+    result = {}
+    for root, listing in listings:
+        for path in listing.get(fext, ()):
+            parts = path.split('/')
+            parts[-1] = parts[-1][:-len(fext)]
+            result['/'.join(frags + parts)] = join(root, *path.split('/'))
+    return result
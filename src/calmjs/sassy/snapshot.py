@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Serialization of the resolved parts of a spec.
+
+The resolution done by create_spec involves walking through the
+dependency graph and the registries for the provided packages, which
+can be expensive for a large environment.  The results are stored in a
+snapshot file keyed on the environment fingerprint, such that later
+executions (or other worker processes) may load the values instead of
+resolving them again.
+
+As the fingerprint only covers the installed distributions, every entry
+also records the signatures of the directories its values were derived
+from (i.e. the directories of the registered modules and the bundled
+sourcepaths), such that the addition or removal of the files within a
+develop installation or a node_modules directory will invalidate it.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import errno
+import hashlib
+import json
+import logging
+import os
+from os import listdir
+from os import stat
+from os.path import dirname
+from os.path import exists
+from os.path import isdir
+from tempfile import mkstemp
+
+from calmjs.toolchain import CALMJS_MODULE_REGISTRY_NAMES
+
+from calmjs.sassy.dist import registered_module_roots
+from calmjs.sassy.fingerprint import environment_fingerprint
+from calmjs.sassy.toolchain import CALMJS_SASSY_ENTRY_POINTS
+from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
+
+logger = logging.getLogger(__name__)
+
+# snapshot specific keys for the sourcepaths, these are stored before
+# the filtering of loaderplugins done by create_spec.
+SNAPSHOT_TRANSPILE_SOURCEPATH = 'transpile_sourcepath'
+SNAPSHOT_BUNDLE_SOURCEPATH = 'bundle_sourcepath'
+
+SNAPSHOT_KEYS = (
+    CALMJS_MODULE_REGISTRY_NAMES,
+    CALMJS_SASSY_ENTRY_POINTS,
+    CALMJS_SASSY_SOURCEPATH_MERGED,
+    SNAPSHOT_TRANSPILE_SOURCEPATH,
+    SNAPSHOT_BUNDLE_SOURCEPATH,
+)
+
+# the keys with the mapping of the sourcepaths that were resolved.
+_SOURCEPATH_KEYS = (
+    CALMJS_SASSY_SOURCEPATH_MERGED,
+    SNAPSHOT_TRANSPILE_SOURCEPATH,
+    SNAPSHOT_BUNDLE_SOURCEPATH,
+)
+
+# the version of the snapshot file format.
+SNAPSHOT_VERSION = 2
+
+
+def spec_snapshot_key(**kw):
+    """
+    Produce the key for a snapshot entry from the provided keyword
+    arguments, which should be the arguments that influence the values
+    resolved by create_spec.
+    """
+
+    return hashlib.sha1(json.dumps(
+        kw, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def snapshot_source_dirs(values):
+    """
+    Return the sorted list of the directories that the resolved values
+    were derived from, i.e. the directories of the modules registered
+    to the registries, along with the directories that contain or are
+    the resolved sourcepaths.
+    """
+
+    dirs = set(registered_module_roots(
+        values.get(CALMJS_MODULE_REGISTRY_NAMES) or ()))
+    for key in _SOURCEPATH_KEYS:
+        for path in (values.get(key) or {}).values():
+            dirs.add(path if isdir(path) else dirname(path))
+    return sorted(dirs)
+
+
+def _dir_signature(path):
+    try:
+        names = sorted(listdir(path))
+        mtime = stat(path).st_mtime
+    except (IOError, OSError):
+        return None
+    return hashlib.sha1(json.dumps(
+        [mtime, names]).encode('utf8')).hexdigest()
+
+
+def source_dirs_signatures(dirs):
+    """
+    Return the mapping of the provided directories to their signatures,
+    which are derived from their modification time and their listing,
+    or None for the directories that are missing.
+    """
+
+    return {path: _dir_signature(path) for path in dirs}
+
+
+def _read(path):
+    try:
+        with codecs.open(path, encoding='utf8') as fd:
+            return json.load(fd)
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            logger.warning("failed to read snapshot '%s': %s", path, e)
+    except ValueError as e:
+        logger.warning("snapshot '%s' is corrupted: %s", path, e)
+    return None
+
+
+def _write(path, data):
+    fd, tmp = mkstemp(dir=dirname(path) or None, prefix='.snapshot')
+    try:
+        with codecs.getwriter('utf8')(os.fdopen(fd, 'wb')) as writer:
+            json.dump(data, writer, sort_keys=True, separators=(',', ':'))
+        if exists(path) and os.name == 'nt':  # pragma: no cover
+            os.unlink(path)
+        os.rename(tmp, path)
+    except Exception:
+        if exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def load_spec_snapshot(path, key, fingerprint=None):
+    """
+    Load the snapshot values stored under key in the snapshot file at
+    path.  Return None if the snapshot is missing, or if it was created
+    with a different environment fingerprint.
+
+    Arguments:
+
+    path
+        The location of the snapshot file.
+    key
+        The key of the entry, as produced by spec_snapshot_key.
+    fingerprint
+        The fingerprint of the environment.  Defaults to the value
+        produced by environment_fingerprint.
+    """
+
+    data = _read(path)
+    if not data or data.get('version') != SNAPSHOT_VERSION:
+        return None
+    fingerprint = environment_fingerprint() if fingerprint is None else (
+        fingerprint)
+    if data.get('fingerprint') != fingerprint:
+        logger.debug(
+            "snapshot '%s' is stale as the environment fingerprint changed",
+            path)
+        return None
+    entry = data.get('entries', {}).get(key)
+    if entry is None:
+        return None
+    sources = entry.get('sources') or {}
+    if source_dirs_signatures(sources) != sources:
+        logger.debug(
+            "snapshot entry '%s' in '%s' is stale as its source directories "
+            "changed", key, path)
+        return None
+    return entry.get('values')
+
+
+def dump_spec_snapshot(values, path, key, fingerprint=None):
+    """
+    Write the snapshot values from the provided mapping as an entry
+    under key in the snapshot file at path.  Existing entries will be
+    retained if the snapshot was created with the same environment
+    fingerprint, otherwise they will be discarded.
+
+    Arguments:
+
+    values
+        A mapping which contains all the SNAPSHOT_KEYS.
+    path
+        The location of the snapshot file.
+    key
+        The key of the entry, as produced by spec_snapshot_key.
+    fingerprint
+        The fingerprint of the environment.  Defaults to the value
+        produced by environment_fingerprint.
+    """
+
+    fingerprint = environment_fingerprint() if fingerprint is None else (
+        fingerprint)
+    data = _read(path)
+    if (not data or data.get('version') != SNAPSHOT_VERSION or
+            data.get('fingerprint') != fingerprint):
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'fingerprint': fingerprint,
+            'entries': {},
+        }
+    data['entries'][key] = {
+        'values': {k: values[k] for k in SNAPSHOT_KEYS},
+        'sources': source_dirs_signatures(snapshot_source_dirs(values)),
+    }
+    _write(path, data)
+    logger.debug("wrote snapshot entry '%s' to '%s'", key, path)
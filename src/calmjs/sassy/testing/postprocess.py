@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Post-processors for the tests, importable through the entry points.
+"""
+
+from __future__ import unicode_literals
+
+from calmjs.sassy import postprocess
+
+
+class Upper(postprocess.PostProcessor):
+
+    calls = 0
+
+    def process(self, spec, chunks):
+        type(self).calls += 1
+        for chunk in chunks:
+            yield chunk.upper()
+
+
+class Banner(postprocess.TextPostProcessor):
+
+    def process_text(self, spec, text):
+        return '/* %s */\n%s' % (self.config.get('text', ''), text)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import unittest
+from os.path import join
+
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import assets
+from calmjs.sassy import libsass
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+
+
+def write(path, source):
+    with open(path, 'w') as fd:
+        fd.write(source)
+    return path
+
+
+class AssetUrlTestCase(unittest.TestCase):
+
+    def test_is_relative_url(self):
+        self.assertTrue(assets.is_relative_url('a.png'))
+        self.assertTrue(assets.is_relative_url('../fonts/a.woff?v=1'))
+        self.assertFalse(assets.is_relative_url('/a.png'))
+        self.assertFalse(assets.is_relative_url('//example.com/a.png'))
+        self.assertFalse(assets.is_relative_url('http://example.com/a.png'))
+        self.assertFalse(assets.is_relative_url('data:image/png;base64,AA'))
+        self.assertFalse(assets.is_relative_url('#filter'))
+        self.assertFalse(assets.is_relative_url('$path'))
+        self.assertFalse(assets.is_relative_url('#{$path}/a.png'))
+
+    def test_split_url(self):
+        self.assertEqual(('a.woff', ''), assets.split_url('a.woff'))
+        self.assertEqual(
+            ('a.woff', '?#iefix'), assets.split_url('a.woff?#iefix'))
+        self.assertEqual(('a.svg', '#id'), assets.split_url('a.svg#id'))
+
+    def test_mark_and_replace(self):
+        asset_urls = {}
+        source = (
+            '.a { background: url(img/a.png); }\n'
+            '.b { background: url("../img/b.png?v=1"); }\n'
+            ".c { background: url('img/a.png'); }\n"
+            '.d { background: url(http://example.com/d.png); }\n'
+        )
+        marked = assets.mark_asset_urls(
+            source, join(os.sep, 'src', 'pkg', 'style.scss'), asset_urls)
+        self.assertEqual({
+            '0': join(os.sep, 'src', 'pkg', 'img', 'a.png'),
+            '1': join(os.sep, 'src', 'img', 'b.png'),
+        }, asset_urls)
+        self.assertEqual(
+            '.a { background: url("calmjs-sassy-asset:0:img/a.png"); }\n'
+            '.b { background: url("calmjs-sassy-asset:1:../img/b.png?v=1"); '
+            '}\n'
+            '.c { background: url("calmjs-sassy-asset:0:img/a.png"); }\n'
+            '.d { background: url(http://example.com/d.png); }\n',
+            marked,
+        )
+        self.assertEqual(['0', '1', '0'], list(
+            assets.iter_asset_tokens(marked)))
+
+        with pretty_logging(stream=StringIO()) as stream:
+            result = assets.replace_asset_tokens(marked, asset_urls, {
+                asset_urls['0']: 'a.123.png',
+            }.get)
+        self.assertIn("the url '../img/b.png?v=1' will not", stream.getvalue())
+        self.assertEqual(
+            '.a { background: url("a.123.png"); }\n'
+            '.b { background: url("../img/b.png?v=1"); }\n'
+            '.c { background: url("a.123.png"); }\n'
+            '.d { background: url(http://example.com/d.png); }\n',
+            result,
+        )
+
+    def test_copy_assets(self):
+        root = mkdtemp(self)
+        target_dir = mkdtemp(self)
+        a = write(join(root, 'a.png'), 'a')
+        b = write(join(root, 'b.png'), 'b')
+        with pretty_logging(stream=StringIO()) as stream:
+            names = assets.copy_assets(
+                [a, b, a, join(root, 'missing.png')], target_dir)
+        self.assertIn('unable to read asset', stream.getvalue())
+        self.assertEqual({
+            a: 'a.86f7e437faa5.png',
+            b: 'b.e9d71f5ee7c9.png',
+            join(root, 'missing.png'): None,
+        }, names)
+        self.assertEqual(
+            ['a.86f7e437faa5.png', 'b.e9d71f5ee7c9.png'],
+            sorted(os.listdir(target_dir)))
+
+        with pretty_logging(stream=StringIO()) as stream:
+            assets.copy_assets([a], target_dir)
+        self.assertIn('already exists; skipping copy', stream.getvalue())
+        self.assertEqual({}, assets.copy_assets([], target_dir))
+
+    def test_media_type(self):
+        self.assertEqual('image/png', assets.media_type('a.png'))
+        self.assertEqual('font/woff2', assets.media_type('a.WOFF2'))
+        self.assertEqual(
+            'application/octet-stream', assets.media_type('a.unknownext'))
+
+    def test_copy_assets_inline(self):
+        stub_item_attr_value(self, assets, '_data_uris', {})
+        root = mkdtemp(self)
+        target_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        small = write(join(root, 'small.png'), 'abc')
+        large = write(join(root, 'large.png'), 'abcdef')
+        urls = assets.copy_assets(
+            [small, large], target_dir, inline_threshold=3,
+            cache_dir=cache_dir)
+        self.assertEqual({
+            small: 'data:image/png;base64,YWJj',
+            large: 'large.1f8ac10f23c5.png',
+        }, urls)
+        self.assertEqual(['large.1f8ac10f23c5.png'], os.listdir(target_dir))
+        self.assertEqual(
+            ['a9993e364706816aba3e25717850c26c9cd0d89d.b64'],
+            os.listdir(join(cache_dir, 'assets')))
+
+        # the encoded result is read from the cache directory.
+        stub_item_attr_value(self, assets, '_data_uris', {})
+        write(join(
+            cache_dir, 'assets', 'a9993e364706816aba3e25717850c26c9cd0d89d.b64'
+        ), 'Y2FjaGVk')
+        self.assertEqual(
+            'data:image/png;base64,Y2FjaGVk', assets.copy_assets(
+                [small], target_dir, inline_threshold=3,
+                cache_dir=cache_dir)[small])
+
+
+class LibsassAssetsTestCase(unittest.TestCase):
+
+    def test_toolchain_copy_assets(self):
+        src_dir = mkdtemp(self)
+        export_dir = mkdtemp(self)
+        os.mkdir(join(src_dir, 'img'))
+        write(join(src_dir, 'img', 'logo.png'), 'logo')
+        style = write(join(src_dir, 'style.scss'), (
+            '.logo { background: url(img/logo.png); }\n'
+            '.missing { background: url(img/missing.png); }\n'
+        ))
+        spec = Spec(
+            transpile_sourcepath={'pkg/style': style},
+            bundle_sourcepath={},
+            build_dir=mkdtemp(self),
+            export_target=join(export_dir, 'out.css'),
+            calmjs_sassy_entry_points=['pkg/style'],
+            calmjs_sassy_sourcepath_merged={},
+        )
+        libsass.libsass_spec_extras(
+            spec, libsass_output_style='compressed',
+            calmjs_sassy_copy_assets=True)
+        with pretty_logging(stream=StringIO()):
+            libsass.LibsassToolchain()(spec)
+        with open(spec['export_target']) as fd:
+            self.assertEqual(
+                '.logo{background:url("logo.5807dd602664.png")}'
+                '.missing{background:url("img/missing.png")}\n',
+                fd.read(),
+            )
+        self.assertEqual(
+            ['logo.5807dd602664.png', 'out.css'],
+            sorted(os.listdir(export_dir)))
+
+    def test_toolchain_inline_assets(self):
+        stub_item_attr_value(self, assets, '_data_uris', {})
+        src_dir = mkdtemp(self)
+        export_dir = mkdtemp(self)
+        write(join(src_dir, 'dot.svg'), '<svg/>')
+        style = write(join(src_dir, 'style.scss'), (
+            '.dot { background: url(dot.svg#x); }\n'
+        ))
+        spec = Spec(
+            transpile_sourcepath={'style': style},
+            bundle_sourcepath={},
+            build_dir=mkdtemp(self),
+            export_target=join(export_dir, 'out.css'),
+            calmjs_sassy_entry_points=['style'],
+            calmjs_sassy_sourcepath_merged={},
+        )
+        libsass.libsass_spec_extras(
+            spec, libsass_output_style='compressed',
+            calmjs_sassy_inline_assets_threshold=1024)
+        with pretty_logging(stream=StringIO()):
+            libsass.LibsassToolchain()(spec)
+        with open(spec['export_target']) as fd:
+            self.assertEqual(
+                '.dot{background:url("data:image/svg+xml;base64,'
+                'PHN2Zy8+")}\n',
+                fd.read(),
+            )
+        self.assertEqual(['out.css'], os.listdir(export_dir))
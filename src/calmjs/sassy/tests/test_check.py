@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import unittest
+from os.path import join
+
+from calmjs.toolchain import EXPORT_MODULE_NAMES
+from calmjs.toolchain import Spec
+
+from calmjs.sassy import check
+from calmjs.sassy import libsass
+from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def write(root, name, text):
+    path = join(root, name)
+    with open(path, 'w') as fd:
+        fd.write(text)
+    return path
+
+
+class CheckHelpersTestCase(unittest.TestCase):
+
+    def test_is_partial(self):
+        self.assertTrue(check.is_partial('example/_colors'))
+        self.assertTrue(check.is_partial('_colors'))
+        self.assertFalse(check.is_partial('example/colors'))
+        self.assertFalse(check.is_partial('_example/colors'))
+
+    def test_check_import_generator(self):
+        root = mkdtemp(self)
+        colors = write(root, '_colors.scss', '$color: #f00;\n')
+        importer = check.check_import_generator({
+            'example/_colors': colors,
+            'example/missing': join(root, 'missing.scss'),
+        }, stub={
+            EXPORT_MODULE_NAMES: ['example/_colors'],
+            CALMJS_SASSY_SOURCEPATH_MERGED: {'external/base': 'base.scss'},
+        })
+        self.assertEqual(
+            ((colors, '$color: #f00;\n'),), importer('example/colors'))
+        self.assertEqual(
+            ((colors, '$color: #f00;\n'),), importer('example/_colors'))
+        self.assertIsNone(importer('example/missing'))
+        self.assertEqual(
+            (('external/base/mixins', ''),), importer('external/base/mixins'))
+        self.assertIsNone(importer('unknown'))
+
+    def test_check_import_generator_bundled_dir(self):
+        root = mkdtemp(self)
+        os.makedirs(join(root, 'bs', 'mixins'))
+        variables = write(root, join('bs', '_vars.scss'), '$c: red;\n')
+        grid = write(root, join('bs', 'mixins', 'grid.scss'), '')
+        importer = check.check_import_generator({
+            'bs': join(root, 'bs'),
+            'bs/mixins': join(root, 'bs', 'mixins'),
+        })
+        self.assertEqual(((variables, '$c: red;\n'),), importer('bs/vars'))
+        self.assertEqual(((variables, '$c: red;\n'),), importer('bs/_vars'))
+        self.assertEqual(((grid, ''),), importer('bs/mixins/grid'))
+        self.assertEqual(((grid, ''),), importer('bs/mixins/grid.scss'))
+        self.assertIsNone(importer('bs/missing'))
+        self.assertIsNone(importer('bs'))
+
+    def test_write_check_results(self):
+        stream = StringIO()
+        self.assertEqual(1, check.write_check_results([
+            ('example/index', 'index.scss', None),
+            ('example/broken', 'broken.scss', 'Error: bad\n  on line 1\n'),
+        ], stream))
+        self.assertEqual(
+            "module 'example/broken' at 'broken.scss' failed:\n"
+            "    Error: bad\n"
+            "      on line 1\n"
+            "checked 2 module(s); 1 failed\n", stream.getvalue())
+
+
+@unittest.skipIf(
+    not libsass.HAS_LIBSASS, "'libsass' package is not installed")
+class CheckModulesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        root = mkdtemp(self)
+        self.sourcepath = {
+            'example/_colors': write(root, '_colors.scss', '$color: #f00;\n'),
+            'example/index': write(root, 'index.scss', (
+                '@import "example/colors";\n'
+                '@import "external/base";\n'
+                'body { color: $color; }\n'
+            )),
+            'example/relative': write(root, 'relative.scss', (
+                '@import "colors";\n'
+                'h1 { color: $color; }\n'
+            )),
+            'example/broken': write(root, 'broken.scss', 'body { color: }\n'),
+            'example/unknown': write(root, 'unknown.scss', (
+                'body { color: $unknown; }\n')),
+        }
+        self.stub = {
+            EXPORT_MODULE_NAMES: sorted(self.sourcepath),
+            CALMJS_SASSY_SOURCEPATH_MERGED: {'external/base': 'base.scss'},
+        }
+
+    def assertResults(self, results):
+        self.assertEqual([
+            'example/broken', 'example/index', 'example/relative',
+            'example/unknown',
+        ], [result[0] for result in results])
+        messages = dict((result[0], result[2]) for result in results)
+        self.assertIsNone(messages['example/index'])
+        self.assertIsNone(messages['example/relative'])
+        self.assertIn('broken.scss', messages['example/broken'])
+        self.assertIn('Undefined variable', messages['example/unknown'])
+
+    def test_check_modules_single_process(self):
+        self.assertResults(check.check_modules(
+            self.sourcepath, stub=self.stub, processes=1))
+
+    def test_check_modules_pool(self):
+        self.assertResults(check.check_modules(
+            self.sourcepath, stub=self.stub, processes=2))
+
+    def test_check_modules_no_stub(self):
+        results = check.check_modules(
+            self.sourcepath, modnames=['example/index'], processes=1)
+        self.assertEqual(1, len(results))
+        self.assertIn('external/base', results[0][2])
+
+    def test_check_modules_bundled_dir(self):
+        root = mkdtemp(self)
+        os.makedirs(join(root, 'nm', 'bs'))
+        write(root, join('nm', 'bs', '_vars.scss'), '$c: red;\n')
+        index = write(root, 'index.scss', (
+            '@import "bs/vars";\nbody { color: $c; }\n'))
+        other = write(root, 'other.scss', (
+            '@import "bs/_vars";\nh1 { color: $c; }\n'))
+        sourcepath = {
+            'pkg/index': index,
+            'pkg/other': other,
+            'bs': join(root, 'nm', 'bs'),
+        }
+        for processes in (1, 2):
+            self.assertEqual([
+                ('pkg/index', index, None),
+                ('pkg/other', other, None),
+            ], check.check_modules(
+                sourcepath, modnames={'pkg/index': 1, 'pkg/other': 1},
+                processes=processes))
+
+    def test_check_spec(self):
+        spec = Spec(
+            transpile_sourcepath={
+                'example/index': self.sourcepath['example/index'],
+                'example/_colors': self.sourcepath['example/_colors'],
+            },
+            bundle_sourcepath={
+                'example/relative': self.sourcepath['example/relative'],
+            },
+        )
+        spec[CALMJS_SASSY_SOURCEPATH_MERGED] = {'external/base': 'base.scss'}
+        # only the transpiled modules that are not partials are checked.
+        self.assertEqual([
+            ('example/index', self.sourcepath['example/index'], None),
+        ], check.check_spec(spec))
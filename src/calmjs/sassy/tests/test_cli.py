@@ -42,3 +42,26 @@ class SpecTestCase(unittest.TestCase):
         self.assertTrue(isinstance(spec, Spec))
         self.assertEqual(
             join(self.cwd, 'calmjs.sassy.export.css'), spec['export_target'])
+
+    def test_create_spec_diagnostics_dir(self):
+        with pretty_logging(stream=StringIO()):
+            spec = create_spec([])
+            self.assertNotIn('calmjs_sassy_diagnostics_dir', spec)
+            spec = create_spec([], calmjs_sassy_diagnostics_dir='diag')
+        self.assertEqual('diag', spec['calmjs_sassy_diagnostics_dir'])
+
+    def test_create_spec_prune(self):
+        with pretty_logging(stream=StringIO()):
+            spec = create_spec([], calmjs_sassy_postprocessors=['other'])
+            self.assertEqual(['other'], spec['calmjs_sassy_postprocessors'])
+            spec = create_spec(
+                [], calmjs_sassy_postprocessors=['other'],
+                calmjs_sassy_prune_corpus=['templates'],
+                calmjs_sassy_prune_allowlist=['js-.*'],
+            )
+        self.assertEqual(
+            ['prune', 'other'], spec['calmjs_sassy_postprocessors'])
+        self.assertEqual({
+            'corpus': ['templates'],
+            'allowlist': ['js-.*'],
+        }, spec['calmjs_sassy_postprocessor_configs']['prune'])
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import threading
+import time
+import unittest
+from os.path import exists
+from os.path import join
+
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import coalesce
+from calmjs.sassy import digest
+from calmjs.sassy import libsass
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def write(root, name, text):
+    path = join(root, name)
+    with open(path, 'w') as fd:
+        fd.write(text)
+    return path
+
+
+class FileLockTestCase(unittest.TestCase):
+
+    def test_coalesce_lock_path(self):
+        root = mkdtemp(self)
+        path = coalesce.coalesce_lock_path('/srv/a.css', 'abc', root)
+        self.assertTrue(path.startswith(join(root, 'calmjs_sassy-')))
+        self.assertTrue(path.endswith('.lock'))
+        self.assertEqual(
+            path, coalesce.coalesce_lock_path('/srv/a.css', 'abc', root))
+        self.assertNotEqual(
+            path, coalesce.coalesce_lock_path('/srv/a.css', 'abd', root))
+        self.assertNotEqual(
+            path, coalesce.coalesce_lock_path('/srv/b.css', 'abc', root))
+
+    def test_file_lock_exclusive(self):
+        path = join(mkdtemp(self), 'test.lock')
+        events = []
+
+        def other():
+            with coalesce.FileLock(path):
+                events.append('other')
+
+        with coalesce.FileLock(path) as lock:
+            self.assertTrue(exists(lock.path))
+            thread = threading.Thread(target=other)
+            thread.start()
+            time.sleep(0.2)
+            self.assertTrue(thread.is_alive())
+            events.append('first')
+        thread.join(5)
+        self.assertEqual(['first', 'other'], events)
+        # released locks may be released again.
+        lock.release()
+
+    def test_file_lock_non_blocking(self):
+        path = join(mkdtemp(self), 'test.lock')
+        with coalesce.FileLock(path):
+            lock = coalesce.FileLock(path)
+            self.assertFalse(lock.acquire(blocking=False))
+            self.assertIsNone(lock.fd)
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
+
+
+@unittest.skipIf(
+    not libsass.HAS_LIBSASS, "'libsass' package is not installed")
+class CoalesceToolchainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        self.cache_dir = join(self.root, 'cache')
+        self.index = write(self.root, 'index.scss', 'h1 { color: red; }\n')
+        self.target = join(self.root, 'ex.css')
+
+    def make_spec(self, **kw):
+        spec = Spec(
+            transpile_sourcepath={'ex/index': self.index},
+            export_target=self.target,
+            calmjs_sassy_entry_points=['ex/index'],
+            calmjs_sassy_cache_dir=self.cache_dir,
+            calmjs_sassy_coalesce=True,
+            **kw
+        )
+        spec[libsass.EXPORT_MODULE_NAMES] = ['ex/index']
+        return spec
+
+    def build(self, spec):
+        with pretty_logging(stream=StringIO()) as stream:
+            libsass.LibsassToolchain()(spec)
+        return stream.getvalue()
+
+    def test_toolchain_coalesce_sequential(self):
+        first = self.make_spec()
+        self.build(first)
+        self.assertFalse(first[coalesce.CALMJS_SASSY_COALESCED])
+        self.assertTrue(digest.is_artifact_fresh(
+            self.target, first[coalesce.CALMJS_SASSY_COALESCE_DIGEST],
+            self.cache_dir))
+        # the record is kept within the cache directory.
+        self.assertEqual(['ex.css', 'index.scss'], sorted(
+            name for name in os.listdir(self.root) if name != 'cache'))
+
+        # the existing export target is not reused as nothing else was
+        # building it.
+        second = self.make_spec(calmjs_sassy_export_gzip=True)
+        log = self.build(second)
+        self.assertFalse(second[coalesce.CALMJS_SASSY_COALESCED])
+        self.assertNotIn('skipped compilation', log)
+        self.assertTrue(exists(self.target + '.gz'))
+
+    def test_toolchain_coalesce_changed_inputs(self):
+        self.build(self.make_spec())
+        write(self.root, 'index.scss', 'h1 { color: blue; }\n')
+        spec = self.make_spec()
+        self.build(spec)
+        self.assertFalse(spec[coalesce.CALMJS_SASSY_COALESCED])
+        with open(self.target) as fd:
+            self.assertEqual('h1 {\n  color: blue; }\n', fd.read())
+
+    def test_toolchain_coalesce_wait(self):
+        spec = self.make_spec()
+        input_digest = digest.spec_input_digest(
+            spec, libsass.LIBSASS_OUTPUT_STYLE_DEFAULT)
+        lock = coalesce.FileLock(coalesce.coalesce_lock_path(
+            self.target, input_digest, self.cache_dir))
+
+        with lock:
+            thread = threading.Thread(target=self.build, args=(spec,))
+            thread.start()
+            time.sleep(0.2)
+            # waiting for the lock held by the "other" build.
+            self.assertTrue(thread.is_alive())
+            self.assertFalse(exists(self.target))
+            write(self.root, 'ex.css', 'h1 { color: red; }\n')
+            digest.write_artifact_record(
+                self.target, input_digest, record_dir=self.cache_dir)
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(spec[coalesce.CALMJS_SASSY_COALESCED])
+        # nothing was compiled into the build directory.
+        self.assertNotIn('transpiled_targetpaths', spec)
+        with open(self.target) as fd:
+            # the result of the "other" build is reused as is.
+            self.assertEqual('h1 { color: red; }\n', fd.read())
+
+    def test_toolchain_coalesce_wait_different_inputs(self):
+        spec = self.make_spec()
+        input_digest = digest.spec_input_digest(
+            spec, libsass.LIBSASS_OUTPUT_STYLE_DEFAULT)
+        lock = coalesce.FileLock(coalesce.coalesce_lock_path(
+            self.target, input_digest, self.cache_dir))
+
+        with lock:
+            thread = threading.Thread(target=self.build, args=(spec,))
+            thread.start()
+            time.sleep(0.2)
+            self.assertTrue(thread.is_alive())
+            # the "other" build produced it from other inputs.
+            write(self.root, 'ex.css', 'h1 { color: blue; }\n')
+            digest.write_artifact_record(
+                self.target, 'other', record_dir=self.cache_dir)
+        thread.join(10)
+        self.assertFalse(spec[coalesce.CALMJS_SASSY_COALESCED])
+        with open(self.target) as fd:
+            self.assertEqual('h1 {\n  color: red; }\n', fd.read())
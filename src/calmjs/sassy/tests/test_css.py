@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import codecs
+import os
+import unittest
+from os.path import join
+
+from calmjs.sassy import css
+
+from calmjs.testing.utils import mkdtemp
+
+NESTED = """@charset "UTF-8";
+/*! license */
+body {
+  margin: 0; }
+
+.header, .footer > a:hover {
+  color: red; }
+
+#main .content[data-x="{,}"] {
+  content: "}"; }
+
+@media (max-width: 10px) {
+  .header {
+    color: blue; }
+  .sidebar {
+    display: none; } }
+
+@font-face {
+  font-family: "x";
+  src: url("x.woff"); }
+"""
+
+
+class ParserTestCase(unittest.TestCase):
+
+    def test_parse_stylesheet(self):
+        nodes = css.parse_stylesheet(NESTED)
+        self.assertEqual([
+            css.Statement, css.Statement, css.StyleRule, css.StyleRule,
+            css.StyleRule, css.AtRule, css.AtRule,
+        ], [type(node) for node in nodes])
+        self.assertEqual('@charset "UTF-8";', nodes[0].text)
+        self.assertEqual(['.header', '.footer > a:hover'], nodes[3].selectors)
+        self.assertEqual(
+            ['#main .content[data-x="{,}"]'], nodes[4].selectors)
+        self.assertEqual('media', nodes[5].name)
+        self.assertEqual(2, len(nodes[5].children))
+        self.assertEqual('font-face', nodes[6].name)
+        self.assertIsNone(nodes[6].children)
+
+    def test_parse_compressed(self):
+        nodes = css.parse_stylesheet(
+            '.a,.b{color:red}@media print{.a{color:#000}}')
+        self.assertEqual(['.a', '.b'], nodes[0].selectors)
+        self.assertEqual('.b{color:red}', nodes[0].serialize_with(['.b']))
+        self.assertEqual(['.a'], nodes[1].children[0].selectors)
+
+    def test_split_selectors(self):
+        self.assertEqual(
+            ['a:not(.b, .c)', '[title="x,y"]'],
+            css.split_selectors('a:not(.b, .c), [title="x,y"]'))
+
+    def test_selector_features(self):
+        self.assertEqual({
+            ('tag', 'ul'), ('class', 'nav'), ('id', 'top'), ('tag', 'li'),
+            ('class', 'active'),
+        }, css.selector_features('ul.nav#top > LI.active:hover::before'))
+        self.assertEqual(
+            {('class', 'a')}, css.selector_features('.a:not(.b) [href="#x"]'))
+        self.assertEqual(
+            {('class', 'md:flex')}, css.selector_features(r'.md\:flex'))
+        self.assertEqual(frozenset(), css.selector_features('*'))
+
+
+class MatchTestCase(unittest.TestCase):
+
+    def test_selector_matcher(self):
+        matcher = css.SelectorMatcher({('class', 'a'), ('tag', 'div')})
+        self.assertTrue(matcher.matches('div.a'))
+        self.assertTrue(matcher.matches('*'))
+        self.assertFalse(matcher.matches('div .b'))
+        self.assertFalse(matcher.matches('span.a'))
+        matcher = css.SelectorMatcher({('class', 'a')}, match_tags=False)
+        self.assertTrue(matcher.matches('span.a'))
+
+    def test_extract_rules(self):
+        text, total, kept = css.extract_rules(NESTED, css.critical_features(
+            ['.header', 'body']))
+        self.assertEqual(5, total)
+        self.assertEqual(3, kept)
+        self.assertIn('@charset "UTF-8";', text)
+        self.assertIn('/*! license */', text)
+        self.assertIn('body {\n  margin: 0; }', text)
+        self.assertIn('.header {\n  color: red; }', text)
+        self.assertIn(
+            '@media (max-width: 10px) {\n.header {\n    color: blue; }\n}',
+            text)
+        self.assertIn('@font-face', text)
+        self.assertNotIn('footer', text)
+        self.assertNotIn('sidebar', text)
+        self.assertNotIn('#main', text)
+
+    def test_html_features(self):
+        root = mkdtemp(self)
+        os.mkdir(join(root, 'pages'))
+        with codecs.open(join(root, 'pages', 'index.html'), 'w', 'utf8') as fd:
+            fd.write(
+                '<html><body><div id="main" class="content  wide">'
+                '<p>text</p></div></body></html>')
+        with codecs.open(join(root, 'pages', 'notes.txt'), 'w', 'utf8') as fd:
+            fd.write('<span class="ignored"></span>')
+        features = css.html_features([root])
+        self.assertIn(('id', 'main'), features)
+        self.assertIn(('class', 'content'), features)
+        self.assertIn(('class', 'wide'), features)
+        self.assertIn(('tag', 'p'), features)
+        self.assertNotIn(('class', 'ignored'), features)
+
+        text, total, kept = css.extract_rules(NESTED, features)
+        self.assertIn('#main .content', text)
+        self.assertIn('body {', text)
+        self.assertNotIn('.header', text)
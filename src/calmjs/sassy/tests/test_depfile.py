@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import unittest
+from os.path import join
+
+from calmjs.toolchain import Spec
+
+from calmjs.sassy import depfile
+from calmjs.sassy import libsass
+from calmjs.sassy import sandbox
+
+from calmjs.testing.utils import mkdtemp
+
+
+def write(root, name, text):
+    path = join(root, *name.split('/'))
+    with open(path, 'w') as fd:
+        fd.write(text)
+    return path
+
+
+class DepfileFormatTestCase(unittest.TestCase):
+
+    def test_escape_path(self):
+        self.assertEqual('/srv/a\\ b/c.scss', depfile.escape_path(
+            '/srv/a b/c.scss'))
+        self.assertEqual('/srv/\\#1/$$x.scss', depfile.escape_path(
+            '/srv/#1/$x.scss'))
+
+    def test_format_depfile(self):
+        self.assertEqual('out.css:\n', depfile.format_depfile('out.css', []))
+        self.assertEqual(
+            'out.css: \\\n  a.scss \\\n  my\\ b.scss\n',
+            depfile.format_depfile('out.css', ['a.scss', 'my b.scss']))
+
+    def test_depfile_sources_unrecorded(self):
+        root = mkdtemp(self)
+        spec = Spec(
+            build_dir=mkdtemp(self),
+            transpile_sourcepath={'ex/index': join(root, 'index.scss')},
+            bundle_sourcepath={
+                'lib': root, 'single': join(root, 'single.scss')},
+        )
+        depfile.unrecorded_imports(spec)
+        self.assertIsNone(depfile.import_recorder_generator(spec))
+        # the directory is listed as is.
+        self.assertEqual(sorted([
+            root, join(root, 'index.scss'), join(root, 'single.scss'),
+        ]), depfile.depfile_sources(spec))
+
+
+@unittest.skipIf(
+    not libsass.HAS_LIBSASS, "'libsass' package is not installed")
+class DepfileToolchainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        root = mkdtemp(self)
+        self.lib = join(root, 'lib')
+        os.mkdir(self.lib)
+        self.mixins = write(self.lib, '_mixins.scss', '$size: 2em;\n')
+        self.used = write(self.lib, 'used.scss', (
+            '@import "mixins";\nh1 { font-size: $size; }\n'))
+        write(self.lib, 'unused.scss', 'h2 { color: red; }\n')
+        self.index = write(root, 'index.scss', (
+            '@import "lib/used";\n@import "external/base";\n'))
+        self.target = join(root, 'ex.css')
+        self.depfile = join(root, 'ex.css.d')
+
+    def make_spec(self, **kw):
+        spec = Spec(
+            transpile_sourcepath={'ex/index': self.index},
+            bundle_sourcepath={'lib': self.lib},
+            export_target=self.target,
+            build_dir=mkdtemp(self),
+            calmjs_sassy_entry_points=['ex/index'],
+            calmjs_sassy_depfile=self.depfile,
+            **kw
+        )
+        spec[libsass.CALMJS_SASSY_SOURCEPATH_MERGED] = {
+            'external/base': 'base.scss'}
+        spec[libsass.EXPORT_MODULE_NAMES] = ['ex/index', 'lib']
+        spec[libsass.LIBSASS_IMPORTERS] = [
+            (0, libsass.libsass_import_stub_generator(spec))]
+        return spec
+
+    def test_toolchain_depfile(self):
+        libsass.LibsassToolchain()(self.make_spec())
+        with open(self.target) as fd:
+            self.assertEqual('h1 {\n  font-size: 2em; }\n', fd.read())
+        with open(self.depfile) as fd:
+            # only the files within the bundled directory that were
+            # imported are listed.
+            self.assertEqual(depfile.format_depfile(self.target, sorted([
+                self.index, self.mixins, self.used,
+            ])), fd.read())
+
+    def test_toolchain_depfile_sandbox(self):
+        self.addCleanup(sandbox.workers.stop)
+        libsass.LibsassToolchain()(self.make_spec(
+            calmjs_sassy_sandbox=True))
+        with open(self.depfile) as fd:
+            self.assertEqual(depfile.format_depfile(self.target, sorted([
+                self.index, self.lib,
+            ])), fd.read())
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+from os.path import join
+
+from calmjs.sassy import diagnostics
+
+from calmjs.testing.utils import mkdtemp
+
+
+class DiagnosticsTestCase(unittest.TestCase):
+
+    def test_parse_libsass_locations(self):
+        self.assertEqual([
+            ('build/pkg/bad.scss', 2, 10),
+            ('stdin', 1, None),
+        ], diagnostics.parse_libsass_locations(
+            'Error: Undefined variable: "$missing".\n'
+            '        on line 2:10 of build/pkg/bad.scss\n'
+            '        from line 1 of stdin\n'
+            '>>   color: $missing;\n'
+        ))
+        self.assertEqual([], diagnostics.parse_libsass_locations('Error'))
+
+    def test_locate_compile_error(self):
+        build_dir = mkdtemp(self)
+        spec = {
+            'build_dir': build_dir,
+            'calmjs_sassy_entry_point_sourcefile': join(
+                build_dir, '__calmjs_sassy__', 'index.scss'),
+            'transpile_sourcepath': {'pkg/mod': '/src/pkg/mod.scss'},
+            'transpiled_targetpaths': {'pkg/mod': 'pkg/mod.scss'},
+            'bundle_sourcepath': {'lib/base': '/lib/base.scss'},
+            'bundled_targetpaths': {'lib/base': 'lib/base.scss'},
+        }
+        self.assertEqual([{
+            'path': join(build_dir, 'lib', 'base.scss'),
+            'modname': 'lib/base',
+            'sourcepath': '/lib/base.scss',
+            'line': 3,
+            'column': 1,
+        }, {
+            'path': join(build_dir, 'pkg', 'mod.scss'),
+            'modname': 'pkg/mod',
+            'sourcepath': '/src/pkg/mod.scss',
+            'line': 1,
+            'column': 9,
+        }, {
+            'path': join(build_dir, '__calmjs_sassy__', 'index.scss'),
+            'modname': None,
+            'sourcepath': None,
+            'line': 1,
+            'column': 9,
+        }], diagnostics.locate_compile_error(spec, (
+            'Error: invalid\n'
+            '        on line 3:1 of %s\n'
+            '        from line 1:9 of %s\n'
+            '        from line 1:9 of stdin\n'
+        ) % (
+            join(build_dir, 'lib', 'base.scss'),
+            join(build_dir, 'pkg', 'mod.scss'),
+        )))
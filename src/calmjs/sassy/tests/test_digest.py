@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import time
+import unittest
+from os.path import exists
+from os.path import join
+
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import digest
+from calmjs.sassy.dist import LazyModuleRegistrySourcepaths
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+
+
+def write(path, source):
+    with open(path, 'w') as fd:
+        fd.write(source)
+    return path
+
+
+def age(path, seconds=60):
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+class DigestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        self.a = write(join(self.root, 'a.scss'), '.a { color: red; }\n')
+        os.mkdir(join(self.root, 'lib'))
+        self.lib = join(self.root, 'lib')
+        write(join(self.lib, 'b.scss'), '.b { color: blue; }\n')
+        self.spec = {
+            'calmjs_sassy_entry_points': ['a'],
+            'transpile_sourcepath': {'a': self.a},
+            'bundle_sourcepath': {'lib': self.lib},
+        }
+
+    def test_file_digest(self):
+        self.assertEqual(
+            'da39a3ee5e6b4b0d3255bfef95601890afd80709',
+            digest.file_digest(write(join(self.root, 'empty'), '')))
+        self.assertNotEqual(
+            digest.file_digest(self.a),
+            digest.file_digest(join(self.lib, 'b.scss')))
+
+    def test_file_digest_mmap(self):
+        stub_item_attr_value(self, digest, 'MMAP_THRESHOLD', 4)
+        self.assertEqual(
+            hashlib.sha1(b'.a { color: red; }\n').hexdigest(),
+            digest.file_digest(self.a))
+
+    def test_spec_input_digest(self):
+        nested = digest.spec_input_digest(self.spec, 'nested')
+        self.assertEqual(nested, digest.spec_input_digest(self.spec, 'nested'))
+        self.assertNotEqual(
+            nested, digest.spec_input_digest(self.spec, 'compressed'))
+
+        # changes to files within a bundled directory.
+        write(join(self.lib, 'b.scss'), '.b { color: green; }\n')
+        changed = digest.spec_input_digest(self.spec, 'nested')
+        self.assertNotEqual(nested, changed)
+
+        write(self.a, '.a { color: blue; }\n')
+        self.assertNotEqual(
+            changed, digest.spec_input_digest(self.spec, 'nested'))
+
+        # the options that affect the output.
+        current = digest.spec_input_digest(self.spec, 'nested')
+        for key, value in (
+                ('calmjs_sassy_copy_assets', True),
+                ('calmjs_sassy_inline_assets_threshold', 1024),
+                ('calmjs_sassy_export_gzip', True),
+                ('calmjs_sassy_fragments', True),
+                ('calmjs_sassy_fragments_exclude', ['a']),
+                ('calmjs_sassy_sourcepath_merged', {'ext/a': '/ext/a.scss'})):
+            spec = dict(self.spec)
+            spec[key] = value
+            self.assertNotEqual(
+                current, digest.spec_input_digest(spec, 'nested'), key)
+
+        # missing files will still produce a digest.
+        os.unlink(self.a)
+        self.assertTrue(digest.spec_input_digest(self.spec, 'nested'))
+
+    def test_spec_input_digest_lazy_merged(self):
+        def lazy(package_names, extras=None):
+            return dict(self.spec, calmjs_sassy_sourcepath_merged=(
+                LazyModuleRegistrySourcepaths(
+                    ['calmjs.scss'], package_names, extras=extras)))
+
+        # the digest is derived from the arguments of the mapping,
+        # without any module names being looked up.
+        result = digest.spec_input_digest(lazy(['a']), 'nested')
+        self.assertEqual(
+            result, digest.spec_input_digest(lazy(['a']), 'nested'))
+        self.assertNotEqual(
+            result, digest.spec_input_digest(lazy(['b']), 'nested'))
+        self.assertNotEqual(result, digest.spec_input_digest(
+            lazy(['a'], extras={'x': '/x'}), 'nested'))
+
+    def test_spec_input_digest_store(self):
+        age(self.a)
+        age(join(self.lib, 'b.scss'))
+        nested = digest.spec_input_digest(self.spec, 'nested')
+        spec = dict(self.spec, calmjs_sassy_cache_dir=mkdtemp(self))
+        self.assertEqual(nested, digest.spec_input_digest(spec, 'nested'))
+        # the stored digest is used for the unchanged file.
+        stub_item_attr_value(self, digest, 'file_digest', None)
+        self.assertEqual(nested, digest.spec_input_digest(
+            spec, 'nested', store=digest.DigestStore(join(
+                spec['calmjs_sassy_cache_dir'],
+                digest.DIGEST_STORE_FILENAME))))
+
+    def test_artifact_record(self):
+        target = write(join(self.root, 'styles.css'), '.a{color:red}\n')
+        record_dir = join(mkdtemp(self), 'cache')
+        self.assertFalse(digest.is_artifact_fresh(target, 'abc', record_dir))
+        digest.write_artifact_record(target, 'abc', record_dir=record_dir)
+        # the record is not kept alongside the artifact.
+        self.assertEqual(['a.scss', 'lib', 'styles.css'], sorted(
+            os.listdir(self.root)))
+        self.assertTrue(exists(
+            digest.artifact_record_path(target, record_dir)))
+        self.assertTrue(digest.is_artifact_fresh(target, 'abc', record_dir))
+        self.assertFalse(digest.is_artifact_fresh(target, 'def', record_dir))
+        # other export targets have their own records.
+        other = write(join(self.root, 'other.css'), '.a{color:red}\n')
+        self.assertFalse(digest.is_artifact_fresh(other, 'abc', record_dir))
+
+        # modified artifact is no longer fresh.
+        write(target, '.a{color:blue}\n')
+        self.assertFalse(digest.is_artifact_fresh(target, 'abc', record_dir))
+        os.unlink(target)
+        self.assertFalse(digest.is_artifact_fresh(target, 'abc', record_dir))
+
+    def test_artifact_record_path(self):
+        target = join(self.root, 'styles.css')
+        record_dir = mkdtemp(self)
+        path = digest.artifact_record_path(target, record_dir)
+        self.assertTrue(path.startswith(join(record_dir, 'calmjs_sassy-')))
+        self.assertEqual(path, digest.artifact_record_path(
+            join(self.root, 'lib', '..', 'styles.css'), record_dir))
+        self.assertNotEqual(path, digest.artifact_record_path(
+            join(self.root, 'lib', 'styles.css'), record_dir))
+        # defaults to the temporary directory.
+        stub_item_attr_value(self, digest, 'gettempdir', lambda: record_dir)
+        self.assertEqual(path, digest.artifact_record_path(target))
+
+    def test_artifact_record_corrupted(self):
+        target = join(self.root, 'styles.css')
+        record_dir = mkdtemp(self)
+        write(digest.artifact_record_path(target, record_dir), '[]')
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertIsNone(digest.read_artifact_record(target, record_dir))
+        self.assertIn('is corrupted', stream.getvalue())
+        write(digest.artifact_record_path(target, record_dir), '{')
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertFalse(
+                digest.is_artifact_fresh(target, 'abc', record_dir))
+        self.assertIn('is corrupted', stream.getvalue())
+
+
+class DigestStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        self.path = join(self.root, 'cache', digest.DIGEST_STORE_FILENAME)
+        self.a = age(write(join(self.root, 'a.scss'), 'a'))
+        self.b = age(write(join(self.root, 'b.scss'), 'b'))
+
+    def make_store(self):
+        store = digest.DigestStore(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_digests(self):
+        store = self.make_store()
+        missing = join(self.root, 'missing.scss')
+        self.assertEqual({
+            self.a: digest.file_digest(self.a),
+            self.b: digest.file_digest(self.b),
+        }, store.digests([self.a, self.b, missing]))
+        self.assertTrue(exists(self.path))
+        with self.assertRaises(IOError):
+            store.digest(missing)
+
+        # the contents are not read again for the unchanged files, even
+        # by another store with the same database.
+        calls = []
+        original = digest.file_digest
+
+        def file_digest(path):
+            calls.append(path)
+            return original(path)
+
+        stub_item_attr_value(self, digest, 'file_digest', file_digest)
+        other = self.make_store()
+        self.assertEqual(original(self.a), other.digest(self.a))
+        self.assertEqual([], calls)
+
+        age(write(self.b, 'bb'))
+        self.assertEqual(hashlib.sha1(b'bb').hexdigest(), other.digest(self.b))
+        self.assertEqual([self.b], calls)
+        self.assertEqual(hashlib.sha1(b'bb').hexdigest(), other.digest(self.b))
+        self.assertEqual([self.b], calls)
+
+    def test_digests_racy(self):
+        # the recently modified files are not stored.
+        recent = write(join(self.root, 'recent.scss'), 'c')
+        self.make_store().digests([recent])
+        stub_item_attr_value(self, digest, 'file_digest', None)
+        with self.assertRaises(TypeError):
+            self.make_store().digests([recent])
+
+    def test_digests_batched(self):
+        stub_item_attr_value(self, digest, 'DIGEST_STORE_BATCH', 1)
+        store = self.make_store()
+        expected = store.digests([self.a, self.b])
+        self.assertEqual(expected, self.make_store().digests(
+            [self.a, self.b]))
+
+    def test_store_unavailable(self):
+        os.mkdir(join(self.root, 'cache'))
+        write(self.path, 'this is not a database')
+        store = self.make_store()
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertEqual(
+                digest.file_digest(self.a), store.digest(self.a))
+        self.assertIn('is unavailable', stream.getvalue())
+        # the store remains disabled.
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertEqual(
+                digest.file_digest(self.b), store.digest(self.b))
+        self.assertNotIn('is unavailable', stream.getvalue())
+
+    def test_get_digest_store(self):
+        cache_dir = join(self.root, 'cache')
+        store = digest.get_digest_store(cache_dir)
+        self.assertIs(store, digest.get_digest_store(cache_dir + os.sep))
+        self.assertIs(store, digest.spec_digest_store(
+            {'calmjs_sassy_cache_dir': cache_dir}))
+        self.assertIsNone(digest.spec_digest_store({}))
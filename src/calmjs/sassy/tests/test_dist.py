@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+from os.path import dirname
 from os.path import join
 import json
 from pkg_resources import WorkingSet
 
 from calmjs.utils import pretty_logging
 
+from calmjs.sassy import testing
 from calmjs.sassy.registry import SCSSRegistry
 from calmjs.sassy.dist import get_calmjs_scss_module_registry_for
 from calmjs.sassy.dist import generate_scss_sourcepaths
 from calmjs.sassy.dist import generate_scss_bundle_sourcepaths
+from calmjs.sassy.dist import LazyModuleRegistrySourcepaths
 
 from calmjs.testing.mocks import StringIO
 from calmjs.testing.utils import mkdtemp
@@ -229,3 +232,145 @@ class SourcepathTestCase(unittest.TestCase):
         }, generate_scss_bundle_sourcepaths(
             ['site'], working_dir=cwd, method='none',
         ))
+
+
+class LazyModuleRegistrySourcepathsTestCase(unittest.TestCase):
+    """
+    Test for the lazily resolved sourcepaths.
+    """
+
+    def setUp(self):
+        from calmjs.sassy import dist
+        stub_item_attr_value(self, dist, '_dependencies_registries', {})
+        self.regid = 'calmjs.sassy.lazy'
+        make_dummy_dist(self, (
+            ('entry_points.txt', '\n'.join([
+                '[calmjs.registry]',
+                'calmjs.sassy.lazy = calmjs.sassy.registry:SCSSRegistry',
+                '[calmjs.sassy.lazy]',
+                'calmjs.sassy.testing = calmjs.sassy.testing',
+            ])),
+        ), 'framework', '2.4')
+        make_dummy_dist(self, (
+            ('requires.txt', 'framework'),
+        ), 'site', '2.0')
+        make_dummy_dist(self, (
+            ('entry_points.txt', '\n'.join([
+                '[calmjs.sassy.lazy]',
+                'calmjs.sassy.tests = calmjs.sassy.tests',
+            ])),
+        ), 'other', '1.0')
+        self.working_set = WorkingSet([self._calmjs_testing_tmpdir])
+
+    def stub_registry(self):
+        from calmjs.registry import _inst
+        self.addCleanup(_inst.records.pop, self.regid, None)
+        registry = _inst.records[self.regid] = SCSSRegistry(
+            self.regid, _working_set=WorkingSet([]))
+        registry.records = {
+            'site': {
+                'site/base': '/src/site/base.scss',
+                'framework/base': '/src/site/framework_base.scss',
+            },
+            'framework': {
+                'framework/base': '/src/framework/base.scss',
+                'framework/colors': '/src/framework/colors.scss',
+            },
+            'other': {
+                'other/base': '/src/other/base.scss',
+            },
+        }
+        registry.package_module_map = {
+            'site': ['site'],
+            'framework': ['framework'],
+            'other': ['other'],
+        }
+        return registry
+
+    def test_lookups(self):
+        self.stub_registry()
+        sourcepaths = LazyModuleRegistrySourcepaths(
+            [self.regid, 'no.such.registry'], ['site'],
+            extras={'bootstrap': '/node_modules/bootstrap/scss'},
+            working_set=self.working_set,
+        )
+        self.assertTrue(sourcepaths)
+        self.assertIn('site/base', sourcepaths)
+        self.assertIn('framework/colors', sourcepaths)
+        self.assertIn('bootstrap', sourcepaths)
+        self.assertNotIn('framework/missing', sourcepaths)
+        # not within the dependency graph of the packages.
+        self.assertNotIn('other/base', sourcepaths)
+        # the same precedence as the 'all' method.
+        self.assertEqual(
+            '/src/site/framework_base.scss', sourcepaths['framework/base'])
+        self.assertEqual(
+            '/node_modules/bootstrap/scss', sourcepaths.get('bootstrap'))
+        self.assertIsNone(sourcepaths.get('missing'))
+        with self.assertRaises(KeyError):
+            sourcepaths['missing']
+        self.assertIn(self.regid, repr(sourcepaths))
+
+    def test_mapping(self):
+        self.stub_registry()
+        sourcepaths = LazyModuleRegistrySourcepaths(
+            [self.regid], ['site'], extras={'bootstrap': '/bootstrap'},
+            working_set=self.working_set,
+        )
+        self.assertTrue(sourcepaths)
+        self.assertEqual('/src/site/base.scss', sourcepaths['site/base'])
+        # the module names are unknown until they are looked up, so the
+        # usage as a full mapping fails loudly rather than through the
+        # fallback to __getitem__.
+        for f in (iter, len, sorted, list, dict, set):
+            with self.assertRaises(TypeError) as e:
+                f(sourcepaths)
+            self.assertIn('only supports the lookup', str(e.exception))
+        with self.assertRaises(TypeError):
+            sourcepaths.keys()
+
+    def test_lookups_cached(self):
+        registry = self.stub_registry()
+        sourcepaths = LazyModuleRegistrySourcepaths(
+            [self.regid], ['site'], working_set=self.working_set)
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertIn('site/base', sourcepaths)
+            self.assertIn('site/base', sourcepaths)
+        self.assertEqual(1, stream.getvalue().count('lazily resolved'))
+        # the cached value is used.
+        registry.records.clear()
+        self.assertIn('site/base', sourcepaths)
+
+    def test_dependencies_registry(self):
+        sourcepaths = LazyModuleRegistrySourcepaths(
+            [self.regid], ['site'], working_set=self.working_set)
+        with pretty_logging(stream=StringIO()):
+            self.assertIn('calmjs/sassy/testing/index', sourcepaths)
+            self.assertNotIn('calmjs/sassy/tests/missing', sourcepaths)
+
+        from calmjs.sassy import dist
+        from calmjs.registry import _inst
+        # the registry was not created for all packages.
+        self.assertNotIn(self.regid, _inst.records)
+        (registry,) = dist._dependencies_registries.values()
+        # the entry point from the unrelated package was never scanned.
+        self.assertEqual(['calmjs.sassy.testing'], sorted(registry.scanned))
+        self.assertEqual(['calmjs.sassy.testing'], sorted(registry.records))
+        self.assertEqual(
+            [dirname(testing.__file__)],
+            dist.registered_module_roots([self.regid]))
+        self.assertEqual([], dist.registered_module_roots(['no.such']))
+
+        # the explicit sourcepaths for the same packages reuse the same
+        # registry.
+        with pretty_logging(stream=StringIO()):
+            self.assertEqual({}, dist.generate_dependencies_scss_sourcepaths(
+                ['site'], [self.regid], working_set=self.working_set))
+        self.assertEqual([registry], list(
+            dist._dependencies_registries.values()))
+        with pretty_logging(stream=StringIO()):
+            self.assertIn(
+                'calmjs/sassy/testing/index',
+                dist.generate_dependencies_scss_sourcepaths(
+                    ['framework'], [self.regid],
+                    working_set=self.working_set))
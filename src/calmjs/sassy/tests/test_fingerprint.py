@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+import os
+from os.path import join
+from pkg_resources import WorkingSet
+
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import fingerprint
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import make_dummy_dist
+
+
+class EnvironmentFingerprintTestCase(unittest.TestCase):
+
+    def test_environment_fingerprint_entry_points(self):
+        working_dir = mkdtemp(self)
+        make_dummy_dist(self, (
+            ('requires.txt', ''),
+            ('entry_points.txt', ''),
+        ), 'example.package', '1.0', working_dir=working_dir)
+        first = fingerprint.environment_fingerprint(WorkingSet([working_dir]))
+        self.assertEqual(first, fingerprint.environment_fingerprint(
+            WorkingSet([working_dir])))
+
+        make_dummy_dist(self, (
+            ('requires.txt', ''),
+            ('entry_points.txt', (
+                '[calmjs.scss]\n'
+                'example.package = example.package\n'
+            )),
+        ), 'example.package', '1.0', working_dir=working_dir)
+        second = fingerprint.environment_fingerprint(
+            WorkingSet([working_dir]))
+        self.assertNotEqual(first, second)
+
+    def test_environment_fingerprint_egg_info_mtime(self):
+        working_dir = mkdtemp(self)
+        make_dummy_dist(self, (
+            ('requires.txt', ''),
+        ), 'example.package', '1.0', working_dir=working_dir)
+        working_set = WorkingSet([working_dir])
+        first = fingerprint.environment_fingerprint(working_set)
+        egg_info = join(working_dir, 'example.package-1.0.egg-info')
+        stat_result = os.stat(egg_info)
+        os.utime(egg_info, (stat_result.st_atime, stat_result.st_mtime + 1))
+        self.assertNotEqual(
+            first, fingerprint.environment_fingerprint(working_set))
+
+    def test_environment_fingerprint_default(self):
+        with pretty_logging(stream=StringIO()) as stream:
+            result = fingerprint.environment_fingerprint()
+        self.assertIn(result, stream.getvalue())
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import unittest
+from os.path import join
+
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import fragments
+from calmjs.sassy import libsass
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def write(path, source):
+    with open(path, 'w') as fd:
+        fd.write(source)
+    return path
+
+
+class FragmentDigestTestCase(unittest.TestCase):
+
+    def test_fragment_digest(self):
+        build_dir = mkdtemp(self)
+        os.mkdir(join(build_dir, 'pkg'))
+        write(join(build_dir, 'pkg', 'a.scss'), '@import "colors", "ext";\n')
+        colors = write(join(build_dir, 'pkg', '_colors.scss'), '$c: red;\n')
+        write(join(build_dir, 'pkg', 'b.scss'), '.b { color: red; }\n')
+
+        digest = fragments.fragment_digest('pkg/a', build_dir, ['nested'])
+        self.assertEqual(digest, fragments.fragment_digest(
+            'pkg/a', build_dir, ['nested']))
+        self.assertNotEqual(digest, fragments.fragment_digest(
+            'pkg/a', build_dir, ['compressed']))
+        self.assertNotEqual(digest, fragments.fragment_digest(
+            'pkg/a', build_dir, ['nested'], is_stubbed=lambda t: True))
+        self.assertNotEqual(digest, fragments.fragment_digest(
+            'pkg/b', build_dir, ['nested']))
+
+        write(colors, '$c: blue;\n')
+        self.assertNotEqual(digest, fragments.fragment_digest(
+            'pkg/a', build_dir, ['nested']))
+
+        write(colors, '@import "themes/#{$theme}";\n')
+        self.assertIsNone(fragments.fragment_digest('pkg/a', build_dir))
+
+    def test_scan_symbols(self):
+        symbols = fragments.scan_symbols(
+            '// $ignored: 1;\n'
+            '$a: 1;\n$b: 2 !default;\n'
+            '@mixin m($size, $c: $a) { width: f($size); }\n'
+            '@function f($x) { @return $x; }\n'
+            '.x { @include n; @extend %p, .y; margin: $z; }\n'
+        )
+        self.assertEqual(set([
+            '$a', '$b', '$c', '$size', '$x', '@mixin m', '@function f',
+        ]), symbols['defined'])
+        self.assertEqual(set(['$b']), symbols['defaults'])
+        self.assertEqual(set([
+            '$a', '$b', '$c', '$size', '$x', '$z', '@mixin n',
+            '@function f', '@function m',
+        ]), symbols['used'])
+        self.assertEqual(set(['%p', '.y']), symbols['extended'])
+        self.assertEqual(set(['%p', '.x', '.y']), symbols['selectors'])
+
+    def test_find_fragment_dependencies(self):
+        build_dir = mkdtemp(self)
+        write(join(build_dir, 'a.scss'), '@import "mixins";\n$w: 1px;\n')
+        write(join(build_dir, '_mixins.scss'), '@mixin m { x: y; }\n')
+        b = write(join(build_dir, 'b.scss'), '.b { @include m; }\n')
+        self.assertEqual(
+            ('b', ['@mixin m']),
+            fragments.find_fragment_dependencies(['a', 'b'], build_dir))
+
+        write(b, '@import "mixins";\n.b { @include m; width: 2px; }\n')
+        self.assertIsNone(
+            fragments.find_fragment_dependencies(['a', 'b'], build_dir))
+
+        write(b, '@import "#{$theme}";\n')
+        self.assertEqual(
+            ('b', []),
+            fragments.find_fragment_dependencies(['a', 'b'], build_dir))
+
+    def test_fragment_cache(self):
+        cache = fragments.FragmentCache(mkdtemp(self))
+        self.assertIsNone(cache.get('abc'))
+        self.assertIsNone(cache.get(None))
+        cache.put(None, '.a{}')
+        cache.put('abc', '.a{}')
+        self.assertEqual('.a{}', cache.get('abc'))
+
+
+class LibsassFragmentsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.src_dir = mkdtemp(self)
+        self.cache_dir = mkdtemp(self)
+        self.sources = {
+            'pkg/a': write(join(self.src_dir, 'a.scss'), '.a { color: red; }'),
+            'pkg/b': write(join(self.src_dir, 'b.scss'), '.b { color: red; }'),
+        }
+
+    def build(self, **kw):
+        spec = Spec(
+            transpile_sourcepath=self.sources,
+            bundle_sourcepath={},
+            export_target=join(self.src_dir, 'out.css'),
+            calmjs_sassy_entry_points=['pkg/a', 'pkg/b'],
+            calmjs_sassy_cache_dir=self.cache_dir,
+            calmjs_sassy_fragments=True,
+            **kw
+        )
+        with pretty_logging(stream=StringIO()) as stream:
+            libsass.LibsassToolchain()(spec)
+        with open(spec['export_target']) as fd:
+            return fd.read(), stream.getvalue()
+
+    def test_fragments_cached(self):
+        css, log = self.build()
+        self.assertEqual(
+            '.a {\n  color: red; }\n\n.b {\n  color: red; }\n', css)
+        self.assertIn("on entry point 'pkg/a'", log)
+        self.assertIn("on entry point 'pkg/b'", log)
+
+        write(self.sources['pkg/b'], '.b { color: blue; }')
+        css, log = self.build()
+        self.assertEqual(
+            '.a {\n  color: red; }\n\n.b {\n  color: blue; }\n', css)
+        self.assertNotIn("on entry point 'pkg/a'", log)
+        self.assertIn("on entry point 'pkg/b'", log)
+
+        css, log = self.build(libsass_output_style='compressed')
+        self.assertEqual('.a{color:red}\n.b{color:blue}\n', css)
+
+    def test_fragments_fallback(self):
+        write(self.sources['pkg/a'], '$c: red;\n')
+        write(self.sources['pkg/b'], '.b { color: $c; }')
+        css, log = self.build()
+        self.assertEqual('.b {\n  color: red; }\n', css)
+        self.assertIn(
+            "entry point 'pkg/b' may depend on $c from the other entry "
+            "points", log)
+        self.assertNotIn("on entry point 'pkg/b'", log)
+
+        css, log = self.build(calmjs_sassy_fragments_exclude=['pkg/b'])
+        self.assertEqual('.b {\n  color: red; }\n', css)
+        self.assertIn("entry points ['pkg/b'] excluded", log)
+        self.assertNotIn("on entry point 'pkg/a'", log)
+
+    def test_fragments_default_override(self):
+        write(self.sources['pkg/a'], '$brand: blue;\n')
+        write(self.sources['pkg/b'], (
+            '$brand: red !default;\n.b { color: $brand; }'))
+        css, log = self.build()
+        # as compiled together, rather than red from the fragment.
+        self.assertEqual('.b {\n  color: blue; }\n', css)
+        self.assertIn("entry point 'pkg/b' may depend on $brand", log)
+
+    def test_fragments_extend(self):
+        write(self.sources['pkg/b'], '.b { @extend .a; }')
+        css, log = self.build()
+        self.assertEqual('.a, .b {\n  color: red; }\n', css)
+        self.assertIn("entry point 'pkg/b' may depend on @extend .a", log)
+
+    def test_fragments_shared_imports(self):
+        self.sources['pkg/colors'] = write(join(self.src_dir, 'colors.scss'), (
+            '$c: red !default;\n@mixin m { color: $c; }\n'))
+        write(self.sources['pkg/a'], (
+            '@import "pkg/colors";\n.a { @include m; }'))
+        write(self.sources['pkg/b'], (
+            '@import "pkg/colors";\n.b { @include m; }'))
+        css, log = self.build()
+        self.assertEqual(
+            '.a {\n  color: red; }\n\n.b {\n  color: red; }\n', css)
+        self.assertIn("on entry point 'pkg/a'", log)
+        self.assertIn("on entry point 'pkg/b'", log)
+
+    def test_fragments_no_cache_dir(self):
+        self.cache_dir = None
+        css, log = self.build()
+        self.assertIn('no cache directory specified', log)
+        self.assertEqual(
+            '.a {\n  color: red; }\n\n.b {\n  color: red; }\n', css)
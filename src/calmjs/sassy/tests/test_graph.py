@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+import os
+from os.path import join
+
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import graph
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def write(path, source):
+    with open(path, 'w') as fd:
+        fd.write(source)
+    return path
+
+
+class ParseTestCase(unittest.TestCase):
+
+    def test_parse_imports(self):
+        self.assertEqual(['a', 'b/c', 'd'], graph.parse_imports(
+            '@import "a";\n'
+            "@import 'b/c', \"d\";\n"
+            '@import "e.css";\n'
+            '@import url(f);\n'
+            '@import "http://example.com/g";\n'
+            '@import "h" screen;\n'
+            '.x {\n'
+            '  @import "nested";\n'
+            '}\n'
+            '// @import "commented";\n'
+            '/* @import "block"; */\n'
+        ))
+
+    def test_strip_comments_retains_lines(self):
+        source = '/* a\nb */\nc // d\n'
+        self.assertEqual('\n\nc \n', graph.strip_comments(source))
+
+    def test_scss_source_emits_output(self):
+        self.assertFalse(graph.scss_source_emits_output('$a: 1;\n'))
+        self.assertFalse(graph.scss_source_emits_output(
+            '@mixin m($x) { .a { color: $x; } }\n'
+            '@function f($x) { @return $x; }\n'
+            '%placeholder { color: red; }\n'
+            '/* .b { color: red; } */\n'
+        ))
+        self.assertTrue(graph.scss_source_emits_output(
+            '@mixin m($x) { .a { color: $x; } }\n'
+            '.b { @include m(red); }\n'
+        ))
+
+
+class ResolveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        os.makedirs(join(self.root, 'pkg', 'sub'))
+        self.base = write(join(self.root, 'pkg', 'base.scss'), '')
+        self.partial = write(join(self.root, 'pkg', 'sub', '_part.scss'), '')
+
+    def test_resolve_include_paths(self):
+        self.assertEqual(self.base, graph.resolve_import_path(
+            'pkg/base', None, [self.root]))
+        self.assertEqual(self.base, graph.resolve_import_path(
+            'pkg/base.scss', None, [self.root]))
+        self.assertEqual(self.partial, graph.resolve_import_path(
+            'pkg/sub/part', None, [self.root]))
+        self.assertIsNone(graph.resolve_import_path(
+            'pkg/missing', None, [self.root]))
+
+    def test_resolve_relative(self):
+        self.assertEqual(self.partial, graph.resolve_import_path(
+            'sub/part', self.base, []))
+
+
+class ImportGraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = root = mkdtemp(self)
+        self.colors = write(join(root, 'colors.scss'), '$c: red;\n')
+        self.common = write(join(root, 'common.scss'), (
+            '@import "colors";\n'
+            '.common { color: $c; }\n'
+        ))
+        self.a = write(join(root, 'a.scss'), (
+            '@import "colors", "common";\n'
+            '@import "external";\n'
+            '.a { color: $c; }\n'
+        ))
+        self.b = write(join(root, 'b.scss'), (
+            '@import "common";\n'
+            '.b { color: $c; }\n'
+        ))
+
+    def test_order_and_importers(self):
+        g = graph.ImportGraph([self.a, self.b], [self.root])
+        self.assertEqual(
+            [self.colors, self.common, self.a, self.b], g.order)
+        self.assertEqual([self.colors, self.common], g.imports[self.a])
+        self.assertEqual(['external'], g.unresolved[self.a])
+        self.assertEqual([self.colors, self.common], list(g.iter_shared()))
+        self.assertEqual([self.a, self.b], g.importers[self.common])
+
+    def test_cycle(self):
+        write(self.colors, '@import "a";\n')
+        with pretty_logging(stream=StringIO()) as stream:
+            g = graph.ImportGraph([self.a], [self.root])
+        self.assertIn('import cycle detected', stream.getvalue())
+        self.assertEqual([self.colors, self.common, self.a], g.order)
+
+    def test_strip_resolved_imports(self):
+        self.assertEqual(
+            '\n'
+            '@import "external";\n'
+            '.a { color: $c; }\n',
+            graph.strip_resolved_imports(
+                graph.read_source(self.a), self.a, [self.root]),
+        )
+        self.assertEqual(
+            '@import "external", "x.css";\n',
+            graph.strip_resolved_imports(
+                '@import "common", "external", "x.css";\n',
+                self.a, [self.root]),
+        )
+
+    def test_find_late_import(self):
+        self.assertIsNone(graph.find_late_import(
+            graph.read_source(self.a), self.a, [self.root]))
+        self.assertIsNone(graph.find_late_import(
+            '// colors\n@import "colors";\n.a { color: $c; }\n'
+            '@import "external";\n', self.a, [self.root]))
+        self.assertEqual(2, graph.find_late_import(
+            '$c: blue;\n@import "colors";\n', self.a, [self.root]))
+        # hoisting past retained imports may also change the result.
+        self.assertEqual(2, graph.find_late_import(
+            '@import "x.css";\n@import "colors";\n', self.a, [self.root]))
+        self.assertEqual(1, graph.find_late_import(
+            '@import "external", "colors";\n', self.a, [self.root]))
+
+
+class ReachableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = root = mkdtemp(self)
+        os.mkdir(join(root, 'vendor'))
+        os.mkdir(join(root, 'vendor', 'scss'))
+        write(join(root, 'vendor', 'scss', '_grid.scss'), '.grid {}')
+        write(join(root, 'vendor', 'scss', 'unused.scss'), '.x {}')
+        self.layout = graph.SourcepathLayout({
+            'pkg/index': ('pkg/index.scss', write(join(root, 'index.scss'), (
+                '@import "colors", "vendor/scss/grid";\n'
+                '.a { @import "nested"; }\n'
+                '@import "print.css";\n'
+            ))),
+            'pkg/colors': ('pkg/colors.scss', write(
+                join(root, 'colors.scss'), '$c: red;\n')),
+            'pkg/nested': ('pkg/_nested.scss', write(
+                join(root, 'nested.scss'), '// @import "pkg/other";\n')),
+            'pkg/other': ('pkg/other.scss', write(
+                join(root, 'other.scss'), '.o {}')),
+            'vendor': ('vendor', join(root, 'vendor')),
+        })
+
+    def test_parse_all_imports(self):
+        self.assertEqual(['a', 'b', 'c', 'd"e'], graph.parse_all_imports(
+            '@import "a", \'b\';\n.x {\n  @import "c";\n}\n'
+            '/* @import "z"; */\n@import url(x.css);\n@import d"e;\n'))
+
+    def test_resolve(self):
+        self.assertEqual('pkg/colors.scss', self.layout.resolve(
+            'colors', 'pkg/index.scss')[0])
+        self.assertEqual('pkg/colors.scss', self.layout.resolve(
+            'pkg/colors')[0])
+        self.assertIsNone(self.layout.resolve('colors'))
+        path, key, source = self.layout.resolve('vendor/scss/grid')
+        self.assertEqual('vendor/scss/_grid.scss', path)
+        self.assertEqual('vendor', key)
+        self.assertEqual(
+            join(self.root, 'vendor', 'scss', '_grid.scss'), source)
+
+    def test_reachable_sourcepaths(self):
+        self.assertEqual(
+            {'pkg/index', 'pkg/colors', 'pkg/nested', 'vendor'},
+            graph.reachable_sourcepaths(['pkg/index'], self.layout))
+        self.assertEqual(set(), graph.reachable_sourcepaths(
+            ['missing'], self.layout))
+
+    def test_reachable_sourcepaths_interpolated(self):
+        layout = graph.SourcepathLayout({
+            'pkg/index': ('pkg/index.scss', write(join(
+                self.root, 'theme.scss'), '@import "themes/#{$theme}";\n')),
+        })
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertIsNone(
+                graph.reachable_sourcepaths(['pkg/index'], layout))
+        self.assertIn("'themes/#{$theme}'", stream.getvalue())
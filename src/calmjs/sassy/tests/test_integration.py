@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
 import unittest
 import os
 import sys
+from multiprocessing.pool import ThreadPool
 from textwrap import dedent
+from os.path import dirname
 from os.path import exists
 from os.path import join
 
@@ -13,7 +16,10 @@ from calmjs.toolchain import Spec
 from calmjs.runtime import main
 from calmjs.registry import get as get_registry
 
+from calmjs.sassy import artifact
+from calmjs.sassy import digest
 from calmjs.sassy import libsass
+from calmjs.sassy import sandbox
 from calmjs.sassy.cli import compile_all
 from calmjs.sassy import exc
 
@@ -22,6 +28,7 @@ from calmjs.sassy import libsass_runtime
 from calmjs.testing.mocks import StringIO
 from calmjs.testing.utils import mkdtemp
 from calmjs.testing.utils import remember_cwd
+from calmjs.testing.utils import stub_item_attr_value
 from calmjs.testing.utils import stub_stdouts
 from calmjs.sassy.testing.utils import setup_class_integration_environment
 from calmjs.sassy.testing.utils import teardown_class_integration_environment
@@ -47,7 +54,10 @@ class ToolchainIntegrationTestCase(unittest.TestCase):
         teardown_class_integration_environment(cls)
 
     def setUp(self):
-        pass
+        # keep the artifact records out of the real temporary directory.
+        self.record_dir = mkdtemp(self)
+        stub_item_attr_value(
+            self, digest, 'gettempdir', lambda: self.record_dir)
 
     def tearDown(self):
         # remove registries that got polluted with test data
@@ -258,6 +268,101 @@ class ToolchainIntegrationTestCase(unittest.TestCase):
             self.assertEqual(
                 'body { background-color: #f00; }\n', fd.read())
 
+    def test_libsass_compile_all_snapshot(self):
+        working_dir = mkdtemp(self)
+        snapshot_path = join(working_dir, 'snapshot.json')
+        with pretty_logging(stream=StringIO()) as stream:
+            spec = compile_all(
+                ['example.usage'], working_dir=working_dir,
+                snapshot_path=snapshot_path,
+            )
+        self.assertTrue(exists(snapshot_path))
+        self.assertIn("automatically picked registries", stream.getvalue())
+        self.assertNotIn("from snapshot", stream.getvalue())
+
+        with pretty_logging(stream=StringIO()) as stream:
+            cached_spec = compile_all(
+                ['example.usage'], working_dir=working_dir,
+                snapshot_path=snapshot_path,
+            )
+        self.assertNotIn("automatically picked registries", stream.getvalue())
+        self.assertIn("using resolved values from snapshot", stream.getvalue())
+        for key in (
+                'calmjs_module_registry_names', 'calmjs_sassy_entry_points',
+                'transpile_sourcepath', 'bundle_sourcepath',
+                'transpiled_targetpaths'):
+            self.assertEqual(spec[key], cached_spec[key])
+
+        with open(cached_spec['export_target']) as fd:
+            self.assertEqual(dedent('''
+            h1 {
+              font-weight: bold; }
+
+            body {
+              color: #f00; }
+            ''').lstrip(), fd.read())
+
+    def test_libsass_compile_all_dedupe(self):
+        working_dir = mkdtemp(self)
+        with pretty_logging(stream=StringIO()):
+            spec = compile_all(
+                ['example.usage'], working_dir=working_dir,
+                build_dir=mkdtemp(self),
+                calmjs_sassy_entry_points=[
+                    'example/usage/extras', 'example/usage/index'],
+                calmjs_sassy_assemble_method='dedupe',
+            )
+
+        with open(spec['calmjs_sassy_entry_point_sourcefile']) as fd:
+            self.assertEqual(
+                '@import "example/usage/extras";\n'
+                '@import "example/package/colors";\n'
+                '@import "example/usage/index";\n',
+                fd.read()
+            )
+
+        with open(spec['export_target']) as fd:
+            # the extras module is only emitted once.
+            self.assertEqual(dedent('''
+            h1 {
+              font-weight: bold; }
+
+            body {
+              color: #f00; }
+            ''').lstrip(), fd.read())
+
+    def test_libsass_compile_all_concurrent(self):
+        # many concurrent runs of different packages through the same
+        # toolchain instance, sharing the cache directory.
+        export_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        packages = ['example.package', 'example.usage', 'example.slim']
+
+        def run(idx):
+            package = packages[idx % len(packages)]
+            spec = compile_all(
+                [package], working_dir=self.dist_dir,
+                export_target=join(export_dir, '%d.css' % idx),
+                calmjs_sassy_cache_dir=cache_dir,
+                calmjs_sassy_fragments=True,
+            )
+            with open(spec['export_target']) as fd:
+                return package, fd.read()
+
+        with pretty_logging(stream=StringIO()):
+            expected = dict(run(idx) for idx in range(len(packages)))
+            pool = ThreadPool(8)
+            try:
+                results = pool.map(run, range(48))
+            finally:
+                pool.close()
+                pool.join()
+
+        self.assertEqual(3, len(set(expected.values())))
+        self.assertTrue(exists(join(cache_dir, 'fragments')))
+        for package, css in results:
+            self.assertEqual(expected[package], css)
+
     def test_no_such_package(self):
         with pretty_logging(stream=StringIO()) as stream:
             with self.assertRaises(exc.CalmjsSassyRuntimeError):
@@ -325,6 +430,80 @@ class ToolchainIntegrationTestCase(unittest.TestCase):
               font-weight: lighter; }
             ''').lstrip(), fd.read())
 
+    def test_slim_explicit_sourcepath_sandbox(self):
+        remember_cwd(self)
+        os.chdir(self.dist_dir)
+        self.addCleanup(sandbox.workers.stop)
+
+        with pretty_logging(stream=StringIO()):
+            spec = compile_all(
+                ['example.slim'], sourcepath_method='explicit',
+                calmjs_sassy_sandbox=True, calmjs_sassy_sandbox_timeout=30)
+
+        with open(spec['export_target']) as fd:
+            # the stub importer applies within the worker.
+            self.assertEqual(dedent('''
+            .mockstrap {
+              color: #f00; }
+
+            body {
+              font-weight: lighter; }
+            ''').lstrip(), fd.read())
+        self.assertEqual(1, len(sandbox.workers.idle))
+
+    def test_sandbox_compile_error(self):
+        remember_cwd(self)
+        os.chdir(self.dist_dir)
+        self.addCleanup(sandbox.workers.stop)
+        build_dir = mkdtemp(self)
+
+        with pretty_logging(stream=StringIO()):
+            with self.assertRaises(exc.CalmjsSassyCompileError) as e:
+                compile_all(
+                    ['example.package'], build_dir=build_dir,
+                    calmjs_sassy_entry_points=['example/package/missing'],
+                    calmjs_sassy_sandbox=True)
+        self.assertIn('failed to compile with libsass', str(e.exception))
+
+    def test_slim_explicit_sourcepath_lazy_merged(self):
+        remember_cwd(self)
+        os.chdir(self.dist_dir)
+
+        with pretty_logging(stream=StringIO()) as stream:
+            spec = compile_all(
+                ['example.slim'], sourcepath_method='explicit',
+                sourcepath_merged_method='lazy',
+            )
+
+        self.assertIn(
+            "lazily resolved 'example/usage/extras'", stream.getvalue())
+        with open(spec['export_target']) as fd:
+            self.assertEqual(dedent('''
+            .mockstrap {
+              color: #f00; }
+
+            body {
+              font-weight: lighter; }
+            ''').lstrip(), fd.read())
+
+    def test_slim_explicit_sourcepath_lazy_merged_coalesce(self):
+        remember_cwd(self)
+        os.chdir(self.dist_dir)
+        cache_dir = mkdtemp(self)
+
+        with pretty_logging(stream=StringIO()):
+            spec = compile_all(
+                ['example.slim'], sourcepath_method='explicit',
+                sourcepath_merged_method='lazy',
+                calmjs_sassy_coalesce=True,
+                calmjs_sassy_cache_dir=cache_dir,
+            )
+
+        self.assertFalse(spec['calmjs_sassy_coalesced'])
+        self.assertTrue(spec['calmjs_sassy_coalesce_digest'])
+        with open(spec['export_target']) as fd:
+            self.assertIn('.mockstrap {', fd.read())
+
     def test_slim_no_bundlepath(self):
         remember_cwd(self)
         os.chdir(self.dist_dir)
@@ -407,6 +586,121 @@ class ToolchainIntegrationTestCase(unittest.TestCase):
         self.assertIn("CRITICAL", log)
         self.assertIn('Undefined variable: "$theme-color".', log)
 
+    def test_runtime_check(self):
+        stub_stdouts(self)
+        working_dir = mkdtemp(self)
+        spec = libsass_runtime([
+            'example.usage', '--working-dir', working_dir, '--check',
+        ])
+        self.assertTrue(spec)
+        self.assertEqual(
+            'checked 4 module(s); 0 failed\n', sys.stdout.getvalue())
+        # no css written.
+        self.assertFalse(exists(join(working_dir, 'example.usage.css')))
+
+    def test_runtime_check_failure(self):
+        stub_stdouts(self)
+        working_dir = mkdtemp(self)
+        # the stubbed out colors module from example.package results in
+        # the failure of the index, but the other modules are checked.
+        result = libsass_runtime([
+            'example.usage', '--working-dir', working_dir, '--check',
+            '--check-processes', '2', '--sourcepath-method=explicit',
+        ])
+        self.assertFalse(result)
+        output = sys.stdout.getvalue()
+        self.assertIn("module 'example/usage/index' at ", output)
+        self.assertIn('Undefined variable: "$theme-color".', output)
+        self.assertIn('checked 2 module(s); 1 failed\n', output)
+        self.assertFalse(exists(join(working_dir, 'example.usage.css')))
+
+    def test_runtime_depfile(self):
+        stub_stdouts(self)
+        working_dir = mkdtemp(self)
+        depfile = join(working_dir, 'example.usage.css.d')
+        spec = libsass_runtime([
+            'example.usage', '--working-dir', working_dir,
+            '--depfile', depfile,
+        ])
+        with open(depfile) as fd:
+            self.assertEqual(
+                '%s: \\\n  %s \\\n  %s \\\n  %s \\\n  %s\n' % (
+                    spec['export_target'],
+                    join(self._ep_root, 'colors.scss'),
+                    join(self._ep_root, 'index.scss'),
+                    join(self._ep_usage, 'extras.scss'),
+                    join(self._ep_usage, 'index.scss'),
+                ), fd.read())
+
+    def test_runtime_coalesce(self):
+        stub_stdouts(self)
+        working_dir = mkdtemp(self)
+        spec = libsass_runtime([
+            'example.usage', '--working-dir', working_dir, '--coalesce',
+            '--cache-dir', join(working_dir, 'cache'),
+        ])
+        self.assertFalse(spec['calmjs_sassy_coalesced'])
+        self.assertTrue(spec['calmjs_sassy_coalesce_digest'])
+        self.assertTrue(exists(spec['export_target']))
+
+    def test_runtime_dry_run(self):
+        stub_stdouts(self)
+        export_target = join(mkdtemp(self), 'example.slim.css')
+        # the bundled fake_modules are within the dist_dir.
+        spec = libsass_runtime([
+            'example.slim', '--working-dir', self.dist_dir, '--dry-run',
+            '--export-target', export_target,
+        ])
+        self.assertTrue(spec)
+        output = sys.stdout.getvalue()
+        self.assertIn('registries: calmjs.scss\n', output)
+        self.assertIn('modules (5, ', output)
+        self.assertIn('    example/usage/extras: ', output)
+        self.assertIn('bundles (1, 27 bytes):\n    mockstrap: ', output)
+        self.assertIn('entry points:\n    example/slim/index\n', output)
+        self.assertIn('export target: %s\n' % spec['export_target'], output)
+        self.assertFalse(exists(spec['export_target']))
+
+    def test_runtime_dry_run_json(self):
+        stub_stdouts(self)
+        export_target = join(mkdtemp(self), 'example.slim.css')
+        spec = libsass_runtime([
+            'example.slim', '--working-dir', self.dist_dir, '--dry-run',
+            '--export-target', export_target,
+            '--dry-run-format', 'json', '--prune-modules',
+        ])
+        result = json.loads(sys.stdout.getvalue())
+        self.assertEqual(['example.slim'], result['package_names'])
+        self.assertEqual(['calmjs.scss'], result['registries'])
+        self.assertEqual(
+            ['example/slim/index', 'example/usage/extras'],
+            [item['modname'] for item in result['modules']])
+        self.assertEqual(
+            ['mockstrap'], [item['modname'] for item in result['bundles']])
+        self.assertEqual(
+            ['example/package/colors', 'example/package/index',
+             'example/usage/index'], result['pruned_modules'])
+        self.assertEqual(['example/slim/index'], result['entry_points'])
+        self.assertEqual(spec['export_target'], result['export_target'])
+        self.assertFalse(exists(spec['export_target']))
+
+    def test_runtime_gzip(self):
+        import gzip
+        stub_stdouts(self)
+        working_dir = mkdtemp(self)
+        spec = libsass_runtime([
+            'example.usage', '--working-dir', working_dir,
+            '--entry-point-name=extras', '--gzip',
+        ])
+        with open(spec['export_target']) as fd:
+            self.assertEqual('h1 {\n  font-weight: bold; }\n', fd.read())
+        with gzip.open(spec['export_target'] + '.gz') as fd:
+            self.assertEqual(
+                b'h1 {\n  font-weight: bold; }\n', fd.read())
+        self.assertEqual(
+            'd369b0897131c62b979d29d3619834db43daee1d',
+            spec['calmjs_sassy_export_digest'])
+
     def test_runtime_explicit_entry_point_name(self):
         stub_stdouts(self)
         working_dir = mkdtemp(self)
@@ -439,6 +733,11 @@ class ToolchainIntegrationTestCase(unittest.TestCase):
         self.assertEqual(e.exception.args[0], 0)
         for e, t, spec in builders:
             self.assertTrue(exists(spec['export_target']))
+            # no records are shipped along with the artifacts.
+            self.assertEqual([], [
+                name for name in os.listdir(dirname(spec['export_target']))
+                if 'calmjs_sassy' in name
+            ])
 
         with open(builders[0][2]['export_target']) as fd:
             # style.css
@@ -448,3 +747,180 @@ class ToolchainIntegrationTestCase(unittest.TestCase):
             # style.min.css
             self.assertEqual(
                 'h1{font-weight:bold}body{color:red}\n', fd.readline())
+
+    def test_artifact_shared_build(self):
+        target_dir = mkdtemp(self)
+        css_target = join(target_dir, 'styles.css')
+        min_target = join(target_dir, 'styles.min.css')
+        with pretty_logging(stream=StringIO()) as stream:
+            toolchain, css_spec = artifact.complete_css(
+                ['example.usage'], css_target)
+            min_toolchain, min_spec = artifact.complete_compressed_css(
+                ['example.usage'], min_target)
+
+        # resolved only once for both.
+        self.assertEqual(1, stream.getvalue().count(
+            'automatically picked registries'))
+        self.assertIs(toolchain, min_toolchain)
+        shared = css_spec['calmjs_sassy_shared_build']
+        self.assertIs(shared, min_spec['calmjs_sassy_shared_build'])
+        self.assertEqual(['nested', 'compressed'], shared.styles)
+        self.assertEqual(css_spec['build_dir'], min_spec['build_dir'])
+
+        toolchain(css_spec)
+        # the compressed output was produced alongside.
+        self.assertIn('compressed', shared.outputs)
+        self.assertTrue(exists(shared.build_dir))
+
+        with pretty_logging(stream=StringIO()) as stream:
+            toolchain(min_spec)
+        self.assertIn('reusing the shared build directory', stream.getvalue())
+        self.assertNotIn("invoking 'sass.compile'", stream.getvalue())
+        self.assertFalse(exists(shared.build_dir))
+
+        with open(css_target) as fd:
+            self.assertEqual('h1 {\n', fd.readline())
+        with open(min_target) as fd:
+            self.assertEqual(
+                'h1{font-weight:bold}body{color:red}\n', fd.readline())
+
+        # a subsequent build will not reuse the completed shared build.
+        toolchain, spec = artifact.complete_css(['example.usage'], css_target)
+        self.assertIsNot(shared, spec['calmjs_sassy_shared_build'])
+        spec['calmjs_sassy_shared_build'].cleanup()
+
+    def test_artifact_shared_build_libsass_compile(self):
+        target_dir = mkdtemp(self)
+        css_target = join(target_dir, 'styles.css')
+        min_target = join(target_dir, 'styles.min.css')
+        with pretty_logging(stream=StringIO()):
+            toolchain, css_spec = artifact.complete_css(
+                ['example.usage'], css_target)
+            min_toolchain, min_spec = artifact.complete_compressed_css(
+                ['example.usage'], min_target)
+        css_spec['calmjs_sassy_depfile'] = join(target_dir, 'styles.d')
+        min_spec['calmjs_sassy_depfile'] = join(target_dir, 'styles.min.d')
+
+        calls = []
+        original = artifact.SharedLibsassToolchain.libsass_compile
+
+        def libsass_compile(self, spec, source, output_style=None):
+            calls.append(output_style)
+            return original(self, spec, source, output_style)
+
+        stub_item_attr_value(
+            self, artifact.SharedLibsassToolchain, 'libsass_compile',
+            libsass_compile)
+        with pretty_logging(stream=StringIO()):
+            toolchain(css_spec)
+            toolchain(min_spec)
+        # both styles compiled through the toolchain by the first run.
+        self.assertEqual(['nested', 'compressed'], calls)
+        with open(min_target) as fd:
+            self.assertEqual(
+                'h1{font-weight:bold}body{color:red}\n', fd.readline())
+        # the imports recorded are provided for the depfile of both.
+        with open(join(target_dir, 'styles.d')) as fd:
+            css_depfile = fd.read()
+        with open(join(target_dir, 'styles.min.d')) as fd:
+            min_depfile = fd.read()
+        self.assertEqual(
+            css_depfile.split(':', 1)[1], min_depfile.split(':', 1)[1])
+        self.assertIn('.scss', css_depfile)
+
+    def test_artifact_shared_build_sandbox_parallel(self):
+        target_dir = mkdtemp(self)
+        css_target = join(target_dir, 'styles.css')
+        min_target = join(target_dir, 'styles.min.css')
+        with pretty_logging(stream=StringIO()):
+            toolchain, css_spec = artifact.complete_css(
+                ['example.usage'], css_target)
+            min_toolchain, min_spec = artifact.complete_compressed_css(
+                ['example.usage'], min_target)
+        css_spec['calmjs_sassy_sandbox'] = True
+        min_spec['calmjs_sassy_sandbox'] = True
+
+        with pretty_logging(stream=StringIO()) as stream:
+            toolchain(css_spec)
+            toolchain(min_spec)
+        self.assertIn(
+            "compiling the shared build for the output styles "
+            "['nested', 'compressed'] in parallel", stream.getvalue())
+        with open(css_target) as fd:
+            self.assertEqual('h1 {\n', fd.readline())
+        with open(min_target) as fd:
+            self.assertEqual(
+                'h1{font-weight:bold}body{color:red}\n', fd.readline())
+
+    def test_artifact_shared_build_skip_fresh_style(self):
+        target_dir = mkdtemp(self)
+        css_target = join(target_dir, 'styles.css')
+        min_target = join(target_dir, 'styles.min.css')
+        with pretty_logging(stream=StringIO()):
+            toolchain, spec = artifact.complete_compressed_css(
+                ['example.usage'], min_target)
+            spec['calmjs_sassy_shared_build'].styles.remove('nested')
+            toolchain(spec)
+
+        with pretty_logging(stream=StringIO()) as stream:
+            toolchain, css_spec = artifact.complete_css(
+                ['example.usage'], css_target)
+            min_toolchain, min_spec = artifact.complete_compressed_css(
+                ['example.usage'], min_target)
+            self.assertIn('calmjs_sassy_fresh_artifact', min_spec)
+            # only consider the artifact built here, rather than the
+            # ones declared for the package.
+            css_spec['calmjs_sassy_shared_build'].targets = {
+                'compressed': [min_target]}
+            toolchain(css_spec)
+            # as done by the artifact registry.
+            os.unlink(min_target)
+            min_toolchain(min_spec)
+
+        log = stream.getvalue()
+        # the up-to-date compressed artifact was not compiled again.
+        self.assertIn(
+            "compiling the shared build for the output styles ['nested']",
+            log)
+        self.assertIn("'%s' is up-to-date; skipped" % min_target, log)
+        with open(min_target) as fd:
+            self.assertEqual(
+                'h1{font-weight:bold}body{color:red}\n', fd.readline())
+
+    def test_artifact_fresh_skip(self):
+        target_dir = mkdtemp(self)
+        css_target = join(target_dir, 'styles.css')
+        with pretty_logging(stream=StringIO()):
+            toolchain, spec = artifact.complete_css(
+                ['example.usage'], css_target)
+            spec['calmjs_sassy_shared_build'].styles.remove('compressed')
+            self.assertNotIn('calmjs_sassy_fresh_artifact', spec)
+            toolchain(spec)
+        # the record is not shipped alongside the artifact.
+        self.assertEqual(['styles.css'], os.listdir(target_dir))
+        self.assertTrue(exists(digest.artifact_record_path(css_target)))
+        with open(css_target) as fd:
+            original = fd.read()
+
+        with pretty_logging(stream=StringIO()) as stream:
+            toolchain, spec = artifact.complete_css(
+                ['example.usage'], css_target)
+            spec['calmjs_sassy_shared_build'].styles.remove('compressed')
+            stash = spec['calmjs_sassy_fresh_artifact']
+            # as done by the artifact registry.
+            os.unlink(css_target)
+            toolchain(spec)
+
+        log = stream.getvalue()
+        self.assertIn('is up-to-date; skipped compilation', log)
+        self.assertNotIn("invoking 'sass.compile'", log)
+        self.assertFalse(exists(stash))
+        with open(css_target) as fd:
+            self.assertEqual(original, fd.read())
+
+        # a different style on the same target is not fresh.
+        with pretty_logging(stream=StringIO()):
+            toolchain, spec = artifact.complete_compressed_css(
+                ['example.usage'], css_target)
+            self.assertNotIn('calmjs_sassy_fresh_artifact', spec)
+            spec['calmjs_sassy_shared_build'].cleanup()
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
+import os
 import unittest
+from os.path import exists
+from os.path import join
 
 from calmjs.toolchain import Spec
 from calmjs.testing.utils import stub_item_attr_value
@@ -26,6 +30,99 @@ class LibsassToolchainTestCase(unittest.TestCase):
             )
             toolchain(spec)
 
+    def test_compile_error_location(self):
+        src_dir = mkdtemp(self)
+        build_dir = mkdtemp(self)
+        diagnostics_dir = join(mkdtemp(self), 'diagnostics')
+        bad = join(src_dir, 'bad.scss')
+        good = join(src_dir, 'good.scss')
+        with open(bad, 'w') as fd:
+            fd.write('.bad {\n  color: $missing;\n}\n')
+        with open(good, 'w') as fd:
+            fd.write('@import "pkg/bad";\n')
+        toolchain = libsass.LibsassToolchain()
+        spec = Spec(
+            transpile_sourcepath={'pkg/bad': bad, 'pkg/good': good},
+            bundle_sourcepath={},
+            build_dir=build_dir,
+            export_target=join(src_dir, 'out.css'),
+            calmjs_sassy_entry_points=['pkg/good'],
+            calmjs_sassy_diagnostics_dir=diagnostics_dir,
+        )
+        with self.assertRaises(exc.CalmjsSassyCompileError) as e:
+            toolchain(spec)
+
+        err = e.exception
+        self.assertTrue(isinstance(err, exc.CalmjsSassyRuntimeError))
+        self.assertEqual('pkg/bad', err.modname)
+        self.assertEqual(bad, err.sourcepath)
+        self.assertEqual(2, err.line)
+        self.assertEqual(10, err.column)
+        self.assertEqual(
+            ['pkg/bad', 'pkg/good', None],
+            [location['modname'] for location in err.locations])
+        self.assertIn("module 'pkg/bad' at line 2 of '%s'" % bad, str(err))
+
+        # only the relevant files were retained.
+        self.assertTrue(exists(join(diagnostics_dir, 'pkg', 'bad.scss')))
+        self.assertTrue(exists(join(diagnostics_dir, 'pkg', 'good.scss')))
+        self.assertTrue(exists(join(
+            diagnostics_dir, '__calmjs_sassy__', 'calmjs.sassy.scss')))
+        with open(err.diagnostics) as fd:
+            diagnostics = json.load(fd)
+        self.assertEqual({
+            'column': 10,
+            'line': 2,
+            'modname': 'pkg/bad',
+            'path': 'pkg/bad.scss',
+            'sourcepath': bad,
+        }, diagnostics['locations'][0])
+        self.assertEqual(
+            '__calmjs_sassy__/calmjs.sassy.scss',
+            diagnostics['locations'][-1]['path'].replace(os.sep, '/'))
+
+    def test_compile_error_no_diagnostics(self):
+        src_dir = mkdtemp(self)
+        bad = join(src_dir, 'bad.scss')
+        with open(bad, 'w') as fd:
+            fd.write('.bad { color: $missing; }\n')
+        toolchain = libsass.LibsassToolchain()
+        spec = Spec(
+            transpile_sourcepath={'bad': bad},
+            bundle_sourcepath={},
+            build_dir=mkdtemp(self),
+            export_target=join(src_dir, 'out.css'),
+            calmjs_sassy_entry_points=['bad'],
+        )
+        with self.assertRaises(exc.CalmjsSassyCompileError) as e:
+            toolchain(spec)
+        self.assertEqual('bad', e.exception.modname)
+        self.assertEqual(1, e.exception.line)
+        self.assertIsNone(e.exception.diagnostics)
+
+    def test_compile_dedupe_variable_before_import(self):
+        src_dir = mkdtemp(self)
+        theme = join(src_dir, 'theme.scss')
+        index = join(src_dir, 'index.scss')
+        with open(theme, 'w') as fd:
+            fd.write('$c: red !default;\n.theme { color: $c; }\n')
+        with open(index, 'w') as fd:
+            fd.write('$c: blue;\n@import "pkg/theme";\n')
+        toolchain = libsass.LibsassToolchain()
+        spec = Spec(
+            transpile_sourcepath={'pkg/theme': theme, 'pkg/index': index},
+            bundle_sourcepath={},
+            build_dir=mkdtemp(self),
+            export_target=join(src_dir, 'out.css'),
+            calmjs_sassy_entry_points=['pkg/index'],
+            calmjs_sassy_assemble_method='dedupe',
+        )
+        with pretty_logging(stream=StringIO()):
+            toolchain(spec)
+        with open(spec['export_target']) as fd:
+            # the override before the import is retained.
+            self.assertEqual('.theme {\n  color: blue; }\n', fd.read())
+
 
 class StubImporterTestCase(unittest.TestCase):
 
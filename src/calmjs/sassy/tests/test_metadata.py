@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+import pkg_resources
+from pkg_resources import Requirement
+from pkg_resources import WorkingSet
+
+from calmjs import base
+from calmjs import dist
+
+from calmjs.sassy import metadata
+from calmjs.sassy.dist import flatten_extras_calmjs_scss
+from calmjs.sassy.dist import flatten_module_registry_names
+from calmjs.sassy.registry import SCSSRegistry
+
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import make_dummy_dist
+from calmjs.testing.utils import stub_item_attr_value
+
+
+def pkg_info(name, version):
+    return ('PKG-INFO', 'Metadata-Version: 1.1\nName: %s\nVersion: %s\n' % (
+        name, version))
+
+
+@unittest.skipIf(
+    not metadata.HAS_IMPORTLIB_METADATA, 'importlib.metadata not available')
+class MetadataWorkingSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = mkdtemp(self)
+        make_dummy_dist(self, (
+            pkg_info('framework', '2.4'),
+            ('extras_calmjs_scss.json', json.dumps({
+                'node_modules': {'framework': 'framework/index.scss'},
+            })),
+            ('calmjs_scss_module_registry.txt', 'calmjs.scss\n'),
+        ), 'framework', '2.4', working_dir=self.working_dir)
+        make_dummy_dist(self, (
+            pkg_info('widget', '1.1'),
+            ('requires.txt', 'framework>=2.1\n\n[dev]\ntoolkit\n'),
+        ), 'widget', '1.1', working_dir=self.working_dir)
+        make_dummy_dist(self, (
+            pkg_info('toolkit', '1.0'),
+            ('entry_points.txt', '[calmjs.scss]\ntoolkit = toolkit\n'),
+        ), 'toolkit', '1.0', working_dir=self.working_dir)
+        self.working_set = metadata.MetadataWorkingSet([self.working_dir])
+
+    def test_find(self):
+        framework = self.working_set.find(Requirement.parse('framework'))
+        self.assertEqual('framework', framework.project_name)
+        self.assertEqual('framework 2.4', str(framework))
+        self.assertTrue(framework.has_metadata('extras_calmjs_scss.json'))
+        self.assertFalse(framework.has_metadata('no_such_file.txt'))
+        with self.assertRaises(IOError):
+            framework.get_metadata('no_such_file.txt')
+        self.assertIsNone(self.working_set.find(Requirement.parse('nothing')))
+
+    def test_requires(self):
+        widget = self.working_set.find(Requirement.parse('widget'))
+        self.assertEqual(
+            ['framework'], [req.key for req in widget.requires()])
+        self.assertEqual(
+            ['framework', 'toolkit'],
+            [req.key for req in widget.requires(['dev'])])
+
+    def test_resolve(self):
+        self.assertEqual(['framework', 'widget'], [
+            d.project_name for d in dist.find_packages_requirements_dists(
+                ['widget'], working_set=self.working_set)])
+        self.assertEqual(['framework', 'toolkit', 'widget'], [
+            d.project_name for d in dist.find_packages_requirements_dists(
+                ['widget[dev]'], working_set=self.working_set)])
+        self.assertEqual([], dist.find_packages_requirements_dists(
+            ['nothing'], working_set=self.working_set))
+
+    def test_helpers(self):
+        self.assertEqual(['calmjs.scss'], flatten_module_registry_names(
+            ['widget'], working_set=self.working_set))
+        self.assertEqual({
+            'framework': 'framework/index.scss',
+        }, flatten_extras_calmjs_scss(
+            ['widget'], working_set=self.working_set)['node_modules'])
+
+    def test_iter_entry_points(self):
+        entry_points = list(self.working_set.iter_entry_points('calmjs.scss'))
+        self.assertEqual(1, len(entry_points))
+        self.assertEqual('toolkit', entry_points[0].module_name)
+        self.assertEqual('toolkit', entry_points[0].dist.project_name)
+        self.assertEqual([], list(self.working_set.iter_entry_points(
+            'calmjs.scss', name='other')))
+
+
+class WorkingSetForTestCase(unittest.TestCase):
+
+    def test_working_set_for_default(self):
+        result = metadata.working_set_for(pkg_resources.working_set)
+        if metadata.HAS_IMPORTLIB_METADATA:
+            self.assertIs(metadata.get_working_set(), result)
+        else:  # pragma: no cover
+            self.assertIs(pkg_resources.working_set, result)
+
+    def test_working_set_for_disabled(self):
+        stub_item_attr_value(self, metadata, 'USE_IMPORTLIB_METADATA', False)
+        self.assertIs(pkg_resources.working_set, metadata.working_set_for(
+            pkg_resources.working_set))
+
+    def test_working_set_for_specific(self):
+        working_set = WorkingSet([])
+        self.assertIs(working_set, metadata.working_set_for(working_set))
+
+    def test_installed_consistent(self):
+        # the results through both lookups must agree for the package
+        # itself.
+        results = flatten_module_registry_names(['calmjs.sassy'])
+        stub_item_attr_value(self, metadata, 'USE_IMPORTLIB_METADATA', False)
+        self.assertEqual(
+            results, flatten_module_registry_names(['calmjs.sassy']))
+        self.assertEqual(['calmjs.scss'], results)
+
+    def test_registry_stubbed_working_set(self):
+        working_set = WorkingSet([])
+        stub_item_attr_value(self, base, 'working_set', working_set)
+        registry = SCSSRegistry('calmjs.scss')
+        self.assertEqual([], registry.raw_entry_points)
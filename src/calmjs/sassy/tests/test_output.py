@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import codecs
+import gzip
+import hashlib
+import os
+import unittest
+from os.path import exists
+from os.path import join
+
+from calmjs.sassy import output
+
+from calmjs.testing.utils import mkdtemp
+
+
+class ChunksTestCase(unittest.TestCase):
+
+    def test_iter_text_chunks(self):
+        self.assertEqual(
+            ['abc', 'def', 'g'], list(output.iter_text_chunks('abcdefg', 3)))
+        self.assertEqual([], list(output.iter_text_chunks('')))
+
+    def test_iter_file_chunks(self):
+        path = join(mkdtemp(self), 'file')
+        with codecs.open(path, 'w', encoding='utf8') as fd:
+            fd.write('abcde')
+        with codecs.open(path, encoding='utf8') as fd:
+            self.assertEqual(
+                ['ab', 'cd', 'e'], list(output.iter_file_chunks(fd, 2)))
+
+
+class SinkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+
+    def test_stream_chunks(self):
+        target = join(self.root, 'out.css')
+        text = '.a { content: "☃"; }\n' * 10
+        digest = output.DigestSink()
+        output.stream_chunks(output.iter_text_chunks(text, 7), [
+            output.FileSink(target),
+            output.GzipSink(target + '.gz'),
+            digest,
+        ])
+        with codecs.open(target, encoding='utf8') as fd:
+            self.assertEqual(text, fd.read())
+        with gzip.open(target + '.gz') as fd:
+            self.assertEqual(text, fd.read().decode('utf8'))
+        self.assertEqual(
+            hashlib.sha1(text.encode('utf8')).hexdigest(), digest.hexdigest)
+        self.assertEqual(['out.css', 'out.css.gz'], sorted(
+            os.listdir(self.root)))
+
+    def test_stream_chunks_abort(self):
+        target = join(self.root, 'out.css')
+        with open(target, 'w') as fd:
+            fd.write('original')
+
+        def chunks():
+            yield 'partial'
+            raise ValueError('failure')
+
+        with self.assertRaises(ValueError):
+            output.stream_chunks(chunks(), [
+                output.FileSink(target),
+                output.GzipSink(target + '.gz'),
+            ])
+        # the original is untouched, and no partial files remain.
+        with open(target) as fd:
+            self.assertEqual('original', fd.read())
+        self.assertFalse(exists(target + '.gz'))
+        self.assertEqual(['out.css'], os.listdir(self.root))
+
+    def test_file_sink_permissions(self):
+        reference = join(self.root, 'reference')
+        with open(reference, 'w'):
+            pass
+        target = join(self.root, 'out.css')
+        output.stream_chunks(['.a{}'], [output.FileSink(target)])
+        # the permissions as per the umask, as for any other new file.
+        self.assertEqual(
+            os.stat(reference).st_mode, os.stat(target).st_mode)
+
+    def test_create_temp_file(self):
+        target = join(self.root, 'out.css')
+        fd1, tmp1 = output.create_temp_file(target)
+        fd2, tmp2 = output.create_temp_file(target)
+        os.close(fd1)
+        os.close(fd2)
+        self.assertNotEqual(tmp1, tmp2)
+        self.assertTrue(os.path.basename(tmp1).startswith('.out.css.'))
+        self.assertEqual(self.root, os.path.dirname(tmp1))
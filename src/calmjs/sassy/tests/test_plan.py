@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import unittest
+from os.path import join
+
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import plan
+from calmjs.sassy.toolchain import BaseScssToolchain
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+
+def write(root, name, text):
+    path = join(root, name)
+    with open(path, 'w') as fd:
+        fd.write(text)
+    return path
+
+
+class PlanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        self.index = write(self.root, 'index.scss', '@import "ex/colors";\n')
+        self.colors = write(self.root, 'colors.scss', '$c: #f00;\n')
+        self.unused = write(self.root, 'unused.scss', 'a { b: c; }\n')
+        self.bundle = join(self.root, 'bundle')
+        os.mkdir(self.bundle)
+        write(self.bundle, 'a.scss', 'abc')
+        write(self.bundle, 'b.scss', 'de')
+
+    def make_spec(self, **kw):
+        return Spec(
+            source_package_names=['ex'],
+            calmjs_module_registry_names=['calmjs.scss'],
+            transpile_sourcepath={
+                'ex/index': self.index,
+                'ex/colors': self.colors,
+                'ex/unused': self.unused,
+            },
+            bundle_sourcepath={'bundle': self.bundle},
+            calmjs_sassy_entry_points=['ex/index'],
+            export_target=join(self.root, 'ex.css'),
+            **kw
+        )
+
+    def test_sourcepath_size(self):
+        self.assertEqual(10, plan.sourcepath_size(self.colors))
+        self.assertEqual(5, plan.sourcepath_size(self.bundle))
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertIsNone(
+                plan.sourcepath_size(join(self.root, 'missing.scss')))
+        self.assertIn('unable to determine the size', stream.getvalue())
+
+    def test_plan_spec(self):
+        result = plan.plan_spec(self.make_spec(), BaseScssToolchain())
+        self.assertEqual(['ex'], result['package_names'])
+        self.assertEqual(['calmjs.scss'], result['registries'])
+        self.assertEqual(
+            ['ex/colors', 'ex/index', 'ex/unused'],
+            [item['modname'] for item in result['modules']])
+        self.assertEqual([
+            {'modname': 'bundle', 'sourcepath': self.bundle, 'size': 5},
+        ], result['bundles'])
+        self.assertEqual([], result['pruned_modules'])
+        self.assertEqual(10 + 21 + 12 + 5, result['total_size'])
+        self.assertEqual(['ex/index'], result['entry_points'])
+        self.assertEqual(join(self.root, 'ex.css'), result['export_target'])
+        # nothing was written.
+        self.assertFalse(os.path.exists(result['export_target']))
+
+    def test_plan_spec_pruned(self):
+        with pretty_logging(stream=StringIO()):
+            result = plan.plan_spec(self.make_spec(
+                calmjs_sassy_prune_modules=True), BaseScssToolchain())
+        self.assertEqual(
+            ['ex/colors', 'ex/index'],
+            [item['modname'] for item in result['modules']])
+        self.assertEqual([], result['bundles'])
+        self.assertEqual(['bundle', 'ex/unused'], result['pruned_modules'])
+        self.assertEqual(31, result['total_size'])
+
+    def test_write_plan_text(self):
+        stream = StringIO()
+        with pretty_logging(stream=StringIO()):
+            plan.write_plan(plan.plan_spec(self.make_spec(
+                calmjs_sassy_prune_modules=True), BaseScssToolchain()), stream)
+        self.assertEqual(
+            'packages: ex\n'
+            'registries: calmjs.scss\n'
+            'modules (2, 31 bytes):\n'
+            '    ex/colors: %s (10 bytes)\n'
+            '    ex/index: %s (21 bytes)\n'
+            'bundles (0, 0 bytes):\n'
+            'pruned modules (2):\n'
+            '    bundle\n'
+            '    ex/unused\n'
+            'total size: 31 bytes\n'
+            'entry points:\n'
+            '    ex/index\n'
+            'export target: %s\n' % (
+                self.colors, self.index, join(self.root, 'ex.css')),
+            stream.getvalue())
+
+    def test_write_plan_json(self):
+        stream = StringIO()
+        result = plan.plan_spec(self.make_spec(), BaseScssToolchain())
+        plan.write_plan(result, stream, 'json')
+        self.assertEqual(result, json.loads(stream.getvalue()))
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import unittest
+from os.path import join
+
+from calmjs.registry import _inst as root_registry
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import exc
+from calmjs.sassy import postprocess
+from calmjs.sassy.testing.postprocess import Banner
+from calmjs.sassy.testing.postprocess import Upper
+from calmjs.sassy.toolchain import BaseScssToolchain
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.mocks import WorkingSet
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+
+
+class PostProcessorRegistryTestCase(unittest.TestCase):
+
+    def test_registry(self):
+        with pretty_logging(stream=StringIO()) as stream:
+            registry = postprocess.PostProcessorRegistry(
+                'calmjs.sassy.postprocessors', _working_set=WorkingSet({
+                    'calmjs.sassy.postprocessors': [
+                        'upper = calmjs.sassy.testing.postprocess:Upper',
+                        'upper = calmjs.sassy.testing.postprocess:Banner',
+                        'banner = calmjs.sassy.testing.postprocess:Banner',
+                    ]
+                }))
+        self.assertIn("post-processor 'upper'", stream.getvalue())
+        self.assertIs(Upper, registry.get('upper'))
+        self.assertIs(Banner, registry.get('banner'))
+        self.assertEqual(['upper', 'banner'], [
+            name for name, cls in registry.iter_records()])
+
+        stub_item_attr_value(self, root_registry, 'records', {
+            'calmjs.sassy.postprocessors': registry,
+        })
+        upper, banner, instance = postprocess.resolve_postprocessors(
+            ['upper', 'banner', Banner(text='x')],
+            {'banner': {'text': 'hello'}},
+        )
+        self.assertTrue(isinstance(upper, Upper))
+        self.assertEqual({'text': 'hello'}, banner.config)
+        self.assertEqual({'text': 'x'}, instance.config)
+
+        with self.assertRaises(exc.CalmjsSassyRuntimeError):
+            postprocess.resolve_postprocessors(['missing'])
+
+
+class ApplyPostProcessorsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        Upper.calls = 0
+
+    def test_apply_no_cache(self):
+        result = postprocess.apply_postprocessors(
+            {}, iter(['a { ', 'color: red; }']),
+            [Upper(), Banner(text='b')])
+        self.assertEqual('/* b */\nA { COLOR: RED; }', ''.join(result))
+
+    def test_apply_cached(self):
+        cache_dir = mkdtemp(self)
+        processors = [Upper(), Banner(text='b')]
+        result = postprocess.apply_postprocessors(
+            {}, iter(['a { ', 'color: red; }']), processors, cache_dir)
+        self.assertEqual('/* b */\nA { COLOR: RED; }', ''.join(result))
+        self.assertEqual(1, Upper.calls)
+        self.assertEqual(2, len(os.listdir(join(cache_dir, 'postprocess'))))
+
+        # same input; every stage is served from the cache.
+        with pretty_logging(stream=StringIO()) as stream:
+            result = postprocess.apply_postprocessors(
+                {}, iter(['a { color: red; }']), processors, cache_dir)
+            self.assertEqual('/* b */\nA { COLOR: RED; }', ''.join(result))
+        self.assertEqual(1, Upper.calls)
+        self.assertEqual(2, stream.getvalue().count('using cached output'))
+
+        # changing the configuration of the later stage only affects
+        # that stage.
+        result = postprocess.apply_postprocessors(
+            {}, iter(['a { color: red; }']), [Upper(), Banner(text='c')],
+            cache_dir)
+        self.assertEqual('/* c */\nA { COLOR: RED; }', ''.join(result))
+        self.assertEqual(1, Upper.calls)
+        self.assertEqual(3, len(os.listdir(join(cache_dir, 'postprocess'))))
+
+        # changed input.
+        result = postprocess.apply_postprocessors(
+            {}, iter(['b { color: red; }']), processors, cache_dir)
+        self.assertEqual('/* b */\nB { COLOR: RED; }', ''.join(result))
+        self.assertEqual(2, Upper.calls)
+
+    def test_toolchain_write_export(self):
+        target = join(mkdtemp(self), 'out.css')
+        spec = Spec(
+            export_target=target,
+            calmjs_sassy_postprocessors=[Upper()],
+        )
+        toolchain = BaseScssToolchain()
+        toolchain.write_export(spec, iter(['a { ', 'color: red; }']))
+        with open(target) as fd:
+            self.assertEqual('A { COLOR: RED; }', fd.read())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import codecs
+import os
+import unittest
+from os.path import join
+
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import postprocess
+from calmjs.sassy import prune
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+
+STYLESHEET = """body { margin: 0; }
+.nav, .unused { color: red; }
+#app .md\\:flex { display: flex; }
+.js-toggle { cursor: pointer; }
+@media print { .nav { display: none; } .gone { color: blue; } }
+@media print { .gone { color: blue; } }
+"""
+
+
+class PruneTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        os.mkdir(join(self.root, 'templates'))
+        with codecs.open(
+                join(self.root, 'templates', 'index.html'), 'w', 'utf8') as fd:
+            fd.write('<div id="app"><nav class="nav md:flex"></nav></div>')
+        with codecs.open(
+                join(self.root, 'templates', 'app.js'), 'w', 'utf8') as fd:
+            fd.write('el.classList.add("js-" + name);')
+        with codecs.open(
+                join(self.root, 'templates', 'image.png'), 'w', 'utf8') as fd:
+            fd.write('gone')
+
+    def test_corpus_words(self):
+        words = prune.corpus_words([join(self.root, 'templates')])
+        self.assertIn('app', words)
+        self.assertIn('md:flex', words)
+        self.assertIn('js-', words)
+        self.assertNotIn('gone', words)
+
+    def test_prune_stylesheet(self):
+        words = prune.corpus_words([join(self.root, 'templates')])
+        text, total, kept = prune.prune_stylesheet(STYLESHEET, words)
+        self.assertEqual(7, total)
+        self.assertEqual(4, kept)
+        self.assertEqual(
+            'body { margin: 0; }\n'
+            '.nav { color: red; }\n'
+            '#app .md\\:flex { display: flex; }\n'
+            '@media print {\n.nav { display: none; }\n}\n',
+            text)
+
+        text, total, kept = prune.prune_stylesheet(
+            STYLESHEET, words, allowlist=['js-.*', 'un'])
+        self.assertEqual(5, kept)
+        self.assertIn('.js-toggle', text)
+        self.assertNotIn('unused', text)
+
+    def test_prune_stylesheet_unchanged(self):
+        text = '.a{color:red}'
+        self.assertEqual(
+            (text, 1, 1), prune.prune_stylesheet(text, {'a'}))
+
+    def test_postprocessor(self):
+        spec = Spec()
+        processor = prune.PrunePostProcessor(
+            corpus=[join(self.root, 'templates')])
+        with pretty_logging(stream=StringIO()) as stream:
+            result = ''.join(processor.process(spec, [STYLESHEET]))
+        self.assertNotIn('.unused', result)
+        self.assertIn('pruned 3 of 7 rules; saved ', stream.getvalue())
+
+        token = processor.cache_token()
+        with codecs.open(
+                join(self.root, 'templates', 'more.html'), 'w', 'utf8') as fd:
+            fd.write('<p class="gone"></p>')
+        self.assertNotEqual(token, prune.PrunePostProcessor(
+            corpus=[join(self.root, 'templates')]).cache_token())
+
+    def test_postprocessor_no_corpus(self):
+        with pretty_logging(stream=StringIO()) as stream:
+            result = ''.join(prune.PrunePostProcessor().process(
+                Spec(), [STYLESHEET]))
+        self.assertEqual(STYLESHEET, result)
+        self.assertIn('no corpus specified', stream.getvalue())
+
+    def test_registered(self):
+        processor, = postprocess.resolve_postprocessors(
+            ['prune'], {'prune': {'corpus': ['x']}})
+        self.assertTrue(isinstance(processor, prune.PrunePostProcessor))
+        self.assertEqual(['x'], processor.config['corpus'])
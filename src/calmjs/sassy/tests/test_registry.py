@@ -29,3 +29,35 @@ class SCSSRegistryTestCase(unittest.TestCase):
         records = self.registry.get_record('calmjs.sassy.testing')
         key = 'calmjs/sassy/testing/index'
         self.assertEqual(sorted(records.keys()), [key])
+
+    def test_module_registry_scanned(self):
+        with pretty_logging(stream=mocks.StringIO()):
+            self.registry.register_entry_points([EntryPoint.parse(
+                'calmjs.sassy.testing = calmjs.sassy.testing')])
+        (root, listing), = self.registry.scanned['calmjs.sassy.testing']
+        self.assertEqual(['index.scss'], listing['.scss'])
+        self.assertEqual([], listing['.css'])
+
+    def test_module_registry_path_index(self):
+        with pretty_logging(stream=mocks.StringIO()):
+            self.registry.register_entry_points([EntryPoint.parse(
+                'calmjs.sassy.testing = calmjs.sassy.testing')])
+        records = self.registry.get_record('calmjs.sassy.testing')
+        path = records['calmjs/sassy/testing/index']
+        self.assertEqual([
+            (None, 'calmjs/sassy/testing/index'),
+        ], self.registry.get_modnames_for_path(path))
+        self.assertEqual([], self.registry.get_modnames_for_path(
+            path + '.missing'))
+
+        # registering again replaces the existing entries.
+        with pretty_logging(stream=mocks.StringIO()):
+            self.registry.register_entry_points([EntryPoint.parse(
+                'calmjs.sassy.testing = calmjs.sassy.testing')])
+        self.assertEqual(1, len(self.registry.get_modnames_for_path(path)))
+
+        # entries from the updated records are dropped.
+        self.registry.records['calmjs.sassy.testing'] = {}
+        self.registry.index_records('calmjs.sassy.testing')
+        self.assertEqual([], self.registry.get_modnames_for_path(path))
+        self.assertEqual({}, self.registry.path_index)
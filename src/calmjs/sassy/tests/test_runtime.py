@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
+import sys
 import unittest
 
 from calmjs.toolchain import Spec
 from calmjs.toolchain import NullToolchain
+from calmjs.sassy.fingerprint import environment_fingerprint
+from calmjs.sassy.runtime import FingerprintRuntime
 from calmjs.sassy.runtime import ScssRuntime
 
 from calmjs.testing.utils import stub_stdouts
@@ -19,3 +22,10 @@ class RuntimeTestCase(unittest.TestCase):
         spec = runtime(['calmjs.scss', '--source-registries=demo'])
         self.assertTrue(isinstance(spec, Spec))
         self.assertEqual(['demo'], spec['calmjs_module_registry_names'])
+
+    def test_fingerprint_runtime(self):
+        runtime = FingerprintRuntime()
+        stub_stdouts(self)
+        result = runtime([])
+        self.assertEqual(environment_fingerprint(), result)
+        self.assertEqual(result + '\n', sys.stdout.getvalue())
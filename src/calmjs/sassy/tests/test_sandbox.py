@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from calmjs.toolchain import EXPORT_MODULE_NAMES
+
+from calmjs.sassy import libsass
+from calmjs.sassy import sandbox
+from calmjs.sassy.exc import CalmjsSassyRuntimeError
+from calmjs.sassy.toolchain import CALMJS_SASSY_SOURCEPATH_MERGED
+
+
+@unittest.skipIf(
+    not libsass.HAS_LIBSASS, "'libsass' package is not installed")
+class CompileWorkerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = sandbox.CompileWorker()
+        self.addCleanup(self.worker.stop)
+
+    def test_compile_reused(self):
+        self.assertEqual('a {\n  b: c; }\n', self.worker.compile({
+            'string': 'a { b: c; }'}))
+        pid = self.worker.process.pid
+        self.assertEqual('a{b:2}\n', self.worker.compile({
+            'string': 'a { b: 1 + 1; }', 'output_style': 'compressed'}))
+        self.assertEqual(pid, self.worker.process.pid)
+
+    def test_compile_error(self):
+        with self.assertRaises(ValueError) as e:
+            self.worker.compile({'string': 'a { b: $undefined; }'})
+        self.assertIn('Undefined variable', str(e.exception))
+        # the worker remains usable.
+        self.assertTrue(self.worker.is_alive())
+
+    def test_compile_timeout(self):
+        with self.assertRaises(CalmjsSassyRuntimeError) as e:
+            self.worker.compile({
+                'string': '$i: 0; @while $i < 1000000000 { $i: $i + 1; }',
+            }, timeout=0.2)
+        self.assertIn('exceeded the time limit of 0.2 seconds', str(
+            e.exception))
+        self.assertFalse(self.worker.is_alive())
+        # a new worker is started for the next compilation.
+        self.assertEqual('a {\n  b: c; }\n', self.worker.compile({
+            'string': 'a { b: c; }'}))
+
+    @unittest.skipIf(sandbox.resource is None, 'resource is not available')
+    def test_compile_memory(self):
+        worker = sandbox.CompileWorker(memory=1)
+        self.addCleanup(worker.stop)
+        with self.assertRaises(CalmjsSassyRuntimeError) as e:
+            worker.compile({'string': (
+                '$s: "x"; @for $i from 1 through 24 { $s: $s + $s; } '
+                'a { b: $s; }'
+            )}, timeout=30)
+        self.assertIn('memory limit of 1 MB', str(e.exception))
+        self.assertFalse(worker.is_alive())
+
+    def test_stub_importer(self):
+        stub = {
+            EXPORT_MODULE_NAMES: [],
+            CALMJS_SASSY_SOURCEPATH_MERGED: {'external/module': ''},
+        }
+        self.assertEqual('a {\n  b: c; }\n', self.worker.compile({
+            'string': '@import "external/module"; a { b: c; }'}, stub=stub))
+
+
+@unittest.skipIf(
+    not libsass.HAS_LIBSASS, "'libsass' package is not installed")
+class SandboxCompileTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        sandbox.workers.stop()
+
+    def test_sandbox_compile_reuses_worker(self):
+        spec = {sandbox.CALMJS_SASSY_SANDBOX_TIMEOUT: 30}
+        self.assertEqual('a {\n  b: c; }\n', sandbox.sandbox_compile(
+            spec, {'string': 'a { b: c; }'}))
+        worker, = sandbox.workers.idle
+        self.assertEqual('a {\n  b: d; }\n', sandbox.sandbox_compile(
+            spec, {'string': 'a { b: d; }'}))
+        self.assertEqual([worker], sandbox.workers.idle)
+
+    def test_sandbox_compile_stub_importer(self):
+        spec = {
+            EXPORT_MODULE_NAMES: ['example/index'],
+            CALMJS_SASSY_SOURCEPATH_MERGED: {'external/module': ''},
+        }
+        importers = [(0, libsass.libsass_import_stub_generator(spec))]
+        self.assertEqual('a {\n  b: c; }\n', sandbox.sandbox_compile(
+            spec, {'string': '@import "external/module"; a { b: c; }'},
+            importers))
+
+    def test_sandbox_compile_unpicklable_importer(self):
+        importers = [(0, lambda target: None)]
+        with self.assertRaises(CalmjsSassyRuntimeError) as e:
+            sandbox.sandbox_compile(
+                {}, {'string': 'a { b: c; }'}, importers)
+        self.assertIn('unable to send', str(e.exception))
+        self.assertEqual([], sandbox.workers.idle)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import unittest
+from os.path import join
+
+from pkg_resources import EntryPoint
+
+from calmjs.indexer import mapper
+
+from calmjs.sassy import scanner
+import calmjs.sassy.testing
+
+from calmjs.testing.utils import mkdtemp
+
+
+def touch(*paths):
+    for path in paths:
+        with open(path, 'w'):
+            pass
+
+
+class ScanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        for dirname in (
+                'sub', '__pycache__', 'tests', 'pkg.egg-info', '.hidden'):
+            os.mkdir(join(self.root, dirname))
+            touch(join(self.root, dirname, 'style.scss'))
+        touch(
+            join(self.root, 'b.scss'), join(self.root, '_a.scss'),
+            join(self.root, 'c.sass'), join(self.root, 'd.css'),
+            join(self.root, '.e.scss'), join(self.root, 'f.py'),
+        )
+
+    def test_scan_root(self):
+        self.assertEqual({
+            '.scss': ['_a.scss', 'b.scss'],
+            '.sass': ['c.sass'],
+            '.css': ['d.css'],
+        }, scanner.scan_root(self.root))
+
+    def test_scan_root_recursive(self):
+        self.assertEqual({
+            '.scss': ['_a.scss', 'b.scss', 'sub/style.scss'],
+        }, scanner.scan_root(
+            self.root, extensions=('.scss',), recursive=True))
+
+    def test_scan_root_missing(self):
+        self.assertEqual({'.scss': []}, scanner.scan_root(
+            join(self.root, 'missing'), extensions=('.scss',)))
+
+    def test_scan_roots_ordered(self):
+        roots = [join(self.root, 'sub'), self.root, join(self.root, 'tests')]
+        results = scanner.scan_roots(roots, threads=3)
+        self.assertEqual(
+            [scanner.scan_root(root) for root in roots], results)
+        self.assertEqual(results, scanner.scan_roots(roots, threads=1))
+
+
+class ScanMapperTestCase(unittest.TestCase):
+
+    def test_same_as_indexer_mapper(self):
+        entry_point = EntryPoint.parse(
+            'calmjs.sassy.testing = calmjs.sassy.testing')
+        self.assertEqual(
+            mapper(calmjs.sassy.testing, entry_point, fext='.scss'),
+            scanner.scan_mapper(calmjs.sassy.testing, entry_point),
+        )
+
+    def test_scanned_reused(self):
+        entry_point = EntryPoint.parse('calmjs.sassy = calmjs.sassy')
+        scanned = {'calmjs.sassy': [('/root', {'.scss': ['a/_b.scss']})]}
+        self.assertEqual({
+            'calmjs/sassy/a/_b': join('/root', 'a', '_b.scss'),
+        }, scanner.scan_mapper(
+            calmjs.sassy, entry_point, scanned=scanned))
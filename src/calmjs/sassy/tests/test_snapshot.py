@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+import json
+import os
+from os.path import exists
+from os.path import join
+
+from calmjs.utils import pretty_logging
+
+from calmjs.sassy import snapshot
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+
+
+def make_values(**kw):
+    values = {
+        'calmjs_module_registry_names': ['calmjs.scss'],
+        'calmjs_sassy_entry_points': ['example/package/index'],
+        'calmjs_sassy_sourcepath_merged': {},
+        'transpile_sourcepath': {
+            'example/package/index': '/src/example/package/index.scss',
+        },
+        'bundle_sourcepath': {},
+    }
+    values.update(kw)
+    return values
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def test_spec_snapshot_key(self):
+        self.assertEqual(
+            snapshot.spec_snapshot_key(a=1, b=['x']),
+            snapshot.spec_snapshot_key(b=['x'], a=1),
+        )
+        self.assertNotEqual(
+            snapshot.spec_snapshot_key(a=1),
+            snapshot.spec_snapshot_key(a=2),
+        )
+
+    def test_load_missing(self):
+        path = join(mkdtemp(self), 'snapshot.json')
+        self.assertIsNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
+
+    def test_dump_load(self):
+        path = join(mkdtemp(self), 'snapshot.json')
+        values = make_values(extra='not stored')
+        snapshot.dump_spec_snapshot(values, path, 'key', 'fp')
+        self.assertTrue(exists(path))
+        result = snapshot.load_spec_snapshot(path, 'key', 'fp')
+        values.pop('extra')
+        self.assertEqual(values, result)
+        self.assertIsNone(snapshot.load_spec_snapshot(path, 'other', 'fp'))
+
+    def test_dump_retains_entries_same_fingerprint(self):
+        path = join(mkdtemp(self), 'snapshot.json')
+        snapshot.dump_spec_snapshot(make_values(), path, 'key1', 'fp')
+        snapshot.dump_spec_snapshot(make_values(), path, 'key2', 'fp')
+        self.assertIsNotNone(snapshot.load_spec_snapshot(path, 'key1', 'fp'))
+        self.assertIsNotNone(snapshot.load_spec_snapshot(path, 'key2', 'fp'))
+
+    def test_fingerprint_change(self):
+        path = join(mkdtemp(self), 'snapshot.json')
+        snapshot.dump_spec_snapshot(make_values(), path, 'key1', 'fp1')
+        self.assertIsNone(snapshot.load_spec_snapshot(path, 'key1', 'fp2'))
+        snapshot.dump_spec_snapshot(make_values(), path, 'key2', 'fp2')
+        # the stale entry is discarded.
+        with open(path) as fd:
+            self.assertEqual(['key2'], list(json.load(fd)['entries']))
+
+    def test_load_corrupted(self):
+        path = join(mkdtemp(self), 'snapshot.json')
+        with open(path, 'w') as fd:
+            fd.write('{')
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertIsNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
+        self.assertIn('is corrupted', stream.getvalue())
+        # can be overwritten.
+        snapshot.dump_spec_snapshot(make_values(), path, 'key', 'fp')
+        self.assertIsNotNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
+
+    def test_source_dirs_changed(self):
+        root = mkdtemp(self)
+        path = join(root, 'snapshot.json')
+        module_dir = join(root, 'package')
+        bundle_dir = join(root, 'node_modules', 'lib', 'scss')
+        os.mkdir(module_dir)
+        os.makedirs(bundle_dir)
+        index = join(module_dir, 'index.scss')
+        with open(index, 'w') as fd:
+            fd.write('')
+        values = make_values(
+            transpile_sourcepath={'example/package/index': index},
+            bundle_sourcepath={'lib': bundle_dir},
+        )
+        self.assertEqual(
+            [bundle_dir, module_dir], snapshot.snapshot_source_dirs(values))
+
+        snapshot.dump_spec_snapshot(values, path, 'key', 'fp')
+        self.assertEqual(
+            values, snapshot.load_spec_snapshot(path, 'key', 'fp'))
+
+        # a new module in a develop installation.
+        with open(join(module_dir, 'extra.scss'), 'w') as fd:
+            fd.write('')
+        with pretty_logging(stream=StringIO()) as stream:
+            self.assertIsNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
+        self.assertIn('source directories changed', stream.getvalue())
+
+        # removal of the bundled sources.
+        snapshot.dump_spec_snapshot(values, path, 'key', 'fp')
+        self.assertIsNotNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
+        os.rmdir(bundle_dir)
+        self.assertIsNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
+
+    def test_source_dirs_registered_modules(self):
+        root = mkdtemp(self)
+        stub_item_attr_value(
+            self, snapshot, 'registered_module_roots', lambda names: [root])
+        self.assertEqual(
+            sorted([root, '/src/example/package']),
+            snapshot.snapshot_source_dirs(make_values()))
+        path = join(mkdtemp(self), 'snapshot.json')
+        snapshot.dump_spec_snapshot(make_values(), path, 'key', 'fp')
+        self.assertIsNotNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
+        # the registered module directory without any modules yet.
+        with open(join(root, 'index.scss'), 'w') as fd:
+            fd.write('')
+        self.assertIsNone(snapshot.load_spec_snapshot(path, 'key', 'fp'))
@@ -9,7 +9,9 @@ from calmjs.toolchain import Spec
 from calmjs.sassy import toolchain
 from calmjs.sassy import exc
 
+from calmjs.testing.mocks import StringIO
 from calmjs.testing.utils import mkdtemp
+from calmjs.utils import pretty_logging
 
 
 class BaseToolchainTestCase(unittest.TestCase):
@@ -103,3 +105,164 @@ class BaseToolchainTestCase(unittest.TestCase):
         with open(assemble_path) as fd:
             # shouldn't be overwritten.
             self.assertEqual('body { color: #000; }', fd.read())
+
+    def test_assemble_unsupported_method(self):
+        libsass = toolchain.BaseScssToolchain()
+        spec = Spec(
+            transpile_sourcepath={},
+            bundle_sourcepath={},
+            build_dir=mkdtemp(self),
+            calmjs_sassy_entry_points=['index'],
+            calmjs_sassy_assemble_method='unknown',
+        )
+        libsass.prepare(spec)
+        libsass.compile(spec)
+        with self.assertRaises(exc.CalmjsSassyRuntimeError) as e:
+            libsass.assemble(spec)
+        self.assertIn("unsupported assemble method 'unknown'", str(
+            e.exception))
+
+    def test_assemble_dedupe(self):
+        working_dir = mkdtemp(self)
+        sources = {
+            'pkg/colors': '$c: #000;\n',
+            'pkg/common': '@import "pkg/colors";\n.common { color: $c; }\n',
+            'pkg/a': (
+                '@import "pkg/colors";\n'
+                '@import "pkg/common", "external";\n'
+                '.a { color: $c; }\n'
+            ),
+            'pkg/b': '@import "pkg/common";\n.b { color: $c; }\n',
+        }
+        transpile_sourcepath = {}
+        for modname, source in sources.items():
+            path = join(working_dir, modname.replace('/', '_') + '.scss')
+            with open(path, 'w') as fd:
+                fd.write(source)
+            transpile_sourcepath[modname] = path
+
+        libsass = toolchain.BaseScssToolchain()
+        spec = Spec(
+            transpile_sourcepath=transpile_sourcepath,
+            bundle_sourcepath={},
+            build_dir=mkdtemp(self),
+            calmjs_sassy_entry_points=['pkg/a', 'external/index', 'pkg/b'],
+            calmjs_sassy_assemble_method='dedupe',
+        )
+        libsass.prepare(spec)
+        libsass.compile(spec)
+        with pretty_logging(stream=StringIO()) as stream:
+            libsass.assemble(spec)
+
+        self.assertIn(
+            "module 'pkg/common' produces output and was imported 2 times",
+            stream.getvalue())
+        self.assertNotIn("'pkg/colors' produces output", stream.getvalue())
+
+        with open(spec['calmjs_sassy_entry_point_sourcefile']) as fd:
+            self.assertEqual(
+                '@import "pkg/colors";\n'
+                '@import "pkg/common";\n'
+                '@import "pkg/a";\n'
+                '@import "external/index";\n'
+                '@import "pkg/b";\n',
+                fd.read()
+            )
+
+        with open(join(spec['build_dir'], 'pkg', 'a.scss')) as fd:
+            self.assertEqual(
+                '\n@import "external";\n.a { color: $c; }\n', fd.read())
+
+    def test_assemble_dedupe_late_import(self):
+        working_dir = mkdtemp(self)
+        sources = {
+            'pkg/theme': '.theme { color: $c; }\n',
+            'pkg/a': '$c: blue;\n@import "pkg/theme";\n',
+            'pkg/b': '@import "pkg/theme";\n',
+        }
+        transpile_sourcepath = {}
+        for modname, source in sources.items():
+            path = join(working_dir, modname.replace('/', '_') + '.scss')
+            with open(path, 'w') as fd:
+                fd.write(source)
+            transpile_sourcepath[modname] = path
+
+        libsass = toolchain.BaseScssToolchain()
+        spec = Spec(
+            transpile_sourcepath=transpile_sourcepath,
+            bundle_sourcepath={},
+            build_dir=mkdtemp(self),
+            calmjs_sassy_entry_points=['pkg/a', 'pkg/b'],
+            calmjs_sassy_assemble_method='dedupe',
+        )
+        libsass.prepare(spec)
+        libsass.compile(spec)
+        with pretty_logging(stream=StringIO()) as stream:
+            libsass.assemble(spec)
+
+        self.assertIn(
+            "module 'pkg/a' has an import at line 2 that follows other "
+            "statements", stream.getvalue())
+        with open(spec['calmjs_sassy_entry_point_sourcefile']) as fd:
+            self.assertEqual(
+                '@import "pkg/a";\n@import "pkg/b";\n', fd.read())
+        # the copies within the build directory are left as they are.
+        with open(join(spec['build_dir'], 'pkg', 'a.scss')) as fd:
+            self.assertEqual(sources['pkg/a'], fd.read())
+
+    def test_finalize_critical(self):
+        working_dir = mkdtemp(self)
+        export_target = join(working_dir, 'export.css')
+        with open(export_target, 'w') as fd:
+            fd.write('.a { color: red; }\n.b { color: blue; }\n')
+
+        libsass = toolchain.BaseScssToolchain()
+        spec = Spec(export_target=export_target)
+        libsass.finalize(spec)
+        self.assertFalse(os.path.exists(join(working_dir, 'critical.css')))
+
+        spec = Spec(
+            export_target=export_target,
+            calmjs_sassy_critical_selectors=['.b'],
+        )
+        with pretty_logging(stream=StringIO()) as stream:
+            libsass.finalize(spec)
+        self.assertIn('with 1 of 2 rules', stream.getvalue())
+        critical = join(working_dir, 'critical.css')
+        self.assertEqual(critical, spec['calmjs_sassy_critical_target'])
+        with open(critical) as fd:
+            self.assertEqual('.b { color: blue; }\n', fd.read())
+
+    def test_compile_prune_modules(self):
+        working_dir = mkdtemp(self)
+        sources = {
+            'pkg/index': '@import "pkg/used";\n',
+            'pkg/used': '.a { color: red; }\n',
+            'pkg/unused': '.b { color: blue; }\n',
+        }
+        transpile_sourcepath = {}
+        for modname, source in sources.items():
+            path = join(working_dir, modname.replace('/', '_') + '.scss')
+            with open(path, 'w') as fd:
+                fd.write(source)
+            transpile_sourcepath[modname] = path
+
+        libsass = toolchain.BaseScssToolchain()
+        spec = Spec(
+            transpile_sourcepath=transpile_sourcepath,
+            bundle_sourcepath={'other': working_dir},
+            build_dir=mkdtemp(self),
+            calmjs_sassy_entry_points=['pkg/index'],
+            calmjs_sassy_prune_modules=True,
+        )
+        with pretty_logging(stream=StringIO()) as stream:
+            libsass.compile(spec)
+        self.assertIn('pruned 2 of 4 modules', stream.getvalue())
+        self.assertEqual(
+            ['other', 'pkg/unused'], spec['calmjs_sassy_pruned_modules'])
+        self.assertEqual(
+            sorted(['pkg/index', 'pkg/used']),
+            sorted(spec['transpiled_targetpaths']))
+        self.assertFalse(os.path.exists(
+            join(spec['build_dir'], 'pkg', 'unused.scss')))
+        self.assertFalse(os.path.exists(join(spec['build_dir'], 'other')))
@@ -5,17 +5,38 @@ Toolchain for building Sassy CSS into CSS.
 
 from __future__ import unicode_literals
 
+import codecs
 import logging
 import os
 from os.path import exists
+from os.path import isdir
 from os.path import join
 from os.path import dirname
+from os.path import relpath
 
 from calmjs.toolchain import Toolchain
 from calmjs.toolchain import null_transpiler
 from calmjs.toolchain import BUILD_DIR
+from calmjs.toolchain import EXPORT_TARGET
 
+from calmjs.sassy.css import critical_features
+from calmjs.sassy.css import extract_rules
+from calmjs.sassy.css import read_text
 from calmjs.sassy.exc import CalmjsSassyRuntimeError
+from calmjs.sassy.graph import ImportGraph
+from calmjs.sassy.graph import SourcepathLayout
+from calmjs.sassy.graph import find_late_import
+from calmjs.sassy.graph import reachable_sourcepaths
+from calmjs.sassy.graph import read_source
+from calmjs.sassy.graph import resolve_import_path
+from calmjs.sassy.graph import scss_source_emits_output
+from calmjs.sassy.graph import strip_resolved_imports
+from calmjs.sassy.output import DigestSink
+from calmjs.sassy.output import FileSink
+from calmjs.sassy.output import GzipSink
+from calmjs.sassy.output import stream_chunks
+from calmjs.sassy.postprocess import apply_postprocessors
+from calmjs.sassy.postprocess import resolve_postprocessors
 
 logger = logging.getLogger(__name__)
 
@@ -31,15 +52,54 @@ CALMJS_SASSY_ENTRY_POINT_NAME = 'calmjs_sassy_entry_point_name'
 # key for storing mapping of all the provided sourcepaths, for use with
 # providing a control way of stubbing out imports.
 CALMJS_SASSY_SOURCEPATH_MERGED = 'calmjs_sassy_sourcepath_merged'
+# the method used for assembling the entry point sourcefile; refer to
+# CALMJS_SASSY_ASSEMBLE_METHODS for the valid values.
+CALMJS_SASSY_ASSEMBLE_METHOD = 'calmjs_sassy_assemble_method'
+# the directory to write the diagnostics bundle to should the compiler
+# fail.
+CALMJS_SASSY_DIAGNOSTICS_DIR = 'calmjs_sassy_diagnostics_dir'
+# whether a gzip compressed copy of the export target will be written.
+CALMJS_SASSY_EXPORT_GZIP = 'calmjs_sassy_export_gzip'
+# the sha1 hexdigest of the export target that was written.
+CALMJS_SASSY_EXPORT_DIGEST = 'calmjs_sassy_export_digest'
+# the ordered list of the post-processors to apply onto the output,
+# either by their registered names or as instances.
+CALMJS_SASSY_POSTPROCESSORS = 'calmjs_sassy_postprocessors'
+# mapping of the names of the post-processors to their configuration.
+CALMJS_SASSY_POSTPROCESSOR_CONFIGS = 'calmjs_sassy_postprocessor_configs'
+# the directory for the caching of intermediate results across builds.
+CALMJS_SASSY_CACHE_DIR = 'calmjs_sassy_cache_dir'
+# whether only the modules reachable through the imports from the entry
+# points will be compiled into the build directory.
+CALMJS_SASSY_PRUNE_MODULES = 'calmjs_sassy_prune_modules'
+# the list of the names of the modules that were pruned.
+CALMJS_SASSY_PRUNED_MODULES = 'calmjs_sassy_pruned_modules'
+# the list of selectors for the elements that are critical for the
+# initial rendering, for the extraction of the critical rules.
+CALMJS_SASSY_CRITICAL_SELECTORS = 'calmjs_sassy_critical_selectors'
+# the list of paths to the sample html documents (or directories of
+# them) for the extraction of the critical rules.
+CALMJS_SASSY_CRITICAL_HTML_PATHS = 'calmjs_sassy_critical_html_paths'
+# the path to write the critical rules to; defaults to the file named
+# by CALMJS_SASSY_CRITICAL_FILENAME next to the export target.
+CALMJS_SASSY_CRITICAL_TARGET = 'calmjs_sassy_critical_target'
 
 # definitions
 CALMJS_SASSY_ENTRY = 'calmjs.sassy'
 CALMJS_SASSY_ASSEMBLE_SUBDIR = '__calmjs_sassy__'
+CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT = 'import'
+CALMJS_SASSY_ASSEMBLE_METHODS = ('import', 'dedupe')
+CALMJS_SASSY_CRITICAL_FILENAME = 'critical.css'
 
 
 class BaseScssToolchain(Toolchain):
     """
     The base SCSS Toolchain.
+
+    The toolchain is reentrant: its attributes are only assigned by the
+    setup methods during construction, with all the state for a given
+    run stored on the spec, such that an instance may be used by
+    multiple threads concurrently.  Subclasses must retain this.
     """
 
     def setup_transpiler(self):
@@ -61,6 +121,66 @@ class BaseScssToolchain(Toolchain):
         return self.simple_transpile_modname_source_target(
             spec, modname, source, target)
 
+    def compile(self, spec):
+        """
+        Prune the sourcepaths that cannot be reached from the entry
+        points before the compile step, if specified by the spec.
+        """
+
+        if spec.get(CALMJS_SASSY_PRUNE_MODULES):
+            self.prune_sourcepaths(spec)
+        return super(BaseScssToolchain, self).compile(spec)
+
+    def prune_sourcepaths(self, spec):
+        """
+        Remove the entries from the transpile and bundle sourcepaths
+        that are not reachable through the import statements from the
+        entry points, such that they will not be copied into the build
+        directory.  Imports of the pruned modules will not happen, so
+        the stubbing against CALMJS_SASSY_SOURCEPATH_MERGED is not
+        affected.
+        """
+
+        keys = [
+            key + self.sourcepath_suffix for key in ('transpile', 'bundle')]
+        targets = {}
+        retained = set()
+        for key in keys:
+            for modname, source in (spec.get(key) or {}).items():
+                try:
+                    # bundled directories are copied under their modname.
+                    target = modname if isdir(source) else (
+                        self.modname_source_to_target(spec, modname, source))
+                except ValueError:
+                    # leave the entries that cannot be handled here as is.
+                    retained.add(modname)
+                    continue
+                targets[modname] = (target, source)
+
+        reachable = reachable_sourcepaths(
+            spec.get(CALMJS_SASSY_ENTRY_POINTS) or (),
+            SourcepathLayout(targets),
+        )
+        if reachable is None:
+            logger.warning(
+                'unable to determine the reachable modules; no modules will '
+                'be pruned')
+            return
+        reachable.update(retained)
+
+        pruned = []
+        for key in keys:
+            sourcepaths = spec.get(key) or {}
+            pruned.extend(m for m in sourcepaths if m not in reachable)
+            spec[key] = {
+                modname: source for modname, source in sourcepaths.items()
+                if modname in reachable
+            }
+        spec[CALMJS_SASSY_PRUNED_MODULES] = sorted(pruned)
+        logger.info(
+            'pruned %d of %d modules not reachable from the entry points',
+            len(pruned), len(targets) + len(retained))
+
     def assemble(self, spec):
         """
         Since only thing need to be done was to bring the SCSS file into
@@ -82,12 +202,172 @@ class BaseScssToolchain(Toolchain):
                 "exists" % spec[CALMJS_SASSY_ENTRY_POINT_SOURCEFILE]
             )
 
+        method = spec.get(
+            CALMJS_SASSY_ASSEMBLE_METHOD, CALMJS_SASSY_ASSEMBLE_METHOD_DEFAULT)
+        if method not in CALMJS_SASSY_ASSEMBLE_METHODS:
+            raise CalmjsSassyRuntimeError(
+                "unsupported assemble method '%s'; must be one of %r" % (
+                    method, CALMJS_SASSY_ASSEMBLE_METHODS))
+        imports = getattr(self, 'assemble_%s_entry_points' % method)(spec)
+
         os.makedirs(dirname(spec[CALMJS_SASSY_ENTRY_POINT_SOURCEFILE]))
         # writing out this as a file to permit reuse by other tools that
         # work directly with files.
         with open(spec[CALMJS_SASSY_ENTRY_POINT_SOURCEFILE], 'w') as fd:
-            for modname in spec[CALMJS_SASSY_ENTRY_POINTS]:
+            for modname in imports:
                 fd.write('@import "%s";\n' % modname)
         logger.debug(
             "wrote entry point module that will import from the following: %s",
-            spec[CALMJS_SASSY_ENTRY_POINTS])
+            imports)
+
+    def assemble_import_entry_points(self, spec):
+        """
+        The default assemble method, where the entry points are simply
+        imported in the order specified.
+        """
+
+        return spec[CALMJS_SASSY_ENTRY_POINTS]
+
+    def assemble_dedupe_entry_points(self, spec):
+        """
+        Analyse the import closure of every entry point within the build
+        directory, such that every module reachable through the top
+        level imports will be imported exactly once by the entry point
+        sourcefile, in topological order.  The top level import
+        statements for those modules will be removed from the copies
+        within the build directory.
+
+        As this effectively hoists the imports within every module to
+        before the rules defined by that module, the entry points will
+        be imported as per the import method instead if any module has
+        an import that follows any other statement within it, as the
+        result may be changed otherwise.
+        """
+
+        build_dir = spec[BUILD_DIR]
+        include_paths = [build_dir]
+        entry_points = [
+            (modname, resolve_import_path(modname, None, include_paths))
+            for modname in spec[CALMJS_SASSY_ENTRY_POINTS]
+        ]
+        graph = ImportGraph(
+            [path for modname, path in entry_points if path], include_paths)
+
+        for path in graph.order:
+            lineno = find_late_import(read_source(path), path, include_paths)
+            if lineno is not None:
+                logger.warning(
+                    "module '%s' has an import at line %d that follows other "
+                    "statements and cannot be hoisted; entry points will be "
+                    "imported without deduplication",
+                    self._build_dir_modname(build_dir, path), lineno,
+                )
+                return self.assemble_import_entry_points(spec)
+
+        for path in graph.iter_shared():
+            if scss_source_emits_output(read_source(path)):
+                logger.warning(
+                    "module '%s' produces output and was imported %d times; "
+                    "it will only be imported once",
+                    self._build_dir_modname(build_dir, path),
+                    len(graph.importers[path]),
+                )
+
+        for path in graph.order:
+            source = read_source(path)
+            result = strip_resolved_imports(source, path, include_paths)
+            if result != source:
+                with codecs.open(path, 'w', encoding='utf8') as fd:
+                    fd.write(result)
+
+        imports = []
+        emitted = 0
+        for modname, path in entry_points:
+            if path is None:
+                # leave that for the compiler to resolve.
+                imports.append(modname)
+                continue
+            idx = graph.order.index(path) + 1
+            imports.extend(
+                self._build_dir_modname(build_dir, p)
+                for p in graph.order[emitted:idx]
+            )
+            emitted = max(emitted, idx)
+        return imports
+
+    def export_sinks(self, spec):
+        """
+        Return the list of sinks that the chunks of the compiled output
+        will be written to.
+        """
+
+        sinks = [FileSink(spec[EXPORT_TARGET])]
+        if spec.get(CALMJS_SASSY_EXPORT_GZIP):
+            sinks.append(GzipSink(spec[EXPORT_TARGET] + '.gz'))
+        return sinks
+
+    def postprocess(self, spec, chunks):
+        """
+        Apply the post-processors specified in the spec onto the chunks
+        of the compiled output.
+        """
+
+        if not spec.get(CALMJS_SASSY_POSTPROCESSORS):
+            return chunks
+        postprocessors = resolve_postprocessors(
+            spec[CALMJS_SASSY_POSTPROCESSORS],
+            spec.get(CALMJS_SASSY_POSTPROCESSOR_CONFIGS),
+        )
+        return apply_postprocessors(
+            spec, chunks, postprocessors,
+            cache_dir=spec.get(CALMJS_SASSY_CACHE_DIR),
+        )
+
+    def write_export(self, spec, chunks):
+        """
+        Stream the chunks of the compiled output into the export sinks,
+        with the digest of the output recorded into the spec.
+        """
+
+        digest = DigestSink()
+        chunks = self.postprocess(spec, chunks)
+        stream_chunks(chunks, [digest] + self.export_sinks(spec))
+        spec[CALMJS_SASSY_EXPORT_DIGEST] = digest.hexdigest
+        logger.info("wrote export css file at '%s'", spec[EXPORT_TARGET])
+
+    def finalize(self, spec):
+        """
+        Extract the critical rules from the export target, if the spec
+        specified the critical selectors or html documents.
+        """
+
+        if (spec.get(CALMJS_SASSY_CRITICAL_SELECTORS) or
+                spec.get(CALMJS_SASSY_CRITICAL_HTML_PATHS)):
+            self.write_critical(spec)
+
+    def write_critical(self, spec):
+        """
+        Write the rules from the export target that may match the
+        elements provided by the critical selectors and html documents
+        to the critical target.
+        """
+
+        target = spec.get(CALMJS_SASSY_CRITICAL_TARGET) or join(
+            dirname(spec[EXPORT_TARGET]), CALMJS_SASSY_CRITICAL_FILENAME)
+        present = critical_features(
+            spec.get(CALMJS_SASSY_CRITICAL_SELECTORS) or (),
+            spec.get(CALMJS_SASSY_CRITICAL_HTML_PATHS) or (),
+        )
+        text, total, kept = extract_rules(
+            read_text(spec[EXPORT_TARGET]), present)
+        stream_chunks([text], [FileSink(target)])
+        spec[CALMJS_SASSY_CRITICAL_TARGET] = target
+        logger.info(
+            "wrote critical css file at '%s' with %d of %d rules",
+            target, kept, total)
+
+    def _build_dir_modname(self, build_dir, path):
+        modname = relpath(path, build_dir).replace(os.sep, '/')
+        if modname.endswith(self.filename_suffix):
+            modname = modname[:-len(self.filename_suffix)]
+        return modname